@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+#writes files so that readers only ever see the previous file or the complete new one. Every cache, store and checkpoint of the project is saved this way
+
+
+'''
+Writes a file by writing to a temporary file in the same directory, which then replaces the file in one step. An interrupted write never leaves a partial file behind,
+and every write uses its own temporary file, so processes or threads writing the same path at the same time never write into each other's file; the last one to finish
+replaces the file
+
+Parameters:
+filepath (string) --> the path of the file to write. Its directory must already exist
+write (function) --> function taking the temporary file, opened for writing bytes, and writing the contents of the file to it, for example 'lambda file: pickle.dump(value, file)'
+'''
+
+def atomic_write(filepath, write):
+    directory, filename = os.path.split(filepath)
+    descriptor, temporary_filepath = tempfile.mkstemp(prefix = filename + '.', suffix = '.tmp', dir = directory or '.')
+
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            write(file)
+
+        os.replace(temporary_filepath, filepath)
+    except BaseException:
+        #the temporary file is removed when the write fails, and the previous file is left as it was
+        if os.path.exists(temporary_filepath):
+            os.remove(temporary_filepath)
+        raise
@@ -0,0 +1,97 @@
+import os
+import pickle
+import hashlib
+import pandas as pd
+from Atomic_Files import atomic_write
+
+'''
+Class used to store the results of individual backtesting periods on disk, so that rebuilding a model only needs to compute the periods whose inputs changed
+
+Parameters:
+directory (string) --> where the results of the backtesting periods are saved. Default set to 'Backtest_Cache'. The same directory can be shared by all tickers,
+as every result is saved under the fingerprint of its inputs
+'''
+
+class FoldCache():
+
+    '''
+    Instance variables:
+    directory (string) --> holds the path where the results are saved
+    '''
+
+    def __init__(self, directory = 'Backtest_Cache'):
+        self.directory = directory
+
+        #ensures that the path specified by the directory exists; if not, the directory is made
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+    '''
+    Loads the result of a previously computed backtesting period
+
+    Parameters:
+    key (string) --> the fingerprint of the backtesting period, as returned by 'fold_keys'
+
+    Return type: Pandas DataFrame holding the predictions of the backtesting period, or None if the period has not been computed before
+    '''
+
+    def get(self, key):
+        filepath = os.path.join(self.directory, key + '.pkl')
+
+        if not os.path.exists(filepath):
+            return None
+
+        with open(filepath, 'rb') as file:
+            return pickle.load(file)
+
+
+    '''
+    Saves the result of a backtesting period with 'atomic_write' in 'Atomic_Files'
+
+    Parameters:
+    key (string) --> the fingerprint of the backtesting period, as returned by 'fold_keys'
+    prediction (Pandas DataFrame) --> the predictions of the backtesting period
+    '''
+
+    def put(self, key, prediction):
+        atomic_write(os.path.join(self.directory, key + '.pkl'), lambda file: pickle.dump(prediction, file))
+
+
+'''
+Creates the fingerprint of each backtesting period. A fingerprint covers the rows of the training slice, the rows of the testing slice, the predictors
+and the model's hyperparameters, so a period is only reused if all of these are exactly the same as when it was computed
+
+Parameters:
+data (Pandas DataFrame) --> the data being backtested, which must include the predictors and the 'Target' column
+model (scikit-learn estimator) --> the model being backtested
+predictors (list of strings) --> the columns the model is trained on
+splits (list of ints) --> the first row of the testing slice of each period, in increasing order
+step (int) --> the number of rows in each testing slice
+
+Return type: list of strings holding the fingerprint of each period, in the same order as the input splits
+'''
+
+def fold_keys(data, model, predictors, splits, step):
+    #hashes every row once, so that each slice can be fingerprinted from the row hashes instead of from the data itself
+    row_hashes = pd.util.hash_pandas_object(data[list(predictors) + ['Target']], index = True).to_numpy()
+
+    #n_jobs only changes how fast the model is fit, not its results, so it is left out of the fingerprint
+    parameters = {name: value for name, value in model.get_params().items() if name != 'n_jobs'}
+    settings = repr((type(model).__name__, sorted(parameters.items()), list(predictors), step)).encode()
+
+    keys = []
+    training_digest = hashlib.sha256(settings)
+    previous = 0
+
+    #the training slices are expanding windows, so the digest of each one continues from the digest of the one before it
+    for split in splits:
+        training_digest.update(row_hashes[previous : split].tobytes())
+        previous = split
+
+        digest = training_digest.copy()
+        digest.update(b'test')
+        digest.update(row_hashes[split : (split + step)].tobytes())
+        keys.append(digest.hexdigest())
+
+    return keys
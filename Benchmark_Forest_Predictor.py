@@ -0,0 +1,82 @@
+import time
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from Forest_Predictor import ArrayForest
+
+#compares scoring rows with scikit-learn's 'predict_proba' against the ArrayForest in 'Forest_Predictor', using a forest with the same settings as the default 'Model'.
+#run this file directly to print the timings and the largest difference between the two sets of probabilities
+
+'''
+Fits a forest on synthetic data shaped like the data of a 'Model': decades of trading days with 50 predictors
+
+Parameters:
+num_trees (int) --> the number of trees in the forest. Default set to 300, the same as 'Model'
+num_leaves (int) --> the minimum number of rows needed to split a node. Default set to 50, the same as 'Model'
+num_rows (int) --> the number of rows to fit on. Default set to 8000
+num_features (int) --> the number of predictors. Default set to 50
+seed (int) --> the seed of the random number generator, so that every run uses the same data. Default set to 0
+
+Return type: tuple of the fitted RandomForestClassifier and a generator to create rows to score
+'''
+
+def fit_synthetic_forest(num_trees = 300, num_leaves = 50, num_rows = 8000, num_features = 50, seed = 0):
+    generator = np.random.default_rng(seed)
+    rows = generator.normal(size = (num_rows, num_features))
+    target = (rows[:, 0] + 0.5 * rows[:, 1] + generator.normal(size = num_rows) > 0).astype(int)
+
+    forest = RandomForestClassifier(n_estimators = num_trees, min_samples_split = num_leaves, random_state = 1)
+    forest.fit(rows, target)
+
+    return forest, generator
+
+
+'''
+Times a function by running it several times and keeping the fastest run
+
+Parameters:
+function (function) --> the function to time, without parameters
+repeats (int) --> the number of times to run the function. Default set to 5
+
+Return type: float representing the fastest run in seconds
+'''
+
+def best_time(function, repeats = 5):
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+'''
+Times both ways of scoring for batches of 1, 100 and 10,000 rows, and checks that they give the same probabilities
+
+Parameters:
+batch_sizes (list of ints) --> the numbers of rows to score at once. Default set to 1, 100 and 10,000
+
+Return type: Pandas DataFrame with the timings of both ways, the speedup and the largest absolute difference between their probabilities for each batch size
+'''
+
+def run_benchmark(batch_sizes = (1, 100, 10000)):
+    forest, generator = fit_synthetic_forest()
+    array_forest = ArrayForest.from_sklearn(forest)
+
+    results = []
+    for batch_size in batch_sizes:
+        rows = generator.normal(size = (batch_size, forest.n_features_in_))
+        difference = np.abs(forest.predict_proba(rows) - array_forest.predict_proba(rows)).max()
+
+        sklearn_time = best_time(lambda: forest.predict_proba(rows))
+        array_time = best_time(lambda: array_forest.predict_proba(rows))
+
+        results.append({'Rows': batch_size, 'scikit-learn (ms)': sklearn_time * 1000, 'ArrayForest (ms)': array_time * 1000,
+                        'Speedup': sklearn_time / array_time, 'Max Difference': difference})
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    print(run_benchmark().to_string(index = False))
@@ -0,0 +1,126 @@
+import time
+import warnings
+import numpy as np
+import pandas as pd
+import Macro_Data as md
+
+#compares the batched feature derivation in 'Macro_Data' against the nested loop it replaced, on synthetic monthly data so that no Fred api key is needed.
+#run this file directly to print the timings and the largest difference between the two sets of features
+
+'''
+The nested horizon and metric loop that 'Macro_Data' used to derive its features, kept here as the reference the batched version is checked and timed against
+
+Parameters:
+series (Pandas DataFrame) --> monthly series, with a column for each metric
+feature_metrics (list of strings) --> the columns of the series to derive features for
+feature_horizons (list of ints) --> the time horizons, in months, to derive features for
+
+Return type: Pandas DataFrame in the same format as 'derive_features' in 'Macro_Data'
+'''
+
+def legacy_derive_features(series, feature_metrics, feature_horizons):
+    macro_data = series[feature_metrics].copy()
+    temp = macro_data.copy()
+
+    for metric in feature_metrics:
+        temp['Yesterday_' + metric] = temp[metric].shift(1)
+        temp[metric + '_DTD_Increase'] = (temp[metric] > temp['Yesterday_' + metric]).astype(int)
+        macro_data[metric + '_DTD_Increase'] = temp[metric + '_DTD_Increase']
+
+    for horizon in feature_horizons:
+        for metric in feature_metrics:
+            rolling_average = macro_data.rolling(horizon).mean()
+            ratio_column = metric + '_Ratio_Last_' + str(horizon) + '_Months'
+            macro_data[ratio_column] = macro_data[metric] / rolling_average[metric]
+
+            trend = macro_data.shift(1).rolling(horizon).sum()[metric + '_DTD_Increase']
+            trend_column = metric + '_Last_' + str(horizon) + '_Months_Trend'
+            macro_data[trend_column] = trend
+
+    macro_data = macro_data.resample('D').ffill()
+    macro_data.ffill(inplace = True)
+    macro_data.index = macro_data.index.tz_localize(None)
+
+    for metric in feature_metrics:
+        del macro_data[metric]
+        del macro_data[metric + '_DTD_Increase']
+
+    return macro_data.loc['1990-01-01':]
+
+
+'''
+Creates synthetic monthly series that look like the Fred data: random walks starting in 1985, where the most recent month is missing for some series as it has not been reported yet
+
+Parameters:
+num_metrics (int) --> the number of series to create
+seed (int) --> the seed of the random number generator, so that every run uses the same data. Default set to 0
+
+Return type: Pandas DataFrame with a row for each month and a column for each series
+'''
+
+def synthetic_series(num_metrics, seed = 0):
+    generator = np.random.default_rng(seed)
+    index = pd.date_range('1985-01-01', '2024-04-01', freq = 'MS')
+    values = 100 + np.cumsum(generator.normal(0, 1, (len(index), num_metrics)), axis = 0)
+    values[-1, ::2] = np.nan
+
+    return pd.DataFrame(values, index = index, columns = ['Metric ' + str(number) for number in range(num_metrics)])
+
+
+'''
+Times a function by running it several times and keeping the fastest run
+
+Parameters:
+function (function) --> the function to time, without parameters
+repeats (int) --> the number of times to run the function. Default set to 3
+
+Return type: float representing the fastest run in seconds
+'''
+
+def best_time(function, repeats = 3):
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+'''
+Times both versions of the feature derivation for increasing numbers of metrics and horizons, and checks that they derive the same features
+
+Parameters:
+sizes (list of tuples) --> pairs of the number of metrics and the number of horizons to benchmark. Default set to the current 4 metrics and 5 horizons, then larger sets
+
+Return type: Pandas DataFrame with the timings of both versions, the speedup, the largest absolute difference between their features and whether their missing values match for each size
+'''
+
+def run_benchmark(sizes = ((4, 5), (8, 10), (16, 20))):
+    #adding columns one at a time is what made the loop slow, so the warning pandas raises about it is expected here
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+
+    results = []
+    for num_metrics, num_horizons in sizes:
+        series = synthetic_series(num_metrics)
+        feature_metrics = list(series.columns)
+        feature_horizons = [2 + 4 * number for number in range(num_horizons)]
+
+        legacy = legacy_derive_features(series, feature_metrics, feature_horizons)
+        batched = md.derive_features(series, feature_metrics, feature_horizons)
+        legacy_values = legacy[batched.columns].to_numpy()
+        batched_values = batched.to_numpy()
+        difference = np.nanmax(np.abs(legacy_values - batched_values))
+        same_missing = bool((np.isnan(legacy_values) == np.isnan(batched_values)).all())
+
+        legacy_time = best_time(lambda: legacy_derive_features(series, feature_metrics, feature_horizons))
+        batched_time = best_time(lambda: md.derive_features(series, feature_metrics, feature_horizons))
+
+        results.append({'Metrics': num_metrics, 'Horizons': num_horizons, 'Loop (s)': legacy_time, 'Batched (s)': batched_time,
+                        'Speedup': legacy_time / batched_time, 'Max Difference': difference, 'Same Missing Values': same_missing})
+
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    print(run_benchmark().to_string(index = False))
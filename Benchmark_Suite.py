@@ -0,0 +1,329 @@
+import os
+import sys
+import json
+import pickle
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+from sklearn.base import clone
+import Synthetic_Data
+import Instrumentation
+import Feature_Engine
+import Model_Builder
+import Serialization
+import New_Predictions
+
+#times the main stages of the project on synthetic data from 'Synthetic_Data', so no network connection or api key is needed, and compares the timings against a saved baseline.
+#run this file directly to print the results; pass '--save-baseline' to save them as the new baseline, and the run fails if any stage got slower than the baseline allows
+
+#the file the baseline is saved to and compared against
+BASELINE_FILENAME = 'Benchmark_Baseline.json'
+
+
+'''
+Measures a function by running it several times and keeping the fastest run, then running it once more while tracing memory to find its peak allocation.
+The memory is traced in its own run because tracing slows the function down
+
+Parameters:
+function (function) --> the function to measure, without parameters
+repeats (int) --> the number of timed runs. Default set to 3
+
+Return type: dictionary holding the fastest run in 'seconds' and the peak memory allocated in 'peak_mb'
+'''
+
+def measure(function, repeats = 3):
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(times), 'peak_mb': peak / 1e6}
+
+
+'''
+Saves one trained model as the inference artifact of every input ticker, along with the list of tickers, so that 'generate_all_predictions' has a saved model for each of them.
+The tickers share the model as only the time taken to make predictions is measured
+
+Parameters:
+model (Model) --> the trained model
+tickers (list of strings) --> the tickers to save the model for
+'''
+
+def save_models_for(model, tickers):
+    #the files are saved in the working directory, which is where 'load_all_models' looks for them with its default directory
+    Serialization.save_tickers(tickers, directory = os.getcwd())
+    for ticker in tickers:
+        Serialization.save_artifact(model, ticker + '_Artifact.pkl', os.getcwd())
+
+
+'''
+Runs every stage on synthetic data for each history length and ticker count. Each history length uses its own temporary working directory, so the price store and the caches
+always start empty and every run measures the same work
+
+Parameters:
+history_lengths (list of ints) --> the numbers of trading days of price data to benchmark. Default set to 6000 and 9000
+ticker_counts (list of ints) --> the numbers of saved tickers to benchmark 'generate_all_predictions' with. Default set to 1 and 10
+num_trees (int) --> the number of trees of the benchmarked models, fewer than the default of 'Model' to keep the suite fast. Default set to 50
+repeats (int) --> the number of timed runs of each stage. Default set to 3
+
+Return type: dictionary with a key for each stage and size, for example 'backtest (days = 9000)', holding the results of 'measure'
+'''
+
+def run_suite(history_lengths = (6000, 9000), ticker_counts = (1, 10), num_trees = 50, repeats = 3):
+    results = dict()
+
+    for num_days in history_lengths:
+        with Synthetic_Data.use_synthetic_sources(num_days = num_days):
+            size = ' (days = ' + str(num_days) + ')'
+
+            #the first model also fills the price store and the macroeconomic cache, so the timed runs below only measure the work of the stage itself
+            model = Model_Builder.Model('SYN', num_trees = num_trees)
+            history = model.data[['Close']]
+
+            results['Model' + size] = measure(lambda: Model_Builder.Model('SYN', num_trees = num_trees, refresh_data = False), repeats)
+            results['derive_features' + size] = measure(lambda: Feature_Engine.derive_price_features(history, model.horizons), repeats)
+            results['backtest' + size] = measure(lambda: model.backtest(model.full_data, clone(model.model), model.predictors), repeats)
+            results['preprocess_latest_data' + size] = measure(lambda: New_Predictions.preprocess_latest_data('SYN', refresh = False), repeats)
+
+            #predictions are only benchmarked for the longest history, as their cost does not depend on it
+            if num_days == max(history_lengths):
+                for ticker_count in ticker_counts:
+                    tickers = ['SYN' + str(number) for number in range(ticker_count)]
+                    save_models_for(model, tickers)
+                    New_Predictions.generate_all_predictions()
+
+                    results['generate_all_predictions (tickers = ' + str(ticker_count) + ')'] = measure(New_Predictions.generate_all_predictions, repeats)
+
+    return results
+
+
+'''
+Builds the same model in the default mode and in the low_memory mode of 'Model', and compares the peak memory of the data while training against the size of the float32 matrix
+of predictors. The peak of each backtest is recorded by 'Instrumentation'; the fitted forest, which stays allocated either way, is taken out of it, and the data the model already
+held when the backtest started is added to it
+
+Parameters:
+num_days (int) --> the number of trading days of price data. Default set to 9000
+num_trees (int) --> the number of trees of the models. Default set to 50
+
+Return type: dictionary with a key for each mode, holding the 'training_peak_mb' of the data, the 'held_mb' of data the model keeps afterwards, the 'feature_matrix_mb'
+and the 'peak_ratio' of the training peak to the size of the feature matrix
+'''
+
+def memory_report(num_days = 9000, num_trees = 50):
+    report = dict()
+
+    with Synthetic_Data.use_synthetic_sources(num_days = num_days):
+        #the first model fills the price store and the macroeconomic cache, so neither is counted in the peaks below
+        Model_Builder.Model('SYN', num_trees = num_trees)
+
+        for mode, low_memory in (('default', False), ('low_memory', True)):
+            Instrumentation.reset()
+            Instrumentation.enable()
+            try:
+                model = Model_Builder.Model('SYN', num_trees = num_trees, refresh_data = False, low_memory = low_memory)
+            finally:
+                Instrumentation.disable()
+
+            backtest_peak = [record['peak_bytes'] for record in Instrumentation.records() if record['stage'] == 'backtest'][0]
+            forest_bytes = len(pickle.dumps(model.model))
+            sizes = model.memory_report()
+
+            #the predictions are allocated by the backtest, so they are already part of its peak
+            held_before = sizes['held_bytes'] - int(model.predictions.memory_usage(index = True, deep = True).sum())
+            training_peak = held_before + backtest_peak - forest_bytes
+
+            report[mode] = {
+                'training_peak_mb': training_peak / 1e6,
+                'held_mb': sizes['held_bytes'] / 1e6,
+                'feature_matrix_mb': sizes['feature_matrix_bytes'] / 1e6,
+                'peak_ratio': training_peak / sizes['feature_matrix_bytes']
+            }
+
+        Instrumentation.reset()
+
+    return report
+
+
+'''
+Builds a model of the same ticker with each backend of 'Model' and compares them. The time of the backtest is recorded by 'Instrumentation', and the latency of a prediction
+is the median time of 'future_predictions' on the ticker's latest row, the same call made by 'generate_predictions' in 'New_Predictions'
+
+Parameters:
+ticker (string) --> the ticker the models are built for. Default set to 'SYN', a ticker of synthetic data
+backends (list of strings) --> the backends to compare. Default set to None, which compares every backend in BACKENDS of 'Model_Builder'
+num_trees (int) --> the number of trees, or boosting iterations, of every model. Default set to 300, the default of 'Model'
+num_leaves (int) --> the num_leaves of every model. Default set to 50, the default of 'Model'
+refresh_data (bool) --> whether the newest price data should be downloaded into the price store first. Default set to True
+repeats (int) --> the number of timed predictions. Default set to 100
+
+Return type: Pandas DataFrame indexed by backend holding the 'Backtest_Seconds', the median 'Predict_Milliseconds', the 'Precision' and the pickled 'Model_MB' of each backend
+'''
+
+def compare_backends(ticker = 'SYN', backends = None, num_trees = 300, num_leaves = 50, refresh_data = True, repeats = 100):
+    rows = []
+
+    for backend in (backends if backends is not None else list(Model_Builder.BACKENDS)):
+        Instrumentation.reset()
+        Instrumentation.enable(track_memory = False)
+        try:
+            model = Model_Builder.Model(ticker, num_trees = num_trees, num_leaves = num_leaves, refresh_data = refresh_data, backend = backend)
+        finally:
+            Instrumentation.disable()
+
+        backtest_seconds = [record['wall_seconds'] for record in Instrumentation.records() if record['stage'] == 'backtest'][0]
+        Instrumentation.reset()
+
+        #the price data was refreshed while building the first model, so the latest row is built from the stored data
+        latest = New_Predictions.preprocess_latest_data(ticker, refresh = False, horizons = model.horizons)
+        times = []
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            model.future_predictions(latest)
+            times.append(time.perf_counter() - start)
+
+        rows.append({
+            'Backend': backend,
+            'Backtest_Seconds': backtest_seconds,
+            'Predict_Milliseconds': sorted(times)[len(times) // 2] * 1000,
+            'Precision': model.precision_score,
+            'Model_MB': len(pickle.dumps(model.model, protocol = 5)) / 1e6
+        })
+        refresh_data = False
+
+    return pd.DataFrame(rows).set_index('Backend')
+
+
+'''
+Saves the results of 'run_suite' as the baseline that later runs are compared against
+
+Parameters:
+results (dictionary) --> the results returned by 'run_suite'
+filename (string) --> the file the baseline is saved to. Default set to 'Benchmark_Baseline.json'
+'''
+
+def save_baseline(results, filename = BASELINE_FILENAME):
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent = 4)
+
+
+'''
+Loads the baseline saved by 'save_baseline'
+
+Parameters:
+filename (string) --> the file the baseline was saved to. Default set to 'Benchmark_Baseline.json'
+
+Return type: dictionary in the format returned by 'run_suite'
+'''
+
+def load_baseline(filename = BASELINE_FILENAME):
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+
+'''
+Compares results against a baseline. A stage has regressed when its time or its peak memory is more than the tolerance above the baseline;
+stages missing from either side are skipped
+
+Parameters:
+results (dictionary) --> the results returned by 'run_suite'
+baseline (dictionary) --> the baseline returned by 'load_baseline'
+tolerance (float) --> the fraction above the baseline allowed before a stage counts as regressed. Default set to 0.25, meaning 25% slower or larger
+
+Return type: list of strings describing every regression, which is empty if nothing regressed
+'''
+
+def compare_to_baseline(results, baseline, tolerance = 0.25):
+    regressions = []
+
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+
+        for measurement, unit in (('seconds', 's'), ('peak_mb', 'MB')):
+            allowed = baseline[stage][measurement] * (1 + tolerance)
+            if result[measurement] > allowed:
+                regressions.append(stage + ': ' + str(round(result[measurement], 3)) + unit + ' against a baseline of ' + str(round(baseline[stage][measurement], 3)) + unit)
+
+    return regressions
+
+
+'''
+Runs the suite, prints the results and compares them against the saved baseline. Timings depend on the machine, so no baseline is shipped with the project;
+each machine saves its own with '--save-baseline', and the comparison fails until it has
+
+Parameters:
+argv (list of strings) --> the command-line arguments. Default set to None, which uses the arguments this file was run with
+
+Return type: int exit code, 1 if any stage regressed, 2 if no baseline was saved, and 0 otherwise
+'''
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmarks the stages of the project on synthetic data')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'save the results as the new baseline')
+    parser.add_argument('--baseline', default = BASELINE_FILENAME, help = 'the baseline file to compare against or save to')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'the fraction above the baseline allowed before a stage counts as regressed')
+    parser.add_argument('--repeats', type = int, default = 3, help = 'the number of timed runs of each stage')
+    parser.add_argument('--memory-report', action = 'store_true', help = 'only compare the peak memory of the default and low_memory training modes')
+    parser.add_argument('--compare-backends', nargs = '?', const = 'SYN', default = None, metavar = 'TICKER',
+                        help = 'only compare the backends of Model on a ticker, by default on synthetic data; the ticker\'s real data is used when one is given')
+    parser.add_argument('--num-trees', type = int, default = 300, help = 'the number of trees, or boosting iterations, of the models compared with --compare-backends')
+    arguments = parser.parse_args(argv)
+
+    if arguments.compare_backends is not None:
+        if arguments.compare_backends == 'SYN':
+            with Synthetic_Data.use_synthetic_sources():
+                comparison = compare_backends(num_trees = arguments.num_trees)
+        else:
+            comparison = compare_backends(arguments.compare_backends, num_trees = arguments.num_trees)
+
+        print(comparison.to_string())
+        return 0
+
+    if arguments.memory_report:
+        for mode, sizes in memory_report().items():
+            print(mode + ': training peak ' + str(round(sizes['training_peak_mb'], 1)) + 'MB (' + str(round(sizes['peak_ratio'], 2)) + 'x the feature matrix of '
+                  + str(round(sizes['feature_matrix_mb'], 1)) + 'MB), ' + str(round(sizes['held_mb'], 1)) + 'MB held afterwards')
+        return 0
+
+    #the baseline path is resolved before the suite switches to its temporary working directories
+    baseline_path = os.path.abspath(arguments.baseline)
+    results = run_suite(repeats = arguments.repeats)
+
+    for stage, result in results.items():
+        print(stage + ': ' + str(round(result['seconds'], 4)) + 's, peak ' + str(round(result['peak_mb'], 1)) + 'MB')
+
+    if arguments.save_baseline:
+        save_baseline(results, baseline_path)
+        print('Saved the baseline to ' + baseline_path)
+        return 0
+
+    try:
+        baseline = load_baseline(baseline_path)
+    except FileNotFoundError:
+        print('FAILED: no baseline found at ' + baseline_path + ', so regressions cannot be checked; run with --save-baseline on this machine to create one')
+        return 2
+
+    regressions = compare_to_baseline(results, baseline, arguments.tolerance)
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+
+    if regressions:
+        print(str(len(regressions)) + ' stages regressed beyond the tolerance of ' + str(round(arguments.tolerance * 100)) + '%')
+        return 1
+
+    print('No stage regressed beyond the tolerance of ' + str(round(arguments.tolerance * 100)) + '%')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,503 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import smtplib
+from email.mime.text import MIMEText
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import Macro_Data as md
+import Price_Store
+import Instrumentation
+import Serialization
+import Model_Index
+import New_Predictions
+import Emailer
+from Atomic_Files import atomic_write
+
+#runs the daily report as a sequence of stages: downloading the newest bars, updating the feature states, building the latest features, predicting, looking up the precision scores, building the report
+#and delivering it. The output of every stage is saved along with the fingerprint of its inputs, so a stage whose inputs have not changed is skipped, and a run that failed
+#part way through starts again from the stage that failed
+
+#the order the stages run in
+STAGES = ['download', 'fetch', 'features', 'predict', 'scores', 'report', 'deliver']
+
+
+'''
+Creates the fingerprint of any picklable value, which is used to tell whether the inputs of a stage changed since its output was saved
+
+Parameters:
+value (any picklable object) --> the value to fingerprint
+
+Return type: string holding the SHA-256 hexadecimal digest
+'''
+
+def fingerprint(value):
+    return hashlib.sha256(pickle.dumps(value, protocol = 4)).hexdigest()
+
+
+'''
+Creates the stamp of a file, which changes whenever the file is written again
+
+Parameters:
+filepath (string) --> the path of the file
+
+Return type: tuple of the path, size and modification time of the file, or of the path and None if the file does not exist
+'''
+
+def file_stamp(filepath):
+    try:
+        stats = os.stat(filepath)
+    except FileNotFoundError:
+        return (filepath, None)
+
+    return (filepath, stats.st_size, stats.st_mtime_ns)
+
+
+'''
+Class used as the report sink writing each report to a text file, so that the whole pipeline can run offline
+
+Parameters:
+directory (string) --> where the reports are saved. Default set to 'Reports'
+'''
+
+class FileSink():
+
+    '''
+    Instance variables:
+    directory (string) --> holds the path where the reports are saved
+    '''
+
+    def __init__(self, directory = 'Reports'):
+        self.directory = directory
+
+
+    '''
+    Returns what identifies the sink, so that switching to another sink delivers the report again
+
+    Return type: tuple
+    '''
+
+    def describe(self):
+        return ('file', os.path.abspath(self.directory))
+
+
+    '''
+    Saves the report as 'Report_<run date>.txt'
+
+    Parameters:
+    complete_message (string) --> the body of the report
+    run_date (string) --> the date of the run, in the format YYYY-MM-DD
+    '''
+
+    def deliver(self, complete_message, run_date):
+        #ensures that the path specified by the directory exists; if not, the directory is made
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        with open(os.path.join(self.directory, 'Report_' + run_date + '.txt'), 'w') as file:
+            file.write(Emailer.subject + '\n\n' + complete_message + '\n')
+
+
+'''
+Class used as the report sink sending each report to an SMTP server. The defaults point to a local debugging server, such as the one started by
+'python -m aiosmtpd -n -l localhost:1025', which prints the emails it receives instead of sending them
+
+Parameters:
+host (string) --> the host of the SMTP server. Default set to 'localhost'
+port (int) --> the port of the SMTP server. Default set to 1025
+sender (string) --> the email address the report is sent from. Default set to 'stock-trader@localhost'
+to (string) --> the email address of the recipient. Default set to None, which uses the variable 'recipient' of 'Emailer'
+'''
+
+class SMTPSink():
+
+    '''
+    Instance variables:
+    host (string) --> holds the host of the SMTP server
+    port (int) --> holds the port of the SMTP server
+    sender (string) --> holds the email address the report is sent from
+    to (string) --> holds the email address of the recipient, or None to use the one set in 'Emailer'
+    '''
+
+    def __init__(self, host = 'localhost', port = 1025, sender = 'stock-trader@localhost', to = None):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.to = to
+
+
+    '''
+    Returns what identifies the sink, so that switching to another sink delivers the report again
+
+    Return type: tuple
+    '''
+
+    def describe(self):
+        return ('smtp', self.host, self.port, self.to if self.to is not None else Emailer.recipient)
+
+
+    '''
+    Sends the report as an email
+
+    Parameters:
+    complete_message (string) --> the body of the report
+    run_date (string) --> the date of the run, in the format YYYY-MM-DD
+    '''
+
+    def deliver(self, complete_message, run_date):
+        message = MIMEText(complete_message)
+        message['from'] = self.sender
+        message['to'] = self.to if self.to is not None else Emailer.recipient
+        message['subject'] = Emailer.subject + ' (' + run_date + ')'
+
+        with smtplib.SMTP(self.host, self.port, timeout = 30) as server:
+            server.send_message(message)
+
+
+'''
+Class used as the report sink sending each report through the Gmail API with 'send_email' in 'Emailer'
+
+Parameters:
+to (string) --> the email address of the recipient. Default set to None, which uses the variable 'recipient' of 'Emailer'
+credentials (string) --> the path of the credentials.json file installed from google. Default set to None, which uses the variable 'credentials_path' of 'Emailer'
+'''
+
+class GmailSink():
+
+    '''
+    Instance variables:
+    to (string) --> holds the email address of the recipient, or None to use the one set in 'Emailer'
+    credentials (string) --> holds the path of the credentials.json file, or None to use the one set in 'Emailer'
+    '''
+
+    def __init__(self, to = None, credentials = None):
+        self.to = to
+        self.credentials = credentials
+
+
+    '''
+    Returns what identifies the sink, so that switching to another sink delivers the report again
+
+    Return type: tuple
+    '''
+
+    def describe(self):
+        return ('gmail', self.to if self.to is not None else Emailer.recipient)
+
+
+    '''
+    Sends the report through the Gmail API. 'send_email' only prints the error when sending fails, so a RuntimeError is raised for the stage to be retried
+
+    Parameters:
+    complete_message (string) --> the body of the report
+    run_date (string) --> the date of the run, in the format YYYY-MM-DD
+    '''
+
+    def deliver(self, complete_message, run_date):
+        if Emailer.send_email(complete_message, to = self.to, credentials = self.credentials) is None:
+            raise RuntimeError('The Gmail API did not send the report')
+
+
+'''
+Class used to run the daily pipeline. Each stage is keyed by the fingerprint of its inputs:
+'download' is run every time the newest bars are downloaded, and is otherwise keyed by the stored price files; 'fetch' by the saved tickers, the time horizons of their models
+and the latest stored bar of every ticker, so new bars saved later on the same day are fetched; 'features' by the fetched rows and macroeconomic data;
+'predict' by the features and the saved model files; 'scores' by the model index, which holds the precision scores and chosen thresholds, and the saved precision scores file; 'report' by the predictions and scores; and 'deliver' by the report and the sink.
+A stage is only run again when its key changed, so rerunning on the same day, or on a day without new bars, does almost no work and never delivers the same report twice
+
+Parameters:
+sink (FileSink, SMTPSink or GmailSink) --> where the report is delivered. Any object with the methods 'describe' and 'deliver' can be used. Default set to None, which uses a FileSink
+directory (string) --> where the output of each stage is saved. Default set to 'Pipeline_Cache'
+refresh (bool) --> whether the newest bars should be downloaded into the price store. Default set to True; set to False to run offline from the stored data
+retries (int) --> the number of times a failed stage is tried again before the run stops. Default set to 2
+retry_delay (float) --> the number of seconds waited before the first retry of a stage, doubled before every further retry. Default set to 5
+max_workers (int) --> the maximum number of tickers fetched at the same time. Default set to 8
+run_date (string) --> the date of the run, in the format YYYY-MM-DD. Default set to None, which uses today's date
+'''
+
+class DailyPipeline():
+
+    '''
+    Instance variables:
+    sink (object) --> holds where the report is delivered
+    directory (string) --> holds the path where the output of each stage is saved
+    refresh (bool) --> holds whether the newest bars are downloaded
+    retries (int) --> holds the number of retries of a failed stage
+    retry_delay (float) --> holds the number of seconds waited before the first retry
+    max_workers (int) --> holds the maximum number of tickers fetched at the same time
+    run_date (string) --> holds the date of the run
+    statuses (dictionary) --> holds whether each stage of the last run was 'ran', 'skipped' or 'failed'
+    '''
+
+    def __init__(self, sink = None, directory = 'Pipeline_Cache', refresh = True, retries = 2, retry_delay = 5, max_workers = 8, run_date = None):
+        self.sink = sink if sink is not None else FileSink()
+        self.directory = directory
+        self.refresh = refresh
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_workers = max_workers
+        self.run_date = run_date if run_date is not None else pd.Timestamp.today().strftime('%Y-%m-%d')
+        self.statuses = dict()
+        self._models = None
+
+        #ensures that the path specified by the directory exists; if not, the directory is made
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+    '''
+    Loads the saved output of a stage
+
+    Parameters:
+    name (string) --> the name of the stage
+
+    Return type: dictionary holding the 'key' the output was saved under, the 'output' itself and its 'fingerprint', or None if the stage never finished
+    '''
+
+    def load_stage(self, name):
+        filepath = os.path.join(self.directory, name + '.pkl')
+
+        if not os.path.exists(filepath):
+            return None
+
+        with open(filepath, 'rb') as file:
+            return pickle.load(file)
+
+
+    '''
+    Saves the output of a stage with 'atomic_write' in 'Atomic_Files'
+
+    Parameters:
+    name (string) --> the name of the stage
+    saved (dictionary) --> holds the 'key', 'output' and 'fingerprint' of the stage
+    '''
+
+    def save_stage(self, name, saved):
+        atomic_write(os.path.join(self.directory, name + '.pkl'), lambda file: pickle.dump(saved, file))
+
+
+    '''
+    Runs a single stage, unless its output was already saved under the same key. A failing stage is tried again after a delay, and the last error is raised
+    once all the retries failed; the output of the stages before it stays saved, so the next run starts from this stage
+
+    Parameters:
+    name (string) --> the name of the stage
+    inputs (any picklable object) --> everything the output of the stage depends on
+    function (function) --> function without parameters that runs the stage and returns its output
+    force (bool) --> whether the stage should run even if its output was saved under the same key. Default set to False
+
+    Return type: dictionary holding the 'key', 'output' and 'fingerprint' of the stage
+    '''
+
+    def run_stage(self, name, inputs, function, force = False):
+        key = fingerprint(inputs)
+        saved = self.load_stage(name)
+
+        if not force and saved is not None and saved['key'] == key:
+            self.statuses[name] = 'skipped'
+            return saved
+
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                with Instrumentation.stage('pipeline_' + name, attempt = attempt):
+                    output = function()
+                break
+            except Exception as error:
+                print('Stage ' + name + ' failed on attempt ' + str(attempt + 1) + ': ' + repr(error))
+
+                if attempt == self.retries:
+                    self.statuses[name] = 'failed'
+                    raise
+
+                time.sleep(delay)
+                delay *= 2
+
+        saved = {'key': key, 'output': output, 'fingerprint': fingerprint(output)}
+        self.save_stage(name, saved)
+        self.statuses[name] = 'ran'
+
+        return saved
+
+
+    '''
+    Loads all the saved models once per run with 'load_all_models' in 'Serialization'
+
+    Return type: dictionary with the tickers as keys and their models as values
+    '''
+
+    def models(self):
+        if self._models is None:
+            self._models = Serialization.load_all_models()
+
+        return self._models
+
+
+    '''
+    Creates the stamps of the saved model files, which change whenever a model is trained again
+
+    Return type: list of the tickers along with the stamp of their artifact and of their full model
+    '''
+
+    def model_stamps(self):
+        return [(ticker, file_stamp(str(ticker) + '_Artifact.pkl'), file_stamp(str(ticker) + '.pkl')) for ticker in Serialization.load_tickers()]
+
+
+    '''
+    Reads the time horizons of every ticker's model from the model index, so that no model is loaded unless the predict stage runs. Tickers missing from the index are read
+    from the header of their artifact, and tickers with only a full model saved from the model itself; models saved before the time horizons were recorded used the defaults
+
+    Parameters:
+    tickers (list of strings) --> the saved tickers
+
+    Return type: list of tuples of ints holding the time horizons of each ticker's model
+    '''
+
+    def model_horizons(self, tickers):
+        try:
+            indexed = Model_Index.query(tickers = tickers)['horizons'].to_dict()
+        except FileNotFoundError:
+            indexed = dict()
+
+        horizons = []
+        for ticker in tickers:
+            if str(ticker) in indexed:
+                horizons.append(tuple(json.loads(indexed[str(ticker)])))
+            elif os.path.exists(str(ticker) + '_Artifact.pkl'):
+                horizons.append(tuple(Serialization.load_artifact_header(str(ticker) + '_Artifact.pkl')['horizons']))
+            else:
+                horizons.append(tuple(getattr(Serialization.load_model(str(ticker) + '.pkl'), 'horizons', (2, 5, 60, 250, 1000))))
+
+        return horizons
+
+
+    '''
+    Brings the price store of every ticker up to date with 'get_history' in 'Price_Store'. Every bar downloaded by the pipeline is downloaded here, so a failed download
+    is retried without running any other stage again
+
+    Parameters:
+    tickers (list of strings) --> the saved tickers
+
+    Return type: list of the tickers along with the date and closing price of their latest stored bar
+    '''
+
+    def download(self, tickers):
+        #the last bar is kept along with its date, since a bar saved before the close of its day is saved again once the day is over
+        def latest_bar(ticker):
+            history = Price_Store.get_history(ticker, refresh = self.refresh)
+            return (ticker, history.index[-1], float(history['Close'].iloc[-1]))
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            return list(executor.map(latest_bar, tickers))
+
+
+    '''
+    Updates the feature states of every ticker from the bars saved by 'download', the same way as 'generate_all_predictions_batch' in 'New_Predictions', and fetches the latest
+    macroeconomic data
+
+    Parameters:
+    tickers (list of strings) --> the saved tickers
+    horizons (list of tuples of ints) --> the time horizons of each ticker's model
+
+    Return type: dictionary holding the 'tickers', the 'latest' price features of each of them as a Pandas DataFrame indexed by their latest trading days,
+    and the 'macro' data reported on or before each of those days
+    '''
+
+    def fetch(self, tickers, horizons):
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            states = list(executor.map(lambda ticker, ticker_horizons: New_Predictions.update_feature_state(ticker, False, ticker_horizons), tickers, horizons))
+
+        latest = pd.concat([state.latest_features() for state in states])
+
+        #the latest macroeconomic data reported on or before each date, the same as in 'preprocess_latest_bar'
+        macro_rows = md.asof_join(latest.index)
+
+        return {'tickers': tickers, 'latest': latest, 'macro': macro_rows}
+
+
+    '''
+    Joins the fetched macroeconomic data onto the fetched price features, and indexes the rows by ticker
+
+    Parameters:
+    fetched (dictionary) --> the output of 'fetch'
+
+    Return type: Pandas DataFrame indexed by ticker holding every predictor
+    '''
+
+    def features(self, fetched):
+        return pd.concat([fetched['latest'], fetched['macro']], axis = 1).set_axis(pd.Index(fetched['tickers'], name = 'Ticker'))
+
+
+    '''
+    Predicts every ticker from its row of features, grouping the tickers sharing the same model into one prediction
+
+    Parameters:
+    latest (Pandas DataFrame) --> the output of 'features'
+
+    Return type: dictionary with the tickers as keys and their probabilities of a price increase as values
+    '''
+
+    def predict(self, latest):
+        models = self.models()
+
+        groups = dict()
+        for ticker in latest.index:
+            groups.setdefault(id(models[ticker]), []).append(ticker)
+
+        probabilities = dict()
+        for group in groups.values():
+            for ticker, probability in zip(group, models[group[0]].future_predictions(latest.loc[group])):
+                probabilities[ticker] = float(probability)
+
+        return probabilities
+
+
+    '''
+    Runs every stage in order, skipping the stages whose inputs have not changed
+
+    Parameters:
+    force (list of strings) --> the names of stages to run again even if their inputs have not changed. Default set to none
+
+    Return type: string holding the report that was delivered
+    '''
+
+    def run(self, force = ()):
+        unknown = [name for name in force if name not in STAGES]
+        if unknown:
+            raise ValueError('Unknown stages: ' + ', '.join(unknown) + '; the stages are ' + ', '.join(STAGES))
+
+        self.statuses = dict()
+        self._models = None
+
+        #the time horizons come from the models, so that every ticker's features match what its model was trained on
+        stamps = self.model_stamps()
+        tickers = [stamp[0] for stamp in stamps]
+        horizons = self.model_horizons(tickers)
+
+        #downloading is always run when refreshing, since only the download tells whether new bars exist; offline, the stored price files are the only source of new bars
+        price_stamps = [file_stamp(Price_Store.ticker_filepath(ticker)) for ticker in tickers]
+        downloaded = self.run_stage('download', (tickers, price_stamps), lambda: self.download(tickers), self.refresh or 'download' in force)
+
+        fetched = self.run_stage('fetch', (tickers, horizons, downloaded['fingerprint']), lambda: self.fetch(tickers, horizons), 'fetch' in force)
+        features = self.run_stage('features', fetched['fingerprint'], lambda: self.features(fetched['output']), 'features' in force)
+
+        predictions = self.run_stage('predict', (features['fingerprint'], stamps), lambda: self.predict(features['output']), 'predict' in force)
+
+        #the scores and chosen thresholds are read from the model index, which changes whenever a model is trained or its threshold is chosen; the precision scores file is used
+        #before the index exists. The key is tagged so that outputs saved before the thresholds were read are not used
+        index_path = Model_Index.INDEX_FILENAME
+        scores = self.run_stage('scores', ('thresholds', file_stamp(index_path), file_stamp(index_path + '-wal'), file_stamp('Precision_Scores.pkl')),
+                                lambda: (Model_Index.load_precision_scores(), Model_Index.load_chosen_thresholds()), 'scores' in force)
+
+        #formats the predictions as a neat string with the values rounded to two decimal places, the same as 'generate_all_predictions' in 'New_Predictions'
+        def build_report():
+            formatted = {ticker: str(round(probability * 100, 2)) + '%' for ticker, probability in predictions['output'].items()}
+            return Emailer.build_message(formatted, *scores['output'])
+
+        report = self.run_stage('report', (predictions['fingerprint'], scores['fingerprint']), build_report, 'report' in force)
+
+        self.run_stage('deliver', (report['fingerprint'], self.sink.describe()), lambda: self.sink.deliver(report['output'], self.run_date), 'deliver' in force)
+
+        return report['output']
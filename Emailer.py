@@ -1,53 +1,103 @@
 import base64
 from email.mime.text import MIMEText
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from requests import HTTPError
 import New_Predictions
-import Serialization as model_scores
+import Model_Index
 
-#IMPORTANT note: to run this file, two lines must be adjusted: line 35 with the path of the credentials.json file installed from google,
-#and line 43 with the email address (preferrably gmail) of the intended recipient
+#IMPORTANT note: to send the email, two variables must be adjusted: 'credentials_path' on line 11 with the path of the credentials.json file installed from google,
+#and 'recipient' on line 14 with the email address (preferrably gmail) of the intended recipient
 
-#creates a list to hold the entire body message to be included in the email sent out to recipients
-body_message = ['Tomorrow\'s predictions for price increases are:', '',]
+#important note: this needs to be the path to the credentials.json file installed on your local machine
+credentials_path = ''
 
-#calls the 'New_Predictions' module to generate predictions for all the saved tickers for the next trading day
-predictions = New_Predictions.generate_all_predictions()
-
-#calls the 'Serialization' module to load the precision scores of the model to include in the email output to recipients
-scores = model_scores.load_all_precision_scores()
-
-#loops through the tickers and their associated predictions to include them in the body message
-for ticker, prediction in predictions.items():
-    body_message.append(ticker + ': ' + prediction + ', model has precision score of ' + str(round(scores[ticker] * 100, 2)) + '%')
-
-#joins together the list to form one neat string as the body message sent to recipients
-complete_message = '\n'.join(body_message)
+#important note: this needs to be adjusted to include the email address (preferrably gmail) of the intended recipient
+recipient = ''
 
 #sets the scope variable to access the gmail API
 SCOPES = [
         'https://www.googleapis.com/auth/gmail.send'
     ]
 
-#accesses the json file containing the google credentials necessary to use the gmail API
-#important note: to run this file, the first input for the function 'from_client_secrets_file' needs to be the path to the credentials.json file installed on your local machine
-flow = InstalledAppFlow.from_client_secrets_file('', SCOPES)
-creds = flow.run_local_server(port = 0)
-
-#finalizes the email's subject, message, and recipients
-service = build('gmail', 'v1', credentials = creds)
-message = MIMEText(complete_message)
-
-#important note: the below line needs to be adjusted to include the email address (preferrably gmail) of the intended recipient
-message['to'] = ''
-message['subject'] = 'Derik\'s Stock Picks'
-create_message = {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
-
-#attempts to send the email to the recipient
-try:
-    message = (service.users().messages().send(userId = 'me', body = create_message).execute())
-    print(F'sent message to {message} Message Id: {message["id"]}')
-except HTTPError as error:
-    print(F'An error occurred: {error}')
-    message = None
\ No newline at end of file
+#the subject of the email, which is also used by the report sinks of 'Daily_Pipeline'
+subject = 'Derik\'s Stock Picks'
+
+
+'''
+Creates the body of the email, listing each ticker's prediction for the next trading day along with the precision score of its model. For the tickers with a threshold
+chosen with 'Threshold_Sweep', the precision that threshold gave on the latest backtested days is listed instead, along with the threshold, unless those days had too few
+signals to measure it
+
+Parameters:
+predictions (dictionary) --> the tickers as keys and their price increase predictions as values. Default set to None, which generates the predictions of all the saved models with 'New_Predictions'
+scores (dictionary) --> the tickers as keys and the precision scores of their models as values. Default set to None, which loads the precision scores from the index of 'Model_Index'
+thresholds (dictionary) --> the tickers as keys and a tuple of their chosen threshold and its precision as values. Default set to None, which loads them from the index of 'Model_Index'
+
+Return type: string holding the complete body message
+'''
+
+def build_message(predictions = None, scores = None, thresholds = None):
+    #calls the 'New_Predictions' module to generate predictions for all the saved tickers for the next trading day
+    if predictions is None:
+        predictions = New_Predictions.generate_all_predictions()
+
+    #looks up the precision scores of the models in the model index to include in the email output to recipients, without loading any model
+    if scores is None:
+        scores = Model_Index.load_precision_scores()
+    if thresholds is None:
+        thresholds = Model_Index.load_chosen_thresholds()
+
+    #creates a list to hold the entire body message to be included in the email sent out to recipients
+    body_message = ['Tomorrow\'s predictions for price increases are:', '',]
+
+    #loops through the tickers and their associated predictions to include them in the body message
+    for ticker, prediction in predictions.items():
+        if ticker in thresholds and thresholds[ticker][1] is not None:
+            threshold, precision = thresholds[ticker]
+            body_message.append(ticker + ': ' + prediction + ', model has precision score of ' + str(round(precision * 100, 2)) + '% above its threshold of ' + str(round(threshold * 100, 2)) + '%')
+        else:
+            body_message.append(ticker + ': ' + prediction + ', model has precision score of ' + str(round(scores[ticker] * 100, 2)) + '%')
+
+    #joins together the list to form one neat string as the body message sent to recipients
+    return '\n'.join(body_message)
+
+
+'''
+Sends an email through the Gmail API. The Google libraries are only imported here, so that the message can be built without them installed
+
+Parameters:
+complete_message (string) --> the body of the email
+to (string) --> the email address of the recipient. Default set to the module variable 'recipient'
+credentials (string) --> the path of the credentials.json file installed from google. Default set to the module variable 'credentials_path'
+
+Return type: dictionary holding the sent message as returned by the Gmail API, or None if sending failed
+'''
+
+def send_email(complete_message, to = None, credentials = None):
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
+    #accesses the json file containing the google credentials necessary to use the gmail API
+    flow = InstalledAppFlow.from_client_secrets_file(credentials if credentials is not None else credentials_path, SCOPES)
+    creds = flow.run_local_server(port = 0)
+
+    #finalizes the email's subject, message, and recipients
+    service = build('gmail', 'v1', credentials = creds)
+    message = MIMEText(complete_message)
+    message['to'] = to if to is not None else recipient
+    message['subject'] = subject
+    create_message = {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
+
+    #attempts to send the email to the recipient
+    try:
+        message = (service.users().messages().send(userId = 'me', body = create_message).execute())
+        print(F'sent message to {message} Message Id: {message["id"]}')
+    except HTTPError as error:
+        print(F'An error occurred: {error}')
+        message = None
+
+    return message
+
+
+#collects all the saved models' predictions and emails them when this file is run directly, rather than when it is imported
+if __name__ == '__main__':
+    send_email(build_message())
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+'''
+Creates the column names of the price features for the input time horizons, in the order they are returned by 'derive_price_features'
+
+Parameters:
+horizons (list of ints) --> the time horizons, in trading days, for which features are derived
+
+Return type: list of strings, holding the moving average ratio column followed by the trend column for each time horizon
+'''
+
+def feature_columns(horizons):
+    columns = []
+    for horizon in horizons:
+        columns.append('Close_Ratio_' + str(horizon))
+        columns.append('Last_' + str(horizon) + '_Trend')
+
+    return columns
+
+
+'''
+Derives the price features used by the models: the ratio of each day's close to its moving average, and the number of days the price increased within each time horizon.
+This function is used both when building models in 'Model_Builder' and when generating predictions in 'New_Predictions', so the features are identical in both.
+
+All time horizons are computed from a single cumulative sum of the closing prices and a single cumulative sum of the daily increases, so each rolling window is the
+difference of two cumulative sums instead of a new pass over the data. The trend on a given day counts the increases of that day and the days before it, where a day's
+increase compares its close to the previous close; the first day has no previous close, so a trend is only available once a full time horizon of increases exists
+
+Parameters:
+data (Pandas DataFrame) --> price data holding a 'Close' column, ordered by date
+horizons (list of ints) --> the time horizons, in trading days, for which features are derived
+dtype (NumPy dtype) --> the dtype of the returned features. Default set to float64; float32 halves the memory used by the features.
+The sums themselves are always computed in float64 so the precision of long price histories is kept
+
+Return type: Pandas DataFrame with the same index as the input data and the columns returned by 'feature_columns'. Days without enough prior data hold 'NaN'
+'''
+
+def derive_price_features(data, horizons, dtype = np.float64):
+    #check if any of the time horizons are not integers or are negative, raises a ValueError if they are
+    for horizon in horizons:
+        if not isinstance(horizon, int) or horizon <= 0:
+            raise ValueError('Time horizons must be positive integers')
+
+    close = data['Close'].to_numpy(dtype = np.float64)
+    num_days = close.shape[0]
+
+    #binary values of whether the price increased from the previous day, and the cumulative sums that every rolling window is taken from
+    increases = np.zeros(num_days)
+    increases[1:] = close[1:] > close[:-1]
+    close_sums = np.concatenate(([0.0], np.cumsum(close)))
+    increase_sums = np.concatenate(([0.0], np.cumsum(increases)))
+
+    features = dict()
+    for horizon in horizons:
+        #the moving average of the days up to and including each day, as the difference of two cumulative sums divided by the time horizon
+        ratio = np.full(num_days, np.nan)
+        if horizon <= num_days:
+            ratio[horizon - 1:] = close[horizon - 1:] * horizon / (close_sums[horizon:] - close_sums[:-horizon])
+
+        #the number of increases within the time horizon ending on each day, which needs one more day than the moving average since the first day has no increase
+        trend = np.full(num_days, np.nan)
+        if horizon < num_days:
+            trend[horizon:] = increase_sums[horizon + 1:] - increase_sums[1:num_days - horizon + 1]
+
+        features['Close_Ratio_' + str(horizon)] = ratio.astype(dtype, copy = False)
+        features['Last_' + str(horizon) + '_Trend'] = trend.astype(dtype, copy = False)
+
+    return pd.DataFrame(features, index = data.index)
@@ -0,0 +1,189 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import Feature_Engine
+from Atomic_Files import atomic_write
+
+#the feature state of each ticker is saved as its own pickle file in this directory
+DEFAULT_DIRECTORY = 'Feature_States'
+
+
+'''
+Class used to keep the price features of a ticker up to date one trading day at a time. It holds the last closing prices and daily increases in ring buffers,
+along with running sums for each time horizon, so appending a new bar takes the same amount of work no matter how much history the ticker has.
+The features it produces are the same as those of 'derive_price_features' in 'Feature_Engine' for the most recent day
+
+Parameters:
+horizons (list of ints) --> the time horizons, in trading days, for which features are derived
+'''
+
+class FeatureState():
+
+    '''
+    Instance variables:
+    horizons (list of ints) --> holds the time horizons
+    closes (NumPy array) --> ring buffer holding the closing prices of the last days, one more than the longest time horizon
+    increases (NumPy array) --> ring buffer holding whether the price increased on each of the same days
+    close_sums (NumPy array) --> holds the running sum of the closes within each time horizon
+    increase_sums (NumPy array) --> holds the running sum of the increases within each time horizon
+    count (int) --> holds the number of bars appended so far
+    last_date (Pandas Timestamp) --> holds the date of the most recent bar
+    '''
+
+    def __init__(self, horizons):
+        #check if any of the time horizons are not integers or are negative, raises a ValueError if they are
+        for horizon in horizons:
+            if not isinstance(horizon, int) or horizon <= 0:
+                raise ValueError('Time horizons must be positive integers')
+
+        self.horizons = list(horizons)
+        self.closes = np.zeros(max(self.horizons) + 1)
+        self.increases = np.zeros(max(self.horizons) + 1)
+        self.close_sums = np.zeros(len(self.horizons))
+        self.increase_sums = np.zeros(len(self.horizons))
+        self.count = 0
+        self.last_date = None
+
+
+    '''
+    Creates a feature state from stored price data. Only the days needed by the longest time horizon are appended
+
+    Parameters:
+    data (Pandas DataFrame) --> price data holding a 'Close' column, ordered by date
+    horizons (list of ints) --> the time horizons, in trading days, for which features are derived
+
+    Return type: FeatureState holding the features of the last day of the data
+    '''
+
+    @classmethod
+    def from_history(cls, data, horizons):
+        state = cls(horizons)
+        recent = data.iloc[-(max(state.horizons) + 1):]
+
+        for date, close in zip(recent.index, recent['Close'].to_numpy(dtype = np.float64)):
+            state.update(date, close)
+
+        return state
+
+
+    '''
+    Appends the bar of a new trading day, updating the running sums of every time horizon
+
+    Parameters:
+    date (Pandas Timestamp) --> the date of the new bar, which must be after the date of the last bar
+    close (float) --> the closing price of the new bar
+    '''
+
+    def update(self, date, close):
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError('Bars must be appended in date order')
+
+        size = self.closes.shape[0]
+        position = self.count % size
+
+        #the first bar has no previous close, so it never counts as an increase
+        increase = float(self.count > 0 and close > self.closes[(self.count - 1) % size])
+
+        #adds the new bar to every running sum, and removes the bar that just left each time horizon
+        for index, horizon in enumerate(self.horizons):
+            self.close_sums[index] += close
+            self.increase_sums[index] += increase
+
+            if self.count >= horizon:
+                self.close_sums[index] -= self.closes[(self.count - horizon) % size]
+                self.increase_sums[index] -= self.increases[(self.count - horizon) % size]
+
+        self.closes[position] = close
+        self.increases[position] = increase
+        self.count += 1
+        self.last_date = date
+
+        #the running sums of the closes collect floating point error over time, so they are recomputed from the ring buffer once every full turn of it
+        if self.count % size == 0:
+            self.resum()
+
+
+    '''
+    Recomputes the running sums of the closes from the ring buffer, which removes the floating point error collected by 'update'
+    '''
+
+    def resum(self):
+        size = self.closes.shape[0]
+        for index, horizon in enumerate(self.horizons):
+            recent = [(self.count - offset) % size for offset in range(1, min(horizon, self.count) + 1)]
+            self.close_sums[index] = self.closes[recent].sum()
+
+
+    '''
+    Returns the features of the most recent bar
+
+    Parameters:
+    dtype (NumPy dtype) --> the dtype of the returned features. Default set to float64
+
+    Return type: Pandas DataFrame with a single row indexed by the date of the most recent bar, with the columns returned by 'feature_columns' in 'Feature_Engine'.
+    Time horizons without enough bars yet hold 'NaN'
+    '''
+
+    def latest_features(self, dtype = np.float64):
+        close = self.closes[(self.count - 1) % self.closes.shape[0]]
+        features = dict()
+
+        for index, horizon in enumerate(self.horizons):
+            #the ratio needs a full time horizon of closes, and the trend needs one more bar since the first bar has no increase
+            ratio = close * horizon / self.close_sums[index] if self.count >= horizon else np.nan
+            trend = self.increase_sums[index] if self.count > horizon else np.nan
+
+            features['Close_Ratio_' + str(horizon)] = ratio
+            features['Last_' + str(horizon) + '_Trend'] = trend
+
+        latest = pd.DataFrame(features, index = pd.DatetimeIndex([self.last_date]), columns = Feature_Engine.feature_columns(self.horizons))
+
+        return latest.astype(dtype)
+
+
+    '''
+    Returns the closing price of the most recent bar
+
+    Return type: float
+    '''
+
+    def last_close(self):
+        return self.closes[(self.count - 1) % self.closes.shape[0]]
+
+
+'''
+Saves the feature state of a ticker with 'atomic_write' in 'Atomic_Files'
+
+Parameters:
+ticker (string) --> the ticker the feature state belongs to
+state (FeatureState) --> the feature state to save
+directory (string) --> where the feature state should be saved. Default set to 'Feature_States'
+'''
+
+def save_state(ticker, state, directory = DEFAULT_DIRECTORY):
+    #ensures that the path specified by the directory exists; if not, the directory is made
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    atomic_write(os.path.join(directory, str(ticker) + '.pkl'), lambda file: pickle.dump(state, file))
+
+
+'''
+Loads the feature state of a ticker previously saved with 'save_state'
+
+Parameters:
+ticker (string) --> the ticker the feature state belongs to
+directory (string) --> where the feature state was saved. Default set to 'Feature_States'
+
+Return type: FeatureState, or None if no feature state was saved for the ticker
+'''
+
+def load_state(ticker, directory = DEFAULT_DIRECTORY):
+    filepath = os.path.join(directory, str(ticker) + '.pkl')
+
+    if not os.path.exists(filepath):
+        return None
+
+    with open(filepath, 'rb') as file:
+        return pickle.load(file)
@@ -0,0 +1,131 @@
+import numpy as np
+
+'''
+Class holding a fitted random forest as contiguous NumPy arrays, so that new rows can be scored across all trees at once instead of going through scikit-learn one tree at a time.
+The nodes of every tree are stored one after another in the same arrays: the feature and threshold each node splits on, the index of its two children and the class
+probabilities of its leaf
+
+Parameters:
+feature (NumPy array) --> the index of the feature each node splits on
+threshold (NumPy array) --> the threshold each node splits on; rows go to the left child when their value is less than or equal to it
+children (NumPy array) --> the index of the left and right child of each node, one after the other, so the children of node i are at positions 2i and 2i + 1
+missing_left (NumPy array) --> whether rows missing the node's feature go to the left child
+leaf (NumPy array) --> whether each node is a leaf
+value (NumPy array) --> the class probabilities of each node, with a row for each node and a column for each class
+roots (NumPy array) --> the index of the first node of each tree
+classes (NumPy array) --> the classes the forest predicts, in the same order as the columns of value
+'''
+
+class ArrayForest():
+
+    def __init__(self, feature, threshold, children, missing_left, leaf, value, roots, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.leaf = leaf
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+
+
+    '''
+    Flattens a fitted scikit-learn RandomForestClassifier into an ArrayForest
+
+    Parameters:
+    forest (RandomForestClassifier) --> the fitted forest
+
+    Return type: ArrayForest
+    '''
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, children, missing_lefts, leaves, values, roots = [], [], [], [], [], [], []
+        offset = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+
+            #moves the children to their position in the combined arrays; leaves keep no children, so they point back to the root of their tree
+            pairs = np.column_stack([tree.children_left, tree.children_right])
+            pairs[is_leaf] = 0
+            children.append((pairs + offset).ravel())
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            leaves.append(is_leaf)
+
+            #older versions of scikit-learn do not support missing values, in which case rows can never be missing a feature
+            if hasattr(tree, 'missing_go_to_left'):
+                missing_lefts.append(tree.missing_go_to_left.astype(bool))
+            else:
+                missing_lefts.append(np.zeros(tree.node_count, dtype = bool))
+
+            #the values are normalized into probabilities, the same as each tree's 'predict_proba'
+            value = tree.value[:, 0, :]
+            values.append(value / value.sum(axis = 1, keepdims = True))
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            np.concatenate(features).astype(np.int32),
+            np.concatenate(thresholds).astype(np.float64),
+            np.concatenate(children).astype(np.int32),
+            np.concatenate(missing_lefts),
+            np.concatenate(leaves),
+            np.concatenate(values).astype(np.float64),
+            np.array(roots, dtype = np.int32),
+            np.array(forest.classes_)
+        )
+
+
+    '''
+    Finds the class probabilities of the input rows, which are the average of the probabilities of the leaf each row reaches in every tree, the same as 'predict_proba'
+    of scikit-learn's RandomForestClassifier
+
+    Parameters:
+    rows (NumPy array or Pandas DataFrame) --> the rows to score, with the columns in the order the forest was trained on
+    chunk_size (int) --> the number of rows moved down the trees at once, which limits the memory used for large inputs. Default set to 1024
+
+    Return type: NumPy array with a row for each input row and a column for each class
+    '''
+
+    def predict_proba(self, rows, chunk_size = 1024):
+        #scikit-learn compares float32 values against the thresholds, so the rows are rounded the same way to reach the same leaves
+        rows = np.asarray(rows, dtype = np.float32)
+        num_trees = self.roots.shape[0]
+        probabilities = np.empty((rows.shape[0], self.value.shape[1]))
+
+        for start in range(0, rows.shape[0], chunk_size):
+            chunk = rows[start : (start + chunk_size)]
+            flat_chunk = chunk.ravel()
+            has_missing = bool(np.isnan(chunk).any())
+            reached = np.empty(chunk.shape[0] * num_trees, dtype = np.int32)
+
+            #every pair of a row and a tree starts at the root of the tree and takes one step down at a time; pairs that reach a leaf are set aside,
+            #so each step only moves the pairs that are still going down
+            pairs = np.arange(chunk.shape[0] * num_trees)
+            row_starts = (pairs // num_trees) * chunk.shape[1]
+            nodes = np.tile(self.roots, chunk.shape[0])
+
+            while pairs.shape[0] > 0:
+                done = self.leaf[nodes]
+                reached[pairs[done]] = nodes[done]
+
+                going = ~done
+                pairs = pairs[going]
+                row_starts = row_starts[going]
+                nodes = nodes[going]
+
+                values = flat_chunk[row_starts + self.feature[nodes]]
+                go_right = ~(values <= self.threshold[nodes])
+                if has_missing:
+                    go_right &= ~(np.isnan(values) & self.missing_left[nodes])
+
+                nodes = self.children[2 * nodes + go_right]
+
+            probabilities[start : (start + chunk.shape[0])] = self.value[reached].reshape(chunk.shape[0], num_trees, -1).mean(axis = 1)
+
+        return probabilities
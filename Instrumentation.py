@@ -0,0 +1,319 @@
+import json
+import time
+import threading
+import tracemalloc
+
+#opt-in recording of how long each named stage of training and prediction takes. Nothing is recorded until 'enable' is called; while disabled, 'stage' returns a shared
+#object whose 'with' block does nothing, so the stages left in the code cost about as much as an attribute lookup
+
+#whether stages are being recorded, and whether their peak memory is traced as well
+_enabled = False
+_track_memory = False
+_started_tracing = False
+
+#the records of all finished stages, and the stages currently running, which are needed to attribute peaks of memory to every stage that was running at the time.
+#the stages started with 'thread_stage' that are running are also kept apart, to tell which of them ran at the same time as another
+_records = []
+_running = []
+_threaded = []
+_lock = threading.Lock()
+
+
+'''
+Class used as the 'with' block of a single stage while recording is enabled. The wall time, the CPU time and, when traced, the peak memory allocated above what was
+in use when the stage started are recorded once the block ends. The CPU time is that of the whole process, or of the stage's own thread for a threaded stage
+
+Parameters:
+name (string) --> the name of the stage
+labels (dictionary) --> labels identifying what the stage ran for, such as the ticker or the backtesting period
+threaded (bool) --> whether the stage may run at the same time as other threaded stages on other threads, see 'thread_stage'. Default set to False
+'''
+
+class _Stage():
+
+    def __init__(self, name, labels, threaded = False):
+        self.name = name
+        self.labels = labels
+        self.threaded = threaded
+        self.clock = time.thread_time if threaded else time.process_time
+        self.overlapped = False
+
+
+    def __enter__(self):
+        if _track_memory:
+            with _lock:
+                current, peak = tracemalloc.get_traced_memory()
+
+                #the peak is about to be reset, so every running stage keeps the peak it has seen so far
+                for running in _running:
+                    running.peak = max(running.peak, peak)
+                tracemalloc.reset_peak()
+
+                self.start_memory = current
+                self.peak = current
+                _running.append(self)
+
+                #the traced peak is that of the whole process, so it cannot be attributed to threaded stages running at the same time as each other
+                if self.threaded:
+                    for running in _threaded:
+                        running.overlapped = True
+                    self.overlapped = bool(_threaded)
+                    _threaded.append(self)
+
+        self.start_wall = time.perf_counter()
+        self.start_cpu = self.clock()
+
+        return self
+
+
+    def __exit__(self, exception_type, exception, traceback):
+        record = {
+            'stage': self.name,
+            'wall_seconds': time.perf_counter() - self.start_wall,
+            'cpu_seconds': self.clock() - self.start_cpu,
+            'cpu_scope': 'thread' if self.threaded else 'process',
+            'peak_bytes': None,
+            'failed': exception_type is not None
+        }
+        record.update(self.labels)
+
+        with _lock:
+            if _track_memory and self in _running:
+                self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+                _running.remove(self)
+                if self in _threaded:
+                    _threaded.remove(self)
+                if not self.overlapped:
+                    record['peak_bytes'] = self.peak - self.start_memory
+
+            _records.append(record)
+
+        return False
+
+
+'''
+Class used as the 'with' block of every stage while recording is disabled
+'''
+
+class _DisabledStage():
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        return False
+
+
+_DISABLED_STAGE = _DisabledStage()
+
+
+'''
+Starts recording stages
+
+Parameters:
+track_memory (bool) --> whether the peak memory of each stage should be traced with 'tracemalloc'. Default set to True; tracing memory slows down the code being traced
+'''
+
+def enable(track_memory = True):
+    global _enabled, _track_memory, _started_tracing
+
+    #memory tracing that was already started elsewhere, such as by 'Benchmark_Suite', is left running on 'disable'
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+
+    _track_memory = track_memory
+    _enabled = True
+
+
+'''
+Stops recording stages. The stages recorded so far are kept until 'reset' is called
+'''
+
+def disable():
+    global _enabled, _track_memory, _started_tracing
+
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+
+    _enabled = False
+    _track_memory = False
+
+
+'''
+Returns whether stages are being recorded
+
+Return type: bool
+'''
+
+def is_enabled():
+    return _enabled
+
+
+'''
+Returns whether the peak memory of the stages is being traced
+
+Return type: bool
+'''
+
+def is_tracking_memory():
+    return _track_memory
+
+
+'''
+Removes all the recorded stages
+'''
+
+def reset():
+    with _lock:
+        _records.clear()
+
+
+'''
+Returns the 'with' block that records a stage, for example 'with Instrumentation.stage('backtest', ticker = 'AAPL'):'
+
+Parameters:
+name (string) --> the name of the stage
+labels (keyword arguments) --> labels identifying what the stage ran for, such as 'ticker' or 'fold'
+
+Return type: context manager recording the stage, or one doing nothing while recording is disabled
+'''
+
+def stage(name, **labels):
+    if not _enabled:
+        return _DISABLED_STAGE
+
+    return _Stage(name, labels)
+
+
+'''
+Returns the 'with' block that records a stage which may run at the same time as others of its kind on other threads of this process, such as the backtesting periods
+run by 'limit_cores' in 'Model_Builder'. The CPU time and memory of the process are shared by all of these, so the stage records the CPU time of its own thread
+('time.thread_time', which leaves out threads it starts itself, such as those fitting the trees of a forest), and only records its peak memory when no other threaded stage
+ran at the same time
+
+Parameters:
+name (string) --> the name of the stage
+labels (keyword arguments) --> labels identifying what the stage ran for, such as 'ticker' or 'fold'
+
+Return type: context manager recording the stage, or one doing nothing while recording is disabled
+'''
+
+def thread_stage(name, **labels):
+    if not _enabled:
+        return _DISABLED_STAGE
+
+    return _Stage(name, labels, threaded = True)
+
+
+'''
+Returns the recorded stages
+
+Return type: list of dictionaries, each holding the 'stage' name, its 'wall_seconds', 'cpu_seconds', whether the CPU time is that of the 'process' or of the 'thread'
+as 'cpu_scope', 'peak_bytes' (None when memory was not traced or could not be attributed to the stage), whether it 'failed', and its labels
+'''
+
+def records():
+    with _lock:
+        return [dict(record) for record in _records]
+
+
+'''
+Adds stages recorded elsewhere, such as in the worker processes of 'save_all_models', so that a whole fleet run is aggregated and exported together
+
+Parameters:
+new_records (list of dictionaries) --> records in the format returned by 'records'
+'''
+
+def add_records(new_records):
+    with _lock:
+        _records.extend(new_records)
+
+
+'''
+Aggregates the recorded stages by stage name and the input labels
+
+Parameters:
+labels (list of strings) --> the labels to group by along with the stage name. Default set to none, which aggregates each stage across all tickers and folds
+
+Return type: list of dictionaries, each holding the stage name, the grouped labels, the number of 'calls', the 'wall_seconds' and 'cpu_seconds' summed over all calls,
+the largest 'max_wall_seconds' of a single call and the largest 'peak_bytes' of a single call
+'''
+
+def summary(labels = ()):
+    groups = dict()
+
+    for record in records():
+        key = (record['stage'],) + tuple(record.get(label) for label in labels)
+
+        if key not in groups:
+            groups[key] = {'stage': record['stage'], 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'max_wall_seconds': 0.0, 'peak_bytes': None}
+            groups[key].update({label: record.get(label) for label in labels})
+
+        group = groups[key]
+        group['calls'] += 1
+        group['wall_seconds'] += record['wall_seconds']
+        group['cpu_seconds'] += record['cpu_seconds']
+        group['max_wall_seconds'] = max(group['max_wall_seconds'], record['wall_seconds'])
+
+        if record['peak_bytes'] is not None:
+            group['peak_bytes'] = max(group['peak_bytes'] or 0, record['peak_bytes'])
+
+    return sorted(groups.values(), key = lambda group: group['wall_seconds'], reverse = True)
+
+
+'''
+Saves the recorded stages and their summary by stage name as a JSON file
+
+Parameters:
+filename (string) --> the path of the JSON file
+'''
+
+def export_json(filename):
+    with open(filename, 'w') as file:
+        json.dump({'records': records(), 'summary': summary()}, file, indent = 4, default = str)
+
+
+'''
+Saves the recorded stages in the Prometheus text format, for example to be picked up by the textfile collector of node_exporter.
+The stages are aggregated by stage name and ticker; the backtesting periods are summed, as a label for each of them would create too many series
+
+Parameters:
+filename (string) --> the path of the Prometheus text file
+prefix (string) --> the prefix of every metric name. Default set to 'stock_trader'
+'''
+
+def export_prometheus(filename, prefix = 'stock_trader'):
+    groups = summary(labels = ('ticker',))
+    metrics = [
+        ('stage_calls_total', 'counter', 'Number of times each stage ran', 'calls'),
+        ('stage_wall_seconds_total', 'counter', 'Wall time spent in each stage', 'wall_seconds'),
+        ('stage_cpu_seconds_total', 'counter', 'CPU time spent in each stage, by the process or by the thread of threaded stages', 'cpu_seconds'),
+        ('stage_max_wall_seconds', 'gauge', 'Longest wall time of a single run of each stage', 'max_wall_seconds'),
+        ('stage_peak_memory_bytes', 'gauge', 'Largest peak of memory allocated by a single run of each stage', 'peak_bytes')
+    ]
+
+    lines = []
+    for metric, metric_type, description, field in metrics:
+        name = prefix + '_' + metric
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' ' + metric_type)
+
+        for group in groups:
+            if group[field] is None:
+                continue
+
+            labels = 'stage="' + _escape(group['stage']) + '"'
+            if group['ticker'] is not None:
+                labels += ',ticker="' + _escape(group['ticker']) + '"'
+
+            lines.append(name + '{' + labels + '} ' + repr(float(group[field])))
+
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+#escapes a label value as required by the Prometheus text format
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
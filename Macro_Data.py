@@ -1,81 +1,547 @@
+import os
+import pickle
+import threading
+from multiprocessing import shared_memory
 from fredapi import Fred
+import numpy as np
 import pandas as pd
+from Atomic_Files import atomic_write
 
-#IMPORTANT note: to run this file, an API key is needed to be input into line 8 from https://fred.stlouisfed.org/
+#IMPORTANT note: to run this file, an API key is needed to be input into line 11 from https://fred.stlouisfed.org/
 
 #storing all Fred data using an api key from the St. Louis Federal Reserve's website
-#important note: to run this file, need to add your own api key as a string within the brackets
-fred = Fred(api_key = '')
+#important note: to run this file, need to add your own api key as a string
+api_key = ''
 
 #listing off the column names for the equivalent data keys from the Fred api
 series_ids = {
-    '3-Month Treasury Yield': 'TB3MS',  
-    'CPI': 'CPIAUCSL',  
-    'Home Sales': 'HSN1F',  
-    'Unemployment Rate': 'UNRATE'  
+    '3-Month Treasury Yield': 'TB3MS',
+    'CPI': 'CPIAUCSL',
+    'Home Sales': 'HSN1F',
+    'Unemployment Rate': 'UNRATE'
 }
 
-#storing the data for each individual key in a new dictionary
-data_frames = {}
-for name, series_id in series_ids.items():
-    data = fred.get_series(series_id)
-    data_frames[name] = data
-
-#creating a joined Pandas DataFrame for all four macroeconomic factors' datasets
-macro_data = pd.DataFrame(data_frames)
-
-#slicing the DataFrame to get rid of the unnecessary years worth of data
+#slicing the data to get rid of the unnecessary years worth of data
 start_date = '1985-01-01'
-macro_data = macro_data[macro_data.index >= start_date]
-
-#initializing a temporary DataFrame so that features can be derived
-temp = macro_data.copy()
 
 #initializing some time horizons for the macroeconomic features to be derived; note that Fred's data is reported monthly,
 #so the time horizons represent months, not days
 horizons = [2, 6, 12, 24, 48]
 metrics = ['3-Month Treasury Yield', 'CPI', 'Home Sales', 'Unemployment Rate']
 
-#looping through each metric and determining if there was an increase from the previous month, represented by a binary value
-#a column called 'DTD_Increase' is added for each metric to signify this increase
-for metric in metrics:
-    temp['Yesterday_' + metric] = temp[metric].shift(1)
-    temp[metric + '_DTD_Increase'] = (temp[metric] > temp['Yesterday_' + metric]).astype(int)
-    macro_data[metric + '_DTD_Increase'] = temp[metric + '_DTD_Increase']
-
-#nested for loop to create moving averages and trends for each time horizon and each macroeconomic feature;
-#process is similar to that of the function 'derive_features' in 'Model_Builder'
-#each time a feature is derived in the temporary DataFrame, it is copied over to the actual DataFrame, macro_data
-for horizon in horizons:
-    for metric in metrics:
-        rolling_average = macro_data.rolling(horizon).mean()
-        ratio_column = metric + '_Ratio_Last_' + str(horizon) + '_Months'
-        macro_data[ratio_column] = macro_data[metric] / rolling_average[metric]
-
-        trend = macro_data.shift(1).rolling(horizon).sum()[metric + '_DTD_Increase']
-        trend_column = metric + '_Last_' + str(horizon) + '_Months_Trend'
-        macro_data[trend_column] = trend
-
-#adjusting the macro_data to have values for each day. This is necessary in order to properly combine it with the instance variable datasets for each model,
-#as their values are reported for each trading day. Since Fred data is adjusted only monthly instead of daily, each day's increase or decrease is relative to
-#the most recent report given by the Fred, not necessarily the DTD increase. ffill() accomplishes this purpose
-macro_data = macro_data.resample('D').ffill()
-macro_data.ffill(inplace = True)
-
-#adjusts the timezone format of the DataFrame's index so it is compatible to be merged with the instance variable's DataFrames
-macro_data.index = macro_data.index.tz_localize(None)
-
-#removes the unnecessary columns from the DataFrame
-del macro_data['3-Month Treasury Yield']
-del macro_data['CPI']
-del macro_data['Home Sales']
-del macro_data['Unemployment Rate']
-del macro_data['3-Month Treasury Yield_DTD_Increase']
-del macro_data['CPI_DTD_Increase']
-del macro_data['Home Sales_DTD_Increase']
-del macro_data['Unemployment Rate_DTD_Increase']
-
-#removes the unnecessary rows from the DataFrame
-macro_data = macro_data.loc['1990-01-01':'2024-04-30']
-
-#macro_data is what is stored as the class variable 'macro_data' in 'Model_Builder'
\ No newline at end of file
+#the downloaded series and the derived features are cached in this file, and are downloaded again once the cache is older than 'max_age'
+cache_filename = 'Macro_Cache.pkl'
+cache_directory = ''
+max_age = pd.Timedelta(days = 1)
+
+#the Fred client and the derived features are only created the first time they are needed, so importing this module does not access the network or the disk.
+#the monthly features are what the models and predictions use; the features expanded to a row for each day are only built when 'macro_data' is accessed
+_client = None
+_macro_data = None
+_series = None
+_monthly = None
+_lock = threading.Lock()
+
+#the monthly features as a 'MacroMatrix', and the block of shared memory holding them while a training pool is running, see 'share_macro_matrix'
+_matrix = None
+_shared = None
+
+
+'''
+Replaces the client used to download the macroeconomic series. Any object with a 'get_series' method matching that of fredapi's 'Fred' class can be used,
+which allows the features to be built from a local stand-in instead of the Fred api. The features held in memory are cleared so they are rebuilt with the new client
+
+Parameters:
+client (object) --> the client used to download the series
+'''
+
+def set_client(client):
+    global _client, _macro_data, _series, _monthly, _matrix
+
+    with _lock:
+        _client = client
+        _macro_data = None
+        _series = None
+        _monthly = None
+        _matrix = None
+
+
+'''
+Returns the client used to download the macroeconomic series, creating a Fred client with the api key on first use
+
+Return type: fredapi Fred, or the client passed to 'set_client'
+'''
+
+def get_client():
+    global _client
+
+    if _client is None:
+        _client = Fred(api_key = api_key)
+
+    return _client
+
+
+'''
+Downloads the macroeconomic series. When previously downloaded series are given, only the observations from the last cached date onwards are requested for each series,
+and these replace the cached observations on the same dates
+
+Parameters:
+client (object) --> the client used to download the series, see 'get_client'
+cached (Pandas DataFrame) --> the previously downloaded series, with one column per name in 'series_ids'. Default set to None, which downloads every series in full
+
+Return type: Pandas DataFrame holding all four macroeconomic series from 'start_date' onwards
+'''
+
+def download_series(client, cached = None):
+    #storing the data for each individual key in a new dictionary
+    data_frames = {}
+    for name, series_id in series_ids.items():
+        if cached is None or name not in cached or cached[name].dropna().empty:
+            data_frames[name] = client.get_series(series_id)
+        else:
+            previous = cached[name].dropna()
+            new = client.get_series(series_id, observation_start = previous.index[-1].strftime('%Y-%m-%d'))
+            data_frames[name] = pd.concat([previous[previous.index < new.index[0]], new]) if len(new) else previous
+
+    #creating a joined Pandas DataFrame for all four macroeconomic factors' datasets
+    series = pd.DataFrame(data_frames)
+    series = series[series.index >= start_date]
+
+    return series
+
+
+'''
+Derives the macroeconomic features from the downloaded series. For each metric and time horizon, two features are derived: the ratio of the month's value to its moving average,
+and the trend, which is the number of increases from one month to the next during the months before the current one.
+
+Every metric and time horizon is derived at once on the monthly values: cumulative sums of the values, of the missing values and of the monthly increases are taken once,
+and each rolling window is the difference of two rows of these sums. This means adding metrics or horizons only adds the work of their own columns.
+The features are only expanded to daily values by 'derive_features' once they have all been derived, and only for 'get_macro_data'
+
+Parameters:
+series (Pandas DataFrame) --> the series returned by 'download_series'
+feature_metrics (list of strings) --> the columns of the series to derive features for. Default set to the module variable 'metrics'
+feature_horizons (list of ints) --> the time horizons, in months, to derive features for. Default set to the module variable 'horizons'
+
+Return type: Pandas DataFrame holding a row for each month of the series, with a column for each moving average ratio and trend
+'''
+
+def derive_monthly_features(series, feature_metrics = None, feature_horizons = None):
+    feature_metrics = metrics if feature_metrics is None else feature_metrics
+    feature_horizons = horizons if feature_horizons is None else feature_horizons
+
+    #values has a row for each month and a column for each metric
+    values = series[feature_metrics].to_numpy(dtype = np.float64)
+    num_months, num_metrics = values.shape
+    missing = np.isnan(values)
+
+    #determines if there was an increase from the previous month for each metric, represented by a binary value; a missing value never counts as an increase
+    increases = np.zeros(values.shape)
+    increases[1:] = values[1:] > values[:-1]
+
+    #cumulative sums with a leading row of zeros, so that the sum of any window of months is the difference of two rows
+    first_row = np.zeros((1, num_metrics))
+    value_sums = np.concatenate([first_row, np.cumsum(np.where(missing, 0.0, values), axis = 0)])
+    missing_sums = np.concatenate([first_row, np.cumsum(missing, axis = 0)])
+    increase_sums = np.concatenate([first_row, np.cumsum(increases, axis = 0)])
+
+    #the window of each time horizon ending at each month, with a row for each time horizon and a column for each month
+    window = np.array(feature_horizons)[:, None]
+    ends = np.arange(1, num_months + 1)[None, :]
+    starts = np.clip(ends - window, 0, None)
+
+    #the moving average ratio is only available when the window has a full time horizon of months without missing values
+    complete = ((ends - window) >= 0)[:, :, None] & (missing_sums[ends] - missing_sums[starts] == 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        averages = (value_sums[ends] - value_sums[starts]) / window[:, :, None]
+        ratios = np.where(complete, values[None, :, :] / averages, np.nan)
+
+    #the trend counts the increases during the time horizon ending the month before, so it needs one more month of data than the moving average
+    previous_ends = ends - 1
+    previous_starts = np.clip(previous_ends - window, 0, None)
+    trends = np.where(((previous_ends - window) >= 0)[:, :, None], increase_sums[previous_ends] - increase_sums[previous_starts], np.nan)
+
+    #orders the columns by time horizon, then by metric, with the ratio before the trend
+    features = np.stack([ratios, trends], axis = 3).transpose(1, 0, 2, 3).reshape(num_months, -1)
+    columns = []
+    for horizon in feature_horizons:
+        for metric in feature_metrics:
+            columns.append(metric + '_Ratio_Last_' + str(horizon) + '_Months')
+            columns.append(metric + '_Last_' + str(horizon) + '_Months_Trend')
+
+    macro_data = pd.DataFrame(features, index = series.index, columns = columns)
+
+    #a month missing a report keeps the features of the month before it
+    macro_data.ffill(inplace = True)
+
+    #adjusts the timezone format of the DataFrame's index so it is compatible to be merged with the instance variable's DataFrames
+    macro_data.index = macro_data.index.tz_localize(None)
+
+    return macro_data
+
+
+'''
+Derives the macroeconomic features with 'derive_monthly_features' and expands them to a row for each day
+
+Parameters:
+series (Pandas DataFrame) --> the series returned by 'download_series'
+feature_metrics (list of strings) --> the columns of the series to derive features for. Default set to the module variable 'metrics'
+feature_horizons (list of ints) --> the time horizons, in months, to derive features for. Default set to the module variable 'horizons'
+
+Return type: Pandas DataFrame holding a row for each day from January 1st, 1990 onwards, with a column for each moving average ratio and trend
+'''
+
+def derive_features(series, feature_metrics = None, feature_horizons = None):
+    return _expand_to_days(derive_monthly_features(series, feature_metrics, feature_horizons))
+
+
+#expands the monthly features to a row for each day from January 1st, 1990 onwards
+def _expand_to_days(macro_data):
+    #adjusting the macro_data to have values for each day. This is necessary in order to properly combine it with the instance variable datasets for each model,
+    #as their values are reported for each trading day. Since Fred data is adjusted only monthly instead of daily, each day's increase or decrease is relative to
+    #the most recent report given by the Fred, not necessarily the DTD increase. ffill() accomplishes this purpose
+    macro_data = macro_data.resample('D').ffill()
+
+    #removes the unnecessary rows from the DataFrame; the models themselves decide which dates they train on
+    macro_data = macro_data.loc['1990-01-01':]
+
+    return macro_data
+
+
+'''
+Loads the cache written by 'load_series'
+
+Return type: dictionary holding the time of the download under 'downloaded', the downloaded series under 'series' and the monthly features derived from them under 'monthly',
+or None if no cache exists yet
+'''
+
+def load_cache():
+    filepath = os.path.join(cache_directory, cache_filename)
+
+    if not os.path.exists(filepath):
+        return None
+
+    with open(filepath, 'rb') as file:
+        return pickle.load(file)
+
+
+'''
+Saves the cache of the downloaded series and monthly features with 'atomic_write' in 'Atomic_Files'
+
+Parameters:
+cache (dictionary) --> the cache to save, in the format returned by 'load_cache'
+'''
+
+def save_cache(cache):
+    if cache_directory and not os.path.exists(cache_directory):
+        os.makedirs(cache_directory)
+
+    atomic_write(os.path.join(cache_directory, cache_filename), lambda file: pickle.dump(cache, file))
+
+
+'''
+Loads the macroeconomic series and derives their monthly features on first use. Both are kept in memory afterwards, so each process reads the cache from disk at most once.
+If the cache is older than 'max_age', only the newer observations are downloaded and the features are derived again. If the download fails, the cached series and features
+are used anyway so that models can still be built without a network connection
+
+Parameters:
+full_refresh (bool) --> whether every series should be downloaded again in full, which also picks up revisions Fred made to past observations. Default set to False
+
+Return type: Pandas DataFrame holding the series returned by 'download_series'
+'''
+
+def load_series(full_refresh = False):
+    with _lock:
+        if _series is not None and not full_refresh:
+            return _series
+
+        cache = load_cache()
+
+        if cache is not None and not full_refresh and pd.Timestamp.now() - cache['downloaded'] <= max_age:
+            _use_cache(cache)
+            return _series
+
+        try:
+            series = download_series(get_client(), None if cache is None or full_refresh else cache['series'])
+        except Exception:
+            if cache is None:
+                raise
+            _use_cache(cache)
+            return _series
+
+        cache = {'downloaded': pd.Timestamp.now(), 'series': series, 'monthly': derive_monthly_features(series)}
+        save_cache(cache)
+        _use_cache(cache)
+
+        return _series
+
+
+#holds the series and monthly features of a cache in memory, dropping the daily features built from the previous ones; caches written before the monthly features
+#were cached only hold the daily features, so their monthly features are derived again from the series
+def _use_cache(cache):
+    global _series, _monthly, _macro_data
+
+    _series = cache['series']
+    _monthly = cache['monthly'] if 'monthly' in cache else derive_monthly_features(cache['series'])
+    _macro_data = None
+
+
+'''
+Returns the macroeconomic features expanded to a row for each day, building them from the monthly features the first time they are asked for. The models and predictions only
+use the monthly features through 'asof_join', so the daily features are only built when 'macro_data' is accessed, for example as 'Model.macro_data' in 'Model_Builder'
+
+Parameters:
+full_refresh (bool) --> whether every series should be downloaded again in full, see 'load_series'. Default set to False
+
+Return type: Pandas DataFrame holding the values for rolling averages and trends in CPI, unemployment, interest rates, and home sales
+'''
+
+def get_macro_data(full_refresh = False):
+    global _macro_data
+
+    load_series(full_refresh)
+
+    with _lock:
+        if _macro_data is None:
+            _macro_data = _expand_to_days(_monthly)
+
+        return _macro_data
+
+
+'''
+Class holding the monthly macroeconomic features as a read-only matrix along with the date of each row, so that trading days can be joined to the latest report made on or before them
+by binary search instead of through a row for every day. The matrix can be placed in shared memory with 'share', and attached to by other processes with 'attach' without copying it
+
+Parameters:
+dates (NumPy array) --> the date of each row as int64 nanoseconds, in increasing order
+values (NumPy array) --> the float64 matrix of the features, with a row for each date
+columns (list of strings) --> the name of each column of values
+block (SharedMemory) --> the block of shared memory that dates and values are views of, which is kept open for as long as the matrix is used. Default set to None, for a matrix in ordinary memory
+'''
+
+class MacroMatrix():
+
+    '''
+    Instance variables:
+    dates (NumPy array) --> holds the read-only date of each row as int64 nanoseconds
+    values (NumPy array) --> holds the read-only matrix of the features
+    columns (list of strings) --> holds the name of each column
+    block (SharedMemory) --> holds the block of shared memory the arrays are views of, or None
+    '''
+
+    def __init__(self, dates, values, columns, block = None):
+        self.dates = dates
+        self.values = values
+        self.columns = list(columns)
+        self.block = block
+
+        self.dates.flags.writeable = False
+        self.values.flags.writeable = False
+
+
+    '''
+    Creates the matrix from a DataFrame of features indexed by date, such as the one returned by 'derive_monthly_features'
+
+    Parameters:
+    frame (Pandas DataFrame) --> the features, indexed by date in increasing order
+
+    Return type: MacroMatrix
+    '''
+
+    @classmethod
+    def from_frame(cls, frame):
+        dates = frame.index.to_numpy(dtype = 'datetime64[ns]').view(np.int64).copy()
+        values = np.ascontiguousarray(frame.to_numpy(dtype = np.float64))
+
+        return cls(dates, values, frame.columns)
+
+
+    '''
+    Copies the matrix into a new block of shared memory, with the dates at the start of the block followed by the values
+
+    Return type: tuple of the MacroMatrix backed by the block, and the handle other processes pass to 'attach', a dictionary holding the 'name' of the block,
+    the number of 'rows' and the 'columns'
+    '''
+
+    def share(self):
+        handle = {'name': None, 'rows': len(self.dates), 'columns': self.columns}
+        block = shared_memory.SharedMemory(create = True, size = max(1, self.dates.nbytes + self.values.nbytes))
+        handle['name'] = block.name
+
+        dates, values = _block_arrays(block, handle)
+        dates[:] = self.dates
+        values[:] = self.values
+
+        return MacroMatrix(dates, values, self.columns, block), handle
+
+
+    '''
+    Attaches to a matrix shared by 'share' in another process. The arrays are views of the shared block, so nothing is copied
+
+    Parameters:
+    handle (dictionary) --> the handle returned by 'share'
+
+    Return type: MacroMatrix
+    '''
+
+    @classmethod
+    def attach(cls, handle):
+        block = shared_memory.SharedMemory(name = handle['name'])
+        dates, values = _block_arrays(block, handle)
+
+        return cls(dates, values, handle['columns'], block)
+
+
+    '''
+    Joins the input dates to the latest row of features on or before each of them, which gives the same values as merging with the features expanded to every day
+    and forward filling. Dates before the first row are given NaN, and dates after the last row are given the last row
+
+    Parameters:
+    index (Pandas DatetimeIndex) --> the dates to join, such as the trading days of a ticker. The timezone, if any, is ignored
+
+    Return type: Pandas DataFrame indexed by the input dates, with a column for each feature
+    '''
+
+    def asof(self, index):
+        dates = pd.DatetimeIndex(index)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+
+        positions = np.searchsorted(self.dates, dates.to_numpy(dtype = 'datetime64[ns]').view(np.int64), side = 'right') - 1
+        rows = self.values[np.clip(positions, 0, None)] if len(self.dates) else np.full((len(positions), len(self.columns)), np.nan)
+        rows[positions < 0] = np.nan
+
+        return pd.DataFrame(rows, index = index, columns = self.columns)
+
+
+    '''
+    Closes this process' view of the shared block. The block itself stays available to other processes until 'unlink' is called by the process that shared it
+    '''
+
+    def close(self):
+        if self.block is not None:
+            self.dates = self.values = None
+            self.block.close()
+            self.block = None
+
+
+#views the dates and values of a matrix in a block of shared memory, as described by the handle returned by 'share'
+def _block_arrays(block, handle):
+    rows, num_columns = handle['rows'], len(handle['columns'])
+    dates = np.ndarray((rows,), dtype = np.int64, buffer = block.buf)
+    values = np.ndarray((rows, num_columns), dtype = np.float64, buffer = block.buf, offset = rows * 8)
+
+    return dates, values
+
+
+'''
+Returns the monthly macroeconomic features from January 1st, 1990 onwards, the same range as 'get_macro_data' but without a row for every day
+
+Return type: Pandas DataFrame holding a row for each month, with the same columns as 'get_macro_data'
+'''
+
+def get_monthly_features():
+    load_series()
+
+    return _monthly.loc['1990-01-01':]
+
+
+'''
+Returns the monthly macroeconomic features as a 'MacroMatrix', building it on first use. In a worker process of a training pool, this is the matrix attached to
+with 'attach_macro_matrix', so the features are never loaded or derived again
+
+Return type: MacroMatrix
+'''
+
+def get_macro_matrix():
+    global _matrix
+
+    if _matrix is None:
+        matrix = MacroMatrix.from_frame(get_monthly_features())
+        with _lock:
+            if _matrix is None:
+                _matrix = matrix
+
+    return _matrix
+
+
+'''
+Joins the input dates to the latest monthly macroeconomic features reported on or before each of them, see 'asof' of 'MacroMatrix'
+
+Parameters:
+index (Pandas DatetimeIndex) --> the dates to join, such as the trading days of a ticker
+
+Return type: Pandas DataFrame indexed by the input dates, with the same columns as 'get_macro_data'
+'''
+
+def asof_join(index):
+    return get_macro_matrix().asof(index)
+
+
+'''
+Places the macroeconomic features of this process in shared memory, so that worker processes can attach to them with 'attach_macro_matrix' instead of each
+loading and deriving their own copy. 'release_macro_matrix' must be called once the workers have finished
+
+Return type: dictionary holding the handle passed to 'attach_macro_matrix'
+'''
+
+def share_macro_matrix():
+    global _matrix, _shared
+
+    release_macro_matrix()
+    _matrix, handle = get_macro_matrix().share()
+    _shared = _matrix.block
+
+    return handle
+
+
+'''
+Attaches this process to the macroeconomic features shared by 'share_macro_matrix' in another process, which are then used by 'asof_join' and 'get_macro_matrix'
+
+Parameters:
+handle (dictionary) --> the handle returned by 'share_macro_matrix'
+'''
+
+def attach_macro_matrix(handle):
+    global _matrix
+
+    _matrix = MacroMatrix.attach(handle)
+
+
+'''
+Removes the block of shared memory created by 'share_macro_matrix'. This process keeps using a copy of the features in ordinary memory
+'''
+
+def release_macro_matrix():
+    global _matrix, _shared
+
+    if _shared is None:
+        return
+
+    #the arrays of the shared matrix are views of the block, so they are copied before the block is closed
+    if _matrix is not None and _matrix.block is _shared:
+        shared_matrix = _matrix
+        _matrix = MacroMatrix(shared_matrix.dates.copy(), shared_matrix.values.copy(), shared_matrix.columns)
+        shared_matrix.close()
+
+    _shared.close()
+    _shared.unlink()
+    _shared = None
+
+
+'''
+Allows 'macro_data' to still be accessed as a module variable (for example 'Macro_Data.macro_data'), while only building it the first time it is accessed
+
+Parameters:
+name (string) --> the name of the module variable being accessed
+
+Return type: Pandas DataFrame returned by 'get_macro_data' when 'macro_data' is accessed
+'''
+
+def __getattr__(name):
+    if name == 'macro_data':
+        return get_macro_data()
+
+    raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name))
+
+#macro_data is what is stored as the class variable 'macro_data' in 'Model_Builder'
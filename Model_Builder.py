@@ -1,112 +1,263 @@
-import yfinance as yf
+import os
+import contextlib
+import numpy as np
 import pandas as pd
+import sklearn
 import Macro_Data as md
-from sklearn.ensemble import RandomForestClassifier
+import Backtest_Cache
+import Price_Store
+import Feature_Engine
+import Instrumentation
+from Forest_Predictor import ArrayForest
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.metrics import precision_score
 
+#the largest batch of rows scored by the flattened model; 'Benchmark_Forest_Predictor' shows scikit-learn overtaking it at around a couple hundred rows
+FOREST_MAX_ROWS = 128
+
+#the estimators a model can be built with, by name. Each backend is a function taking the number of trees and the number of leaves and returning an unfitted classifier
+#with 'fit' and 'predict_proba'; more can be added with 'register_backend'
+BACKENDS = {
+    #the original estimator of the project. min_samples_split is the minimum number of rows a node needs to be split
+    'random_forest': lambda num_trees, num_leaves: RandomForestClassifier(n_estimators = num_trees, min_samples_split = num_leaves, random_state = 1),
+
+    #bins every predictor into at most 255 values before fitting and grows each tree with OpenMP threads, so each tree is much faster to grow than an exact-split tree.
+    #the trees are boosted one after another rather than averaged, and early stopping is turned off so every backtesting period fits the same number of trees
+    'hist_gradient_boosting': lambda num_trees, num_leaves: HistGradientBoostingClassifier(max_iter = num_trees, min_samples_leaf = num_leaves, early_stopping = False, random_state = 1)
+}
+
+
+'''
+Adds an estimator that models can be built with
+
+Parameters:
+name (string) --> the name the backend is chosen by, passed as the backend of 'Model'
+factory (function) --> function taking the number of trees and the number of leaves, and returning an unfitted classifier with 'fit' and 'predict_proba'
+'''
+
+def register_backend(name, factory):
+    BACKENDS[name] = factory
+
+
+'''
+Creates the unfitted estimator of a backend
+
+Parameters:
+backend (string) --> the name of the backend, one of the keys of BACKENDS
+num_trees (int) --> the number of trees; the number of boosting iterations for 'hist_gradient_boosting'
+num_leaves (int) --> the minimum number of rows a node needs to be split; the minimum number of rows of a leaf for 'hist_gradient_boosting'
+
+Return type: unfitted scikit-learn classifier
+'''
+
+def make_estimator(backend, num_trees, num_leaves):
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend ' + repr(backend) + '; the backends are ' + ', '.join(BACKENDS))
+
+    return BACKENDS[backend](num_trees, num_leaves)
+
+
+'''
+Flattens a fitted model with 'Forest_Predictor' when it is a random forest, the only kind of model 'ArrayForest' can score
+
+Parameters:
+model (scikit-learn classifier) --> the fitted model
+
+Return type: ArrayForest, or None for any other kind of model, which is then always scored by the model itself
+'''
+
+def flatten_model(model):
+    if isinstance(model, RandomForestClassifier):
+        return ArrayForest.from_sklearn(model)
+
+    return None
+
+
+'''
+Loads ticker data from the price store in 'Price_Store' and preprocesses it so the machine learning model can use it. Used by 'Model', and by 'ModelSearch' and 'PanelModel'
+so that their data is loaded the same way
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock for which a model should be built. Needs to be accessible on yahoo finance or already stored, else a ValueError is raised
+refresh (bool) --> whether the newest price data should be downloaded into the price store first. Default set to True
+
+Return type: Pandas DataFrame, which is stored in the instance variable data of 'Model'
+'''
+
+def prepare_data(ticker, refresh = True):
+    
+    #ensures the input value is of type string
+    if not isinstance(ticker, str):
+        raise ValueError('Ticker must be a string')
+    
+    #tries to load the data to ensure that it is accessible on yahoo finance or in the price store; the stored data only holds the necessary columns
+    try:
+        data = Price_Store.get_history(ticker, refresh = refresh)
+        if data.empty:
+            raise ValueError('No data for the given ticker')
+    except Exception:
+        raise ValueError('Could not retrieve data for the given ticker')
+    
+    #creates a new column, 'Tomorrow', which allows for another new column, 'Target', to determine if the price increased from day to day.
+    #'Target' will be fed into the machine learning model as the value we are trying to predict
+    data['Tomorrow'] = data['Close'].shift(-1)
+    data['Target'] = (data['Tomorrow'] > data['Close']).astype(int)
+
+    return data
+
+
+'''
+Selects the range of data a model is trained and backtested on, after checking that there is enough of it. Used by 'split_sets' of 'Model', and by 'ModelSearch' and 'PanelModel'
+so that they use the same range
+
+Parameters:
+full_data (Pandas DataFrame) --> the price and macroeconomic features of a ticker, indexed by date
+
+Return type: Pandas DataFrame holding the rows from January 1st, 1990 to April 30th, 2024. Raises a ValueError if the data starts in 1995 or later
+'''
+
+def training_range(full_data):
+    #checks if the first year of the data is prior to 1995; if it is not, raises a ValueError that there will not be enough data to adequately train a model on
+    if full_data.index[0].year >= 1995:
+        raise ValueError('Not enough data for this ticker to train a model')
+
+    return full_data.loc['1990-01-01':'2024-04-30']
+
+
+'''
+Descriptor used for the class variables of 'Model' that hold the macroeconomic data, so that the data is built on first access instead of when this module is imported
+
+Parameters:
+getter (function) --> function without parameters that returns the value of the class variable
+'''
+
+class _MacroAttribute():
+
+    def __init__(self, getter):
+        self.getter = getter
+
+    def __get__(self, instance, owner):
+        return self.getter()
+
+
 '''
 Class used to create the prediction models for individual stocks
 
 Parameters:
 ticker (string) --> represents the ticker for which a model will be created
-num_trees (int) --> represents the number of trees that the Random Forest Classifier model will create for the given ticker. Default set to 300
+num_trees (int) --> represents the number of trees that the Random Forest Classifier model will create for the given ticker, or the number of boosting iterations of 'hist_gradient_boosting'. Default set to 300
 num_leaves (int) --> represents the minimum number of leaves a decision tree node can have. Default set to 50
 horizon1, horizon2, horizon3, horizon4, horizon5 (int) --> time horizons used in the creation of the rolling averages for price and rolling trends of increases. Defaults set to 2, 5, 60, 250, 1000
+n_jobs (int) --> the number of cores the backtest may use, shared between backtesting periods running at the same time and the trees within each period. Default set to 1, -1 uses all cores
+cache_directory (string) --> where the results of individual backtesting periods are cached, so that rebuilding the model only computes the periods whose inputs changed. Default set to None, meaning no caching
+refresh_data (bool) --> whether the newest price data should be downloaded into the price store before building the model. Default set to True; set to False to build the model offline from the stored data
+low_memory (bool) --> whether the model should be trained from one contiguous float32 matrix of the predictors, which every backtesting period uses without copying, instead of from
+copies of the DataFrame. The DataFrames that are no longer needed are dropped, so only the 'Target' column of full_data is kept and data, both_sets, training_set and testing_set are None.
+The predictions of the 'random_forest' backend are the same either way, as it converts its inputs to float32 regardless; 'hist_gradient_boosting' bins its inputs at full precision,
+so its predictions may differ slightly. Cannot be combined with cache_directory. Default set to False
+backend (string) --> the estimator the model is built with, one of the keys of BACKENDS: 'random_forest' or 'hist_gradient_boosting'. Default set to 'random_forest'
+threshold (float) --> the probability of a price increase above which the model predicts an increase. Default set to 0.6; 'Threshold_Sweep' finds the threshold best suited to each ticker
+from the saved backtests, without building the model again
 '''
 
 class Model():
     
     '''
     Class variables:
-    macro_data (Pandas DataFrame) --> holds the values for rolling averages and trends in CPI, unemployment, interest rates, and home sales
+    macro_data (Pandas DataFrame) --> holds the values for rolling averages and trends in CPI, unemployment, interest rates, and home sales, with a row for every day
     macro_predictors (list of string values) --> holds the column headers for the different predictors created
+
+    Both class variables are only built from 'Macro_Data' the first time they are accessed, so importing this module does not download the macroeconomic data.
+    The models themselves join the monthly features onto their trading days with 'asof_join' of 'Macro_Data', so macro_predictors is taken from the monthly features as well;
+    in a worker process of the training pool, these are shared with the main process instead of being loaded again
     '''
 
-    macro_data = md.macro_data
-    macro_predictors = macro_data.columns
+    macro_data = _MacroAttribute(lambda: md.get_macro_data())
+    macro_predictors = _MacroAttribute(lambda: pd.Index(md.get_macro_matrix().columns))
     
 
     '''
     Instance variables:
+    ticker (string) --> holds the ticker the model was built for
     data (Pandas DataFrame) --> holds the instance data of rolling averages and trends based on the input ticker's recent price data
+    horizons (list of ints) --> holds the time horizons that the price features were derived for
     predictors (list of string values) --> holds the column names for the data variable as well as the class variable, macro_predictors
     full_data (Pandas DataFrame) --> holds the instance data along with the class variable, macro_data, in one DataFrame
     both_sets (list of Pandas DataFrame values) --> holds the full_data instance variable sliced into two groups, one for training and the other for testing
     training_set (Pandas DataFrame) --> holds the training set
     testing_set (Pandas DataFrame) --> holds the testing set
-    model (RandomForestClassifier) --> pointer to a variable of instance RandomForestClassifier which holds the final machine-learning model
+    model (RandomForestClassifier) --> pointer to a variable of instance RandomForestClassifier, or of the estimator of the chosen backend, which holds the final machine-learning model
+    backend (string) --> holds the name of the backend the model was built with
+    threshold (float) --> holds the probability above which the model predicts a price increase
     predictions (list of float values) --> holds the model's percentage predictions of backtesting on the ten most recent years of data for the ticker
     precision_score (float) --> holds the model's precision score, calculated using the instance variable predictions
+    forest (ArrayForest) --> holds the final model flattened into arrays by 'Forest_Predictor', used to score small batches of new data quickly, or None if the backend is not a random forest
+    features (NumPy array) --> holds the float32 matrix of the predictors when low_memory is set, and None otherwise
+    target (NumPy array) --> holds the 'Target' column as an array when low_memory is set, and None otherwise
     '''
 
-    def __init__(self, ticker, num_trees = 300, num_leaves = 50, horizon1 = 2, horizon2 = 5, horizon3 = 60, horizon4 = 250, horizon5 = 1000):
-        self.data = self.prepare_data(ticker)
+    def __init__(self, ticker, num_trees = 300, num_leaves = 50, horizon1 = 2, horizon2 = 5, horizon3 = 60, horizon4 = 250, horizon5 = 1000, n_jobs = 1, cache_directory = None, refresh_data = True, low_memory = False, backend = 'random_forest', threshold = 0.6):
+        if low_memory and cache_directory is not None:
+            raise ValueError('low_memory cannot be combined with cache_directory')
+
+        self.ticker = ticker
+        self.backend = backend
+        self.threshold = threshold
+        self.features = None
+        self.target = None
+
+        #each step is recorded as a stage by 'Instrumentation' when it is enabled, and costs nothing otherwise
+        with Instrumentation.stage('prepare_data', ticker = ticker):
+            self.data = prepare_data(ticker, refresh_data)
         
         #as part of derive_features, macro_predictors are added to the predictors list for the model to consider
-        self.predictors = self.derive_features(horizon1, horizon2, horizon3, horizon4, horizon5)
+        with Instrumentation.stage('derive_features', ticker = ticker):
+            self.predictors = self.derive_features(horizon1, horizon2, horizon3, horizon4, horizon5)
 
-        #merges the instance variable's DataFrame with the class' macro_data; merge from left necessary to adjust macro_data to only include trading days
-        self.full_data = pd.merge(self.data, Model.macro_data, left_index = True, right_index = True, how = 'left')
+        #joins each trading day of the instance variable's DataFrame to the latest monthly macroeconomic features reported on or before it, which gives the same values
+        #as merging with the class' macro_data from the left, without a row for every day
+        with Instrumentation.stage('macro_merge', ticker = ticker):
+            self.full_data = pd.concat([self.data, md.asof_join(self.data.index)], axis = 1)
         
         #training set is stored in index zero of the list, testing set is stored in index one
         self.both_sets = self.split_sets()
         self.training_set = self.both_sets[0]
         self.testing_set = self.both_sets[1]
 
-        #RandomForestClassifier models are instantiated based on default parameters of 300 trees and a minimum of 50 leaves per node. 
+        #RandomForestClassifier models are instantiated based on default parameters of 300 trees and a minimum of 50 leaves per node, unless another backend is chosen.
         #random_state is set to 1 to ensure the initial seed used to create the trees stays consistent; this is done for repeatability of results
-        self.model = RandomForestClassifier(n_estimators = num_trees, min_samples_split = num_leaves, random_state = 1)
-
-        self.predictions = self.backtest(self.full_data, self.model, self.predictors)
+        self.model = make_estimator(backend, num_trees, num_leaves)
+
+        if low_memory:
+            #the predictors are copied once into a contiguous float32 matrix, after which only the index and 'Target' of the DataFrames are kept
+            self.features = np.ascontiguousarray(self.full_data[self.predictors].to_numpy(dtype = np.float32))
+            self.target = self.full_data['Target'].to_numpy()
+            self.full_data = self.full_data[['Target']]
+            self.data = None
+            self.both_sets = self.training_set = self.testing_set = None
+
+            with Instrumentation.stage('backtest', ticker = ticker):
+                self.predictions = self.backtest_matrix(self.features, self.target, self.full_data.index, self.model, n_jobs = n_jobs)
+        else:
+            #backtesting periods computed by a previous build with the same inputs are loaded from the cache instead of being refit
+            cache = Backtest_Cache.FoldCache(cache_directory) if cache_directory is not None else None
+            with Instrumentation.stage('backtest', ticker = ticker):
+                self.predictions = self.backtest(self.full_data, self.model, self.predictors, n_jobs = n_jobs, cache = cache)
         
         #precision_score is used instead of accuracy as the models generated are meant to trade only on price upswings,
-        #as the necessary percentage value for the model to consider its prediction to be an increase is set to 60% instead of the standard 50%
+        #as the necessary percentage value for the model to consider its prediction to be an increase is set to 60% by default instead of the standard 50%
         self.precision_score = precision_score(self.predictions['Target'], self.predictions['Predictions'])
 
+        #the final model is fit by the last backtesting period, so it can be flattened for fast scoring of new data from here on
+        self.forest = flatten_model(self.model)
 
-    '''
-    Downloads and preprocesses ticker data so the machine learning model can use it.
-
-    Parameters:
-    ticker (string) --> the yahoo finance ticker of the stock for which a model should be built. Needs to be accessible on yahoo finance, else a ValueError is raised
-
-    Return type: Pandas DataFrame, which is stored in the instance variable data
-    '''
-
-    def prepare_data(self, ticker):
-        
-        #ensures the input value is of type string
-        if not isinstance(ticker, str):
-            raise ValueError('Ticker must be a string')
-        
-        #tries to download the data to ensure that it is accessible on yahoo finance
-        try:
-            data = yf.Ticker(ticker).history(period = 'max')
-            if data.empty:
-                raise ValueError('No data for the given ticker')
-        except Exception:
-            raise ValueError('Could not retrieve data for the given ticker')
-        
-        #deletes unnecessary columns from downloaded data
-        if 'Dividends' in data:
-            del data['Dividends']
-        
-        if 'Stock Splits' in data:
-            del data['Stock Splits']
-        
-        #creates a new column, 'Tomorrow', which allows for another new column, 'Target', to determine if the price increased from day to day.
-        #'Target' will be fed into the machine learning model as the value we are trying to predict
-        data['Tomorrow'] = data['Close'].shift(-1)
-        data['Target'] = (data['Tomorrow'] > data['Close']).astype(int)
-
-        #removes the timezone of the data so that it can be combined with the class variable macro_data
-        data.index = data.index.tz_localize(None)
-
-        return data
-    
 
     '''
-    Derives the instance variable features for the data, which are moving averages and price trends across different time horizons
+    Derives the instance variable features for the data, which are moving averages and price trends across different time horizons.
+    The features are derived by 'Feature_Engine', which is also used for the data that new predictions are made on
 
     Parameters:
     horizon1, horizon2, horizon3, horizon4, horizon5 (int) --> the time horizons for which moving averages and price trends will be calculated for.
@@ -116,36 +267,19 @@ class Model():
     '''
 
     def derive_features(self, horizon1, horizon2, horizon3, horizon4, horizon5):                
-        time_horizons = [horizon1, horizon2, horizon3, horizon4, horizon5]
-
-        #check if any of the time horizons are not integers or are negative, raises a ValueError if they are
-        for horizon in time_horizons:
-            if not isinstance(horizon, int) or horizon <= 0:
-                raise ValueError('Time horizons must be positive integers')
-        
-        #initial list to hold the predictors
-        predictors = []
+        #the time horizons are kept so that new predictions derive the same features the model was trained on
+        self.horizons = [horizon1, horizon2, horizon3, horizon4, horizon5]
 
-        #loops through each of the input horizons, and creates both the moving average and trend data columns for the ticker
-        for horizon in time_horizons:
+        #derives both the moving average and trend data columns for the ticker for every horizon; raises a ValueError if any horizon is not a positive integer
+        features = Feature_Engine.derive_price_features(self.data, self.horizons)
+        self.data = pd.concat([self.data, features], axis = 1)
 
-            #uses a rolling window calculation of the mean to derive the moving average relative to the current day's closing price
-            rolling_average = self.data.rolling(horizon).mean()
-            ratio_column = 'Close_Ratio_' + str(horizon)
-            self.data[ratio_column] = self.data['Close'] / rolling_average['Close']
+        #initial list to hold the predictors, starting with the moving average and trend columns
+        predictors = list(features.columns)
 
-            #uses a rolling window calculation of the sum of the 'Target' column, which represents price increases, to derive the price trend
-            trend = self.data.shift(1).rolling(horizon).sum()['Target']
-            trend_column = 'Last_' + str(horizon) + '_Trend'
-            self.data[trend_column] = trend
-
-            #adds both the moving average as well as the trend columns to the list of predictors for the machine learning model to consider
-            predictors.append(ratio_column)
-            predictors.append(trend_column)
-
-            #removes rows which would not help the machine learning model due to some features having 'NaN';
-            #'NaN' occurs because some days do not have enough prior data to calculate moving averages or trends for
-            self.data = self.data.dropna()
+        #removes rows which would not help the machine learning model due to some features having 'NaN';
+        #'NaN' occurs because some days do not have enough prior data to calculate moving averages or trends for
+        self.data = self.data.dropna()
 
         #appends the macro_predictors to the list of predictors for the machine learning model to consider
         for predictor in Model.macro_predictors:
@@ -162,17 +296,10 @@ class Model():
     '''
 
     def split_sets(self):
-        
-        #gets a string value of the year of the first row of the data
-        first = str(self.full_data.index[0])
-        year = int(first[:4])
 
-        #checks if the first year of the data is prior to 1995; if it is not, raises a ValueError that there will not be enough data to adequately train a model on
-        if year >= 1995:
-            raise ValueError('Not enough data for this ticker to train a model')
-
-        #returns a copy of the data from January 1st, 1990 to April 30th, 2024 which will be the data that the model is used to train on
-        self.full_data = self.full_data.loc['1990-01-01':'2024-04-30'].copy()
+        #keeps a copy of the data from January 1st, 1990 to April 30th, 2024 which will be the data that the model is used to train on; raises a ValueError
+        #if there will not be enough data to adequately train a model on
+        self.full_data = training_range(self.full_data).copy()
         
         #finds where to split the data for the training and testing sets; 75% of the data is given to the training set, and 25% is given to the testing set
         total_days = int(self.full_data.shape[0])
@@ -196,56 +323,68 @@ class Model():
     model (RandomForest Classifier) --> the instance variable 'model'
 
     Return type: Pandas DataFrame, which contains the test set that was originally input with an additional column of binary values indicating a price increase/decrease
+    above the instance variable 'threshold'
     '''
     
     def predict(self, train, test, predictors, model):
-        #fits the model to determine 'Target' based on the predictors
-        model.fit(train[predictors], train['Target'])
-
-        #finds the percentage probabilities of an increase in price for the days in the test set; the slice at the end ensures only the likelihood of an increase is returned
-        prediction_percentages = self.model.predict_proba(test[predictors])[:, 1]
-
-        #merges the prediction percentages into a series so it can be merged into a Pandas DataFrame with the index values
-        prediction_percentages = pd.Series(prediction_percentages, index = test.index, name = 'Prediction_Percentages')
-
-        #creates a new Pandas DataFrame that includes all the test set's data values as well as the predictions
-        combined = pd.concat([test['Target'], prediction_percentages], axis = 1)
-
-        #adjusts the 'Predictions' column to only suggest price increases if the probability is greater than 60% as opposed to the default 50%;
-        #purpose is to increase the model's precision (higher proportion of true positives) at the expense of accuracy (due to more false negatives)
-        combined['Predictions'] = (combined['Prediction_Percentages'] > 0.6).astype(int)
-
-        return combined
+        return fit_and_predict(train, test, predictors, model, getattr(self, 'threshold', 0.6))
     
 
     '''
     Function to test the model's performance by backtesting on the ten most recent years of data. The model repeatedly backtests at a step of 250,
     which is equivalent to one full year worth of trading days.
 
+The backtesting periods do not depend on each other, so they are run at the same time with each period fitting its own clone of the input model. Each clone is made by its
+period and dropped once the period is predicted, so only the models of the periods currently running are held in memory. The last period fits the input model itself, meaning
+the input model ends up trained on all but the final year of data, the same as when the periods ran one after another.
+    Since the clones share the input model's random_state, the returned predictions are identical to running the periods one at a time.
+
+    When a cache is given, periods whose training slice, testing slice, predictors and hyperparameters match a previously computed period are loaded instead of refit.
+    The last period is always fit, as the input model needs to end up trained. The binary predictions of loaded periods are made again from their probabilities with the
+    instance variable 'threshold', so the cache is shared by models with any threshold.
+
     Parameters:
     data (Pandas DataFrame) --> the instance variable full_data
     model (RandomForestClassifier) --> the instance variable model
     predictors (list of strings) --> the instance variable predictors
     start (int) --> represents the first year that the model should begin backtesting, with the default set to 2500 (ten full trading years)
     step (int) --> represents the increase each time the model should backtest again, with the default set to 250 (one full trading year)
+    n_jobs (int) --> the number of cores to use, see 'limit_cores'. Default set to 1, which runs the periods one after another
+    cache (FoldCache from 'Backtest_Cache') --> where the results of the periods are loaded from and saved to. Default set to None, meaning every period is fit
 
     Return type: Pandas DataFrame holding all the backtested predictions
     '''
     
-    def backtest(self, data, model, predictors, start = 2500, step = 250):
-        #initializing a list to store the DataFrames of predictions for each iteration of the backtesting
-        all_predictions = []
-
-        #loop through all the backtesting periods
-        for i in range(start, data.shape[0], step):
-            
-            #makes new training and testing data sets depending on what iteration of backtesting the model is on
-            train = data.iloc[0 : i].copy()
-            test = data.iloc[i : (i + step)].copy()
-
-            #feeds the data into the predict function to generate predictions for the current iteration, and adds these results to a list
-            prediction = self.predict(train, test, predictors, model)
-            all_predictions.append(prediction)
+    def backtest(self, data, model, predictors, start = 2500, step = 250, n_jobs = 1, cache = None):
+        #the first row of the testing data for each iteration of the backtesting
+        splits = list(range(start, data.shape[0], step))
+
+        #loads the periods that were already computed; the last period is left out so that the input model is always fit
+        all_predictions = [None] * len(splits)
+        if cache is not None:
+            keys = Backtest_Cache.fold_keys(data, model, predictors, splits, step)
+            for index in range(len(splits) - 1):
+                cached = cache.get(keys[index])
+                if cached is not None:
+                    all_predictions[index] = label_predictions(cached, getattr(self, 'threshold', 0.6))
+
+        missing = [index for index in range(len(splits)) if all_predictions[index] is None]
+
+        #the input model is limited to its share of the cores before the periods start, so the clone each period makes of it is limited as well
+        fold_jobs, core_limit = limit_cores(model, n_jobs, len(missing))
+
+        #threads are used since fitting the trees releases the GIL, which lets the periods share the data without copying it to other processes.
+        #the results are returned in the order of the periods, so the combined DataFrame is the same as running them one at a time
+        with core_limit():
+            computed = Parallel(n_jobs = fold_jobs, prefer = 'threads')(
+                delayed(self._predict_fold)(index, data.iloc[0 : splits[index]].copy(), data.iloc[splits[index] : (splits[index] + step)].copy(), predictors, model, index == len(splits) - 1, fold_jobs > 1)
+                for index in missing
+            )
+
+        for index, prediction in zip(missing, computed):
+            all_predictions[index] = prediction
+            if cache is not None:
+                cache.put(keys[index], prediction)
 
         #combines all the DataFrames of results into one DataFrame so they can be returned
         combined = pd.concat(all_predictions)
@@ -253,6 +392,80 @@ class Model():
         return combined
     
 
+    #runs 'predict' for a single backtesting period, recorded as its own stage by 'Instrumentation' when it is enabled, as a threaded stage when periods run at the same time.
+    #Every period except the last fits a clone of the input model, which is only referenced here so it is freed as soon as the period returns its predictions
+    def _predict_fold(self, fold, train, test, predictors, model, last, threaded = False):
+        with (Instrumentation.thread_stage if threaded else Instrumentation.stage)('backtest_fold', ticker = getattr(self, 'ticker', None), fold = fold):
+            return self.predict(train, test, predictors, model if last else clone(model))
+
+
+    '''
+    Backtests the model the same way as 'backtest', but from a matrix of the predictors instead of a DataFrame. Every backtesting period fits on a slice of the rows
+    before it and predicts the next slice; slices of a contiguous array are views, so no period copies the data, and a float32 matrix is used by the model as it is
+
+    Parameters:
+    features (NumPy array) --> the predictors of every row, ideally a C-contiguous float32 matrix so the model does not need to convert it
+    target (NumPy array) --> the 'Target' of every row
+    index (Pandas Index) --> the dates of the rows
+    model (RandomForestClassifier) --> the instance variable model
+    start (int) --> represents the first year that the model should begin backtesting, with the default set to 2500 (ten full trading years)
+    step (int) --> represents the increase each time the model should backtest again, with the default set to 250 (one full trading year)
+    n_jobs (int) --> the number of cores to use, see 'limit_cores'. Default set to 1, which runs the periods one after another
+
+    Return type: Pandas DataFrame holding all the backtested predictions, the same as 'backtest'
+    '''
+
+    def backtest_matrix(self, features, target, index, model, start = 2500, step = 250, n_jobs = 1):
+        splits = list(range(start, features.shape[0], step))
+        fold_jobs, core_limit = limit_cores(model, n_jobs, len(splits))
+
+        #every period except the last fits its own clone of the input model, made within the period so it is freed once the period is predicted, the same as 'backtest'.
+        #periods running at the same time are recorded as threaded stages, so their CPU time and memory are not those of every period running
+        fold_stage = Instrumentation.thread_stage if fold_jobs > 1 else Instrumentation.stage
+
+        def predict_fold(fold, split):
+            fold_model = model if fold == len(splits) - 1 else clone(model)
+
+            with fold_stage('backtest_fold', ticker = getattr(self, 'ticker', None), fold = fold):
+                fold_model.fit(features[:split], target[:split])
+                percentages = fold_model.predict_proba(features[split : (split + step)])[:, 1]
+
+            #the same columns as 'fit_and_predict', with the same threshold
+            return pd.DataFrame({
+                'Target': target[split : (split + step)],
+                'Prediction_Percentages': percentages,
+                'Predictions': (percentages > self.threshold).astype(int)
+            }, index = index[split : (split + step)])
+
+        with core_limit():
+            all_predictions = Parallel(n_jobs = fold_jobs, prefer = 'threads')(
+                delayed(predict_fold)(fold, split) for fold, split in enumerate(splits)
+            )
+
+        return pd.concat(all_predictions)
+
+
+    '''
+    Reports the memory held by the data of this model, for comparing the low_memory mode against the default
+
+    Return type: dictionary holding the bytes of the predictors matrix under 'feature_matrix_bytes' (what a float32 matrix of the predictors takes up, whether or not it is kept),
+    and the bytes of every DataFrame and array this model still holds under 'held_bytes'. The training and testing sets are counted separately from full_data,
+    even though pandas may share some of their memory
+    '''
+
+    def memory_report(self):
+        held = 0
+        for value in (self.data, self.full_data, self.training_set, self.testing_set, self.predictions, self.features, self.target):
+            if isinstance(value, pd.DataFrame):
+                held += int(value.memory_usage(index = True, deep = True).sum())
+            elif isinstance(value, np.ndarray):
+                held += value.nbytes
+
+        rows = self.full_data.shape[0]
+
+        return {'feature_matrix_bytes': rows * len(self.predictors) * 4, 'held_bytes': held}
+
+
     '''
     Function to be accessed outside of the class to use the instance variable model to generate predictions based on new data
 
@@ -263,4 +476,200 @@ class Model():
     '''
     
     def future_predictions(self, latest_data):
-        return self.model.predict_proba(latest_data[self.predictors])[:, 1]
\ No newline at end of file
+        return predict_increases(self.model, getattr(self, 'forest', None), latest_data[self.predictors])
+
+
+    '''
+    Creates an InferenceModel holding only what is needed to make new predictions with this model, so that the training data does not need to be saved along with it.
+    A random forest is only kept in its flattened form, which scores any number of rows, so the artifact does not hold the scikit-learn forest as well.
+    Models saved before the ticker and time horizons were recorded are given None and the default time horizons respectively
+
+    Return type: InferenceModel
+    '''
+
+    def to_inference_model(self):
+        metadata = {
+            'ticker': getattr(self, 'ticker', None),
+            'trained_at': pd.Timestamp.now(),
+            'data_start': self.full_data.index[0],
+            'data_end': self.full_data.index[-1],
+            'rows': int(self.full_data.shape[0]),
+            'precision_score': self.precision_score,
+            'backend': getattr(self, 'backend', 'random_forest'),
+            'threshold': getattr(self, 'threshold', 0.6),
+            'hyperparameters': self.model.get_params(),
+            'sklearn_version': sklearn.__version__
+        }
+
+        #models saved before they were flattened are flattened here, so the inference model of a random forest can always score small batches quickly
+        forest = getattr(self, 'forest', None) or flatten_model(self.model)
+        model = None if forest is not None else self.model
+
+        return InferenceModel(model, list(self.predictors), list(getattr(self, 'horizons', [2, 5, 60, 250, 1000])), metadata, forest)
+
+
+'''
+Class holding only what is needed to make new predictions with a model built by 'Model': the fitted machine-learning model (or, for a random forest, only its flattened form),
+the ordered predictors, the time horizons of the price features and some information about how the model was built. It is saved and loaded by 'save_artifact' and 'load_artifact' in 'Serialization', and can be used
+anywhere a 'Model' is used to make new predictions
+
+Parameters:
+model (RandomForestClassifier) --> the fitted machine-learning model, or the estimator of another backend. None when forest is given, which then scores every prediction
+predictors (list of strings) --> the columns the model was trained on, in order
+horizons (list of ints) --> the time horizons the price features were derived for
+metadata (dictionary) --> information about how the model was built, such as the ticker, the training date, the range of data and the precision score
+forest (ArrayForest) --> the fitted model flattened into arrays by 'Forest_Predictor'. Default set to None, meaning every prediction goes through the fitted model, as for backends other than a random forest
+'''
+
+class InferenceModel():
+
+    '''
+    Instance variables:
+    model (RandomForestClassifier) --> holds the fitted machine-learning model, or None for a random forest saved only in its flattened form
+    predictors (list of strings) --> holds the columns the model was trained on
+    horizons (list of ints) --> holds the time horizons the price features were derived for
+    metadata (dictionary) --> holds the information about how the model was built
+    precision_score (float) --> holds the model's precision score from backtesting, also found in metadata
+    forest (ArrayForest) --> holds the flattened model used to score small batches of new data, or None
+    '''
+
+    def __init__(self, model, predictors, horizons, metadata, forest = None):
+        self.model = model
+        self.predictors = predictors
+        self.horizons = horizons
+        self.metadata = metadata
+        self.precision_score = metadata.get('precision_score')
+        self.forest = forest
+
+
+    '''
+    Generates predictions based on new data, the same as 'future_predictions' of the 'Model' class
+
+    Parameters:
+    latest_data (Pandas DataFrame) --> should hold the latest macroeconomic and derived price features for the ticker
+
+    Return type: list of percentages representing the model's predictions of price increases for the latest input data
+    '''
+
+    def future_predictions(self, latest_data):
+        return predict_increases(self.model, getattr(self, 'forest', None), latest_data[self.predictors])
+
+
+'''
+Fits a model on the input training data, and returns its predictions on the input testing set as binary values of price increases or decreases. This is the work done by
+each backtesting period of 'Model', and is also used by 'Model_Search' to evaluate configurations the same way
+
+Parameters:
+train (Pandas DataFrame) --> the data which will be used to fit the model based on the input predictors
+test (Pandas DataFrame) --> the remaining data which will be used to test the model based on the input predictors. The 'Target' column is the model's target
+predictors (list of strings) --> the columns the model should consider
+model (RandomForest Classifier) --> the model to fit
+threshold (float) --> the probability above which a price increase is predicted. Default set to 0.6
+
+Return type: Pandas DataFrame, which contains the 'Target' column of the test set with additional columns of the predicted probabilities and binary values indicating a price increase/decrease
+'''
+
+def fit_and_predict(train, test, predictors, model, threshold = 0.6):
+    #fits the model to determine 'Target' based on the predictors
+    model.fit(train[predictors], train['Target'])
+
+    #finds the percentage probabilities of an increase in price for the days in the test set; the slice at the end ensures only the likelihood of an increase is returned
+    prediction_percentages = model.predict_proba(test[predictors])[:, 1]
+
+    #merges the prediction percentages into a series so it can be merged into a Pandas DataFrame with the index values
+    prediction_percentages = pd.Series(prediction_percentages, index = test.index, name = 'Prediction_Percentages')
+
+    #creates a new Pandas DataFrame that includes all the test set's data values as well as the predictions
+    combined = pd.concat([test['Target'], prediction_percentages], axis = 1)
+
+    #adjusts the 'Predictions' column to only suggest price increases if the probability is greater than the threshold, 60% by default as opposed to the standard 50%;
+    #purpose is to increase the model's precision (higher proportion of true positives) at the expense of accuracy (due to more false negatives)
+    return label_predictions(combined, threshold)
+
+
+'''
+Sets the binary predictions of backtested probabilities for a threshold, without fitting anything again
+
+Parameters:
+predictions (Pandas DataFrame) --> backtested predictions holding the 'Prediction_Percentages' column, as returned by 'fit_and_predict'
+threshold (float) --> the probability above which a price increase is predicted
+
+Return type: Pandas DataFrame, a copy of the input predictions with the 'Predictions' column set for the threshold
+'''
+
+def label_predictions(predictions, threshold):
+    labelled = predictions.copy()
+    labelled['Predictions'] = (labelled['Prediction_Percentages'] > threshold).astype(int)
+
+    return labelled
+
+
+'''
+Finds the model's probabilities of a price increase for the input rows. Small batches, such as the latest day of a ticker, are scored by the flattened model as
+it avoids going through scikit-learn one tree at a time; larger batches are faster through scikit-learn's own compiled trees, when the fitted model is available.
+Both give the same probabilities
+
+Parameters:
+model (RandomForestClassifier) --> the fitted machine-learning model, or the estimator of another backend. None for inference models holding only the flattened model
+forest (ArrayForest) --> the same model flattened by 'Forest_Predictor', or None to always use the fitted model
+rows (Pandas DataFrame) --> the rows to score, holding only the predictors in the order the model was trained on
+
+Return type: NumPy array of percentages representing the model's predictions of price increases
+'''
+
+def predict_increases(model, forest, rows):
+    if forest is None or (model is not None and rows.shape[0] > FOREST_MAX_ROWS):
+        #models trained with 'low_memory' were fit on a matrix without column names, so they are given one as well
+        if not hasattr(model, 'feature_names_in_'):
+            rows = rows.to_numpy()
+        return model.predict_proba(rows)[:, 1]
+
+    return forest.predict_proba(rows.to_numpy())[:, list(forest.classes).index(1)]
+
+
+'''
+Splits a budget of cores between backtesting periods running at the same time and the trees fit within each period, so that the two levels of parallelism
+together never use more cores than the budget
+
+Parameters:
+n_jobs (int) --> the total number of cores to use. -1 uses all the cores of the machine
+num_folds (int) --> the number of backtesting periods
+
+Return type: tuple of two ints, the number of periods to run at the same time and the number of cores each period's model may use
+'''
+
+def split_cores(n_jobs, num_folds):
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+
+    if not isinstance(n_jobs, int) or n_jobs <= 0:
+        raise ValueError('n_jobs must be a positive integer or -1')
+
+    #periods are preferred over trees as they are the larger units of work; any cores left over are given to the trees
+    fold_jobs = max(1, min(n_jobs, num_folds))
+    tree_jobs = max(1, n_jobs // fold_jobs)
+
+    return fold_jobs, tree_jobs
+
+
+'''
+Splits a budget of cores between backtesting periods and the model of each period the same way as 'split_cores', for an estimator of any backend. Estimators with an n_jobs
+parameter are limited through it. Estimators without one, such as HistGradientBoostingClassifier, grow their trees with OpenMP threads shared by the whole process, which
+cannot be limited per period; their periods are therefore run one at a time, with the OpenMP threads limited to the whole budget while they run
+
+Parameters:
+model (scikit-learn classifier) --> the unfitted model of the backtest, whose n_jobs is set to each period's share of the cores when it has one
+n_jobs (int) --> the total number of cores to use. -1 uses all the cores of the machine
+num_folds (int) --> the number of backtesting periods
+
+Return type: tuple of the number of periods to run at the same time, and a function without parameters returning the context manager to run the periods in
+'''
+
+def limit_cores(model, n_jobs, num_folds):
+    if 'n_jobs' in model.get_params():
+        fold_jobs, tree_jobs = split_cores(n_jobs, num_folds)
+        model.set_params(n_jobs = tree_jobs)
+        return fold_jobs, contextlib.nullcontext
+
+    thread_jobs = split_cores(n_jobs, 1)[1]
+    return 1, lambda: threadpool_limits(limits = thread_jobs, user_api = 'openmp')
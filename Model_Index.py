@@ -0,0 +1,275 @@
+import os
+import json
+import sqlite3
+import hashlib
+import pandas as pd
+
+#keeps an index of the saved models in a small SQLite database, written each time a model is trained. It holds the precision score, training time, range of data,
+#hyperparameters, time horizons and the hash and size of the artifact of every ticker, so reports can look up, filter and sort the models without loading any of them.
+#the threshold chosen for each model by 'Threshold_Sweep' is also kept here, and is used instead of the threshold the model was trained with
+
+#the name of the index file, saved in the same directory as the models
+INDEX_FILENAME = 'Model_Index.sqlite'
+
+#the columns of the index, with their SQLite types; the ticker is the key, so each ticker has the row of its latest model. 'chosen_threshold' and 'holdout_precision' are
+#written by 'record_thresholds', and are cleared whenever the model is trained again since they were chosen on the backtest of the previous model
+COLUMNS = {
+    'ticker': 'TEXT PRIMARY KEY',
+    'precision_score': 'REAL',
+    'threshold': 'REAL',
+    'backend': 'TEXT',
+    'trained_at': 'TEXT',
+    'training_seconds': 'REAL',
+    'data_start': 'TEXT',
+    'data_end': 'TEXT',
+    'rows': 'INTEGER',
+    'hyperparameters': 'TEXT',
+    'horizons': 'TEXT',
+    'artifact': 'TEXT',
+    'artifact_sha256': 'TEXT',
+    'artifact_bytes': 'INTEGER',
+    'sklearn_version': 'TEXT',
+    'chosen_threshold': 'REAL',
+    'holdout_precision': 'REAL'
+}
+
+
+'''
+Opens the index, creating it along with its table if it does not exist yet. The index uses write-ahead logging, so the models trained in parallel by 'save_all_models' in
+'Serialization' can each write their row while reports read it
+
+Parameters:
+directory (string) --> where the models are saved; the index is saved in the same directory. Default set to ''
+
+Return type: sqlite3 Connection
+'''
+
+def connect(directory = ''):
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    connection = sqlite3.connect(os.path.join(directory, INDEX_FILENAME), timeout = 30)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS models (' + ', '.join(name + ' ' + kind for name, kind in COLUMNS.items()) + ')')
+
+    #indexes written before a column was added are given the missing columns
+    existing = {row[1] for row in connection.execute('PRAGMA table_info(models)')}
+    for name, kind in COLUMNS.items():
+        if name not in existing:
+            connection.execute('ALTER TABLE models ADD COLUMN ' + name + ' ' + kind)
+
+    return connection
+
+
+#the SHA-256 hash and total size of an artifact and its buffers file, read in chunks so large artifacts are not loaded into memory at once
+def _hash_artifact(artifact_path):
+    digest = hashlib.sha256()
+    size = 0
+
+    for filepath in (artifact_path, artifact_path + '.buffers'):
+        if not os.path.exists(filepath):
+            continue
+
+        with open(filepath, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+                size += len(chunk)
+
+    return digest.hexdigest(), size
+
+
+'''
+Writes the row of a model's inference artifact into the index, replacing the previous row of the same ticker
+
+Parameters:
+metadata (dictionary) --> the metadata of the artifact saved by 'save_artifact' in 'Serialization', as held by the artifact or read from its header with 'load_artifact_header'
+horizons (list of ints) --> the time horizons of the artifact's model
+artifact_filename (string) --> the name of the artifact file, relative to the directory
+directory (string) --> where the artifact and the index are saved. Default set to ''
+training_seconds (float) --> the number of seconds it took to build the model. Default set to None, which keeps the time already recorded for the ticker, if any
+
+Return type: dictionary holding the row written
+'''
+
+def record_artifact(metadata, horizons, artifact_filename, directory = '', training_seconds = None):
+    artifact_sha256, artifact_bytes = _hash_artifact(os.path.join(directory, artifact_filename))
+
+    row = {
+        'ticker': str(metadata['ticker']),
+        'precision_score': float(metadata['precision_score']),
+        'threshold': float(metadata.get('threshold', 0.6)),
+        'backend': metadata.get('backend', 'random_forest'),
+        'trained_at': pd.Timestamp(metadata['trained_at']).isoformat(),
+        'training_seconds': training_seconds,
+        'data_start': pd.Timestamp(metadata['data_start']).isoformat(),
+        'data_end': pd.Timestamp(metadata['data_end']).isoformat(),
+        'rows': int(metadata['rows']),
+        'hyperparameters': json.dumps(metadata.get('hyperparameters', dict()), sort_keys = True, default = str),
+        'horizons': json.dumps([int(horizon) for horizon in horizons]),
+        'artifact': artifact_filename,
+        'artifact_sha256': artifact_sha256,
+        'artifact_bytes': artifact_bytes,
+        'sklearn_version': metadata.get('sklearn_version'),
+        'chosen_threshold': None,
+        'holdout_precision': None
+    }
+
+    #an upsert keyed by the ticker; the training time is only replaced when a new one is given, since rebuilding the index from artifacts does not know it, and the chosen
+    #threshold is only cleared when the artifact changed, so rebuilding the index keeps it
+    kept = {
+        'training_seconds': 'COALESCE(excluded.training_seconds, training_seconds)',
+        'chosen_threshold': 'CASE WHEN excluded.artifact_sha256 = artifact_sha256 THEN chosen_threshold END',
+        'holdout_precision': 'CASE WHEN excluded.artifact_sha256 = artifact_sha256 THEN holdout_precision END'
+    }
+    updates = ', '.join(name + ' = ' + kept.get(name, 'excluded.' + name) for name in COLUMNS if name != 'ticker')
+    statement = 'INSERT INTO models (' + ', '.join(COLUMNS) + ') VALUES (' + ', '.join('?' for _ in COLUMNS) + ') ON CONFLICT(ticker) DO UPDATE SET ' + updates
+
+    connection = connect(directory)
+    try:
+        with connection:
+            connection.execute(statement, [row[name] for name in COLUMNS])
+    finally:
+        connection.close()
+
+    return row
+
+
+'''
+Queries the index, filtering and sorting the models in SQLite so that no model or artifact is loaded
+
+Parameters:
+directory (string) --> where the index is saved. Default set to ''
+tickers (list of strings) --> the tickers to return. Default set to None, which returns every ticker in the index
+min_precision (float) --> the minimum precision score of the models returned. Default set to None, which returns models of any precision
+order_by (string) --> the column to sort by. Default set to 'precision_score'
+descending (bool) --> whether to sort from the highest value to the lowest. Default set to True
+limit (int) --> the maximum number of models returned. Default set to None, which returns all of them
+
+Return type: Pandas DataFrame indexed by ticker holding the columns of COLUMNS; 'hyperparameters' and 'horizons' are JSON strings, and the dates are ISO strings
+'''
+
+def query(directory = '', tickers = None, min_precision = None, order_by = 'precision_score', descending = True, limit = None):
+    if order_by not in COLUMNS:
+        raise ValueError('Unknown column to sort by: ' + str(order_by) + '. Should be one of ' + ', '.join(COLUMNS))
+
+    filepath = os.path.join(directory, INDEX_FILENAME)
+    if not os.path.exists(filepath):
+        raise FileNotFoundError('No model index at ' + filepath + '. Train the models or call \'rebuild_index\' to create it')
+
+    conditions, parameters = [], []
+    if tickers is not None:
+        tickers = [str(ticker) for ticker in tickers]
+        conditions.append('ticker IN (' + ', '.join('?' for _ in tickers) + ')')
+        parameters.extend(tickers)
+    if min_precision is not None:
+        conditions.append('precision_score >= ?')
+        parameters.append(float(min_precision))
+
+    statement = 'SELECT ' + ', '.join(COLUMNS) + ' FROM models'
+    if conditions:
+        statement += ' WHERE ' + ' AND '.join(conditions)
+    statement += ' ORDER BY ' + order_by + (' DESC' if descending else ' ASC') + ', ticker'
+    if limit is not None:
+        statement += ' LIMIT ' + str(int(limit))
+
+    connection = connect(directory)
+    try:
+        return pd.read_sql_query(statement, connection, params = parameters).set_index('ticker')
+    finally:
+        connection.close()
+
+
+'''
+Loads the precision scores of the models from the index, in the same format as 'load_all_precision_scores' in 'Serialization'. When the index has not been written yet,
+the scores are loaded from the precision scores file instead
+
+Parameters:
+directory (string) --> where the index, or the precision scores file, is saved. Default set to ''
+min_precision (float) --> the minimum precision score of the models returned. Default set to None, which returns models of any precision
+
+Return type: dictionary, where the keys are tickers and the values are floats representing the precision scores, from the highest to the lowest
+'''
+
+def load_precision_scores(directory = '', min_precision = None):
+    try:
+        return query(directory, min_precision = min_precision)['precision_score'].to_dict()
+    except FileNotFoundError:
+        #imported here since 'Serialization' writes the index when models are trained
+        import Serialization
+        scores = Serialization.load_all_precision_scores(directory = directory)
+        return {ticker: score for ticker, score in sorted(scores.items(), key = lambda item: -item[1]) if min_precision is None or score >= min_precision}
+
+
+'''
+Writes the thresholds chosen by 'select_thresholds' in 'Threshold_Sweep' into the index, where 'Prediction_Server' and the reports read them. Tickers without a row in
+the index are left out
+
+Parameters:
+chosen (Pandas DataFrame) --> indexed by ticker, holding the chosen 'Threshold' and the 'Holdout_Precision' it gave on the latest backtested days, as returned by 'select_thresholds';
+a NaN precision, given when the latest days had too few signals to measure it, is recorded as NULL
+directory (string) --> where the index is saved. Default set to ''
+
+Return type: int holding the number of models updated
+'''
+
+def record_thresholds(chosen, directory = ''):
+    rows = [(float(threshold), None if pd.isna(precision) else float(precision), str(ticker)) for ticker, threshold, precision in zip(chosen.index, chosen['Threshold'], chosen['Holdout_Precision'])]
+
+    connection = connect(directory)
+    try:
+        with connection:
+            return connection.executemany('UPDATE models SET chosen_threshold = ?, holdout_precision = ? WHERE ticker = ?', rows).rowcount
+    finally:
+        connection.close()
+
+
+'''
+Loads the thresholds chosen with 'record_thresholds'
+
+Parameters:
+directory (string) --> where the index is saved. Default set to ''
+
+Return type: dictionary with the tickers as keys, and as values a tuple of the chosen threshold and the precision it gave on the latest backtested days, or None when
+they had too few signals to measure it. Tickers without a chosen threshold are left out, and the dictionary is empty when the index has not been written yet
+'''
+
+def load_chosen_thresholds(directory = ''):
+    if not os.path.exists(os.path.join(directory, INDEX_FILENAME)):
+        return dict()
+
+    connection = connect(directory)
+    try:
+        rows = connection.execute('SELECT ticker, chosen_threshold, holdout_precision FROM models WHERE chosen_threshold IS NOT NULL').fetchall()
+    finally:
+        connection.close()
+
+    return {ticker: (threshold, precision) for ticker, threshold, precision in rows}
+
+
+'''
+Writes the row of every saved artifact into the index, for models trained before the index existed. Only the header of each artifact is read with 'load_artifact_header'
+in 'Serialization', the same as 'save_manifest', although every artifact file is still read once to compute its hash. Artifacts saved before headers were written are loaded
+in full; the training times already in the index are kept
+
+Parameters:
+directory (string) --> where the artifacts are saved; the index is saved in the same directory. Default set to ''
+
+Return type: int holding the number of models written
+'''
+
+def rebuild_index(directory = ''):
+    import Serialization
+
+    count = 0
+    for ticker in Serialization.load_tickers():
+        artifact_filename = str(ticker) + '_Artifact.pkl'
+
+        #tickers that have not been trained yet or failed to train are left out
+        if not os.path.exists(os.path.join(directory, artifact_filename)):
+            continue
+
+        header = Serialization.load_artifact_header(artifact_filename, directory)
+        record_artifact(header['metadata'], header['horizons'], artifact_filename, directory)
+        count += 1
+
+    return count
@@ -0,0 +1,209 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import Serialization
+
+'''
+Class used to access the saved inference artifacts of all tickers without loading every one of them up front. The registry reads the manifest written by 'save_manifest'
+in 'Serialization', loads each model the first time it is accessed, and keeps the most recently used models in memory within a budget of models or bytes
+
+Parameters:
+manifest_path (string) --> the path of the manifest file written by 'save_manifest'
+max_models (int) --> the maximum number of models kept in memory. Default set to None, meaning no limit
+max_bytes (int) --> the maximum total size of the models kept in memory, measured by the uncompressed size of their artifacts recorded in the manifest. Default set to None,
+meaning no limit
+prefetch_workers (int) --> the number of background threads used by 'prefetch'. Default set to 2
+'''
+
+class ModelRegistry():
+
+    '''
+    Instance variables:
+    directory (string) --> holds the directory of the manifest, which the paths of the artifacts are relative to
+    entries (dictionary) --> holds the manifest entry of each ticker, with the tickers as keys
+    max_models (int) --> holds the maximum number of models kept in memory
+    max_bytes (int) --> holds the maximum total size of the models kept in memory
+    models (OrderedDict) --> holds the models currently in memory, ordered from least to most recently used
+    hits (int) --> holds the number of times a model was already in memory when accessed
+    misses (int) --> holds the number of times a model had to be loaded when accessed
+    '''
+
+    def __init__(self, manifest_path, max_models = None, max_bytes = None, prefetch_workers = 2):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+
+        self.directory = os.path.dirname(manifest_path)
+        self.entries = {entry['ticker']: entry for entry in manifest}
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = prefetch_workers)
+
+
+    '''
+    Returns the model of a ticker, loading it from its artifact if it is not in memory yet. Loading a model may evict the least recently used models to stay within the budget
+
+    Parameters:
+    ticker (string) --> the ticker of the desired model. Raises a KeyError if the ticker is not in the manifest
+
+    Return type: InferenceModel class of module 'Model_Builder'
+    '''
+
+    def get(self, ticker):
+        with self._lock:
+            if ticker in self.models:
+                self.hits += 1
+                self.models.move_to_end(ticker)
+                return self.models[ticker]
+
+            self.misses += 1
+
+        #the model is loaded outside of the lock so that other tickers can still be accessed in the meantime
+        model = self._load(ticker)
+
+        with self._lock:
+            self.models[ticker] = model
+            self.models.move_to_end(ticker)
+            self._evict()
+
+        return model
+
+
+    def __getitem__(self, ticker):
+        return self.get(ticker)
+
+
+    def __contains__(self, ticker):
+        return ticker in self.entries
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    '''
+    Returns the tickers listed in the manifest
+
+    Return type: list of strings
+    '''
+
+    def tickers(self):
+        return list(self.entries.keys())
+
+
+    '''
+    Starts loading the models of the input tickers in the background, so that they are already in memory when first accessed.
+    Tickers that are already in memory are skipped, and so are tickers that would not fit within the budget without dropping a model already in memory,
+    since a prefetched model has not been used yet and should not push out one that has
+
+    Parameters:
+    tickers (list of strings) --> the tickers whose models should be loaded
+
+    Return type: Future from 'concurrent.futures' that completes once all the models are loaded
+    '''
+
+    def prefetch(self, tickers):
+        return self._executor.submit(self._prefetch, list(tickers))
+
+
+    '''
+    Returns the time horizons of a ticker's model from the manifest, so the features of a ticker can be built without loading its model. Manifests written before
+    the time horizons were recorded fall back to loading the model
+
+    Parameters:
+    ticker (string) --> the ticker of the desired model. Raises a KeyError if the ticker is not in the manifest
+
+    Return type: list of ints
+    '''
+
+    def horizons(self, ticker):
+        if ticker not in self.entries:
+            raise KeyError('No model in the manifest for ' + str(ticker))
+
+        if 'horizons' in self.entries[ticker]:
+            return list(self.entries[ticker]['horizons'])
+
+        return list(getattr(self.get(ticker), 'horizons', [2, 5, 60, 250, 1000]))
+
+
+    '''
+    Returns how the registry has been used so far
+
+    Return type: dictionary holding the number of 'hits' and 'misses', the 'hit_rate', the number of models 'loaded' in memory and their total uncompressed 'bytes'
+    '''
+
+    def stats(self):
+        with self._lock:
+            accesses = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / accesses if accesses else 0.0,
+                'loaded': len(self.models),
+                'bytes': self._loaded_bytes()
+            }
+
+
+    '''
+    Stops the background threads used by 'prefetch'
+    '''
+
+    def close(self):
+        self._executor.shutdown(wait = True)
+
+
+    def _load(self, ticker):
+        if ticker not in self.entries:
+            raise KeyError('No model in the manifest for ' + str(ticker))
+
+        return Serialization.load_artifact(self.entries[ticker]['artifact'], self.directory)
+
+
+    def _prefetch(self, tickers):
+        for ticker in tickers:
+            with self._lock:
+                skip = ticker in self.models or not self._has_room(ticker)
+
+            if not skip:
+                model = self._load(ticker)
+                with self._lock:
+                    #a prefetched model is treated as the least recently used one, so it does not push out models that are actually being accessed
+                    if ticker not in self.models and self._has_room(ticker):
+                        self.models[ticker] = model
+                        self.models.move_to_end(ticker, last = False)
+
+
+    #whether the model of a ticker can be added without going over the budget
+    def _has_room(self, ticker):
+        fits_count = self.max_models is None or len(self.models) < self.max_models
+        fits_bytes = self.max_bytes is None or self._loaded_bytes() + self._entry_bytes(ticker) <= self.max_bytes
+
+        return fits_count and fits_bytes
+
+
+    #the size of a model once loaded; manifests written before it was recorded only have the size on disk
+    def _entry_bytes(self, ticker):
+        entry = self.entries[ticker]
+        return entry.get('uncompressed_size', entry['size'])
+
+
+    def _loaded_bytes(self):
+        return sum(self._entry_bytes(ticker) for ticker in self.models)
+
+
+    #removes the least recently used models until the registry is within its budget; the most recently used model is always kept, even if it is over the budget by itself
+    def _evict(self):
+        while len(self.models) > 1:
+            over_count = self.max_models is not None and len(self.models) > self.max_models
+            over_bytes = self.max_bytes is not None and self._loaded_bytes() > self.max_bytes
+
+            if not (over_count or over_bytes):
+                break
+
+            self.models.popitem(last = False)
@@ -0,0 +1,185 @@
+import time
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from sklearn.metrics import precision_score
+import Macro_Data as md
+import Feature_Engine
+import Model_Builder
+
+'''
+Creates every combination of the input hyperparameters and time horizons, in the format used by 'ModelSearch'
+
+Parameters:
+num_trees (list of ints) --> the numbers of trees to try. Default set to 300, the default of 'Model'
+num_leaves (list of ints) --> the minimum numbers of leaves a node can have to try. Default set to 50, the default of 'Model'
+horizons (list of lists of ints) --> the sets of time horizons to try. Default set to the default horizons of 'Model'
+
+Return type: list of dictionaries, each holding 'num_trees', 'num_leaves' and 'horizons'
+'''
+
+def grid(num_trees = (300,), num_leaves = (50,), horizons = ((2, 5, 60, 250, 1000),)):
+    return [{'num_trees': trees, 'num_leaves': leaves, 'horizons': tuple(horizon_set)} for trees, leaves, horizon_set in itertools.product(num_trees, num_leaves, horizons)]
+
+
+'''
+Class used to search for the best hyperparameters and time horizons of the models for a ticker. The ticker's price data is loaded and merged with the macroeconomic data once,
+and the price features of each time horizon are derived once and shared by every configuration using that horizon. Each configuration is then backtested the same way as 'Model'
+
+Parameters:
+ticker (string) --> the ticker for which configurations are searched
+refresh_data (bool) --> whether the newest price data should be downloaded into the price store first. Default set to True
+'''
+
+class ModelSearch():
+
+    '''
+    Instance variables:
+    ticker (string) --> holds the ticker being searched
+    data (Pandas DataFrame) --> holds the ticker's price data along with its 'Target' column, the same as the instance variable data of 'Model' before features are derived
+    macro_data (Pandas DataFrame) --> holds the macroeconomic features lined up with the trading days of the price data
+    features (dictionary) --> holds the derived price features of each time horizon, with the time horizons as keys
+    '''
+
+    def __init__(self, ticker, refresh_data = True):
+        self.ticker = ticker
+
+        #the data is loaded the same way as 'Model', which raises a ValueError if the ticker cannot be retrieved
+        self.data = Model_Builder.prepare_data(ticker, refresh_data)
+        self.macro_data = md.asof_join(self.data.index)
+        self.features = dict()
+        self._lock = threading.Lock()
+
+
+    '''
+    Returns the price features of a single time horizon, deriving them the first time the horizon is used
+
+    Parameters:
+    horizon (int) --> the time horizon, in trading days
+
+    Return type: Pandas DataFrame with the two columns of the time horizon returned by 'feature_columns' in 'Feature_Engine'
+    '''
+
+    def horizon_features(self, horizon):
+        with self._lock:
+            if horizon not in self.features:
+                self.features[horizon] = Feature_Engine.derive_price_features(self.data, [horizon])
+
+            return self.features[horizon]
+
+
+    '''
+    Builds the data a model with the input time horizons is backtested on, which is the same as the instance variable full_data of 'Model' built with those horizons
+
+    Parameters:
+    horizons (list of ints) --> the time horizons of the price features
+
+    Return type: tuple of the data as a Pandas DataFrame and the list of predictors, in the same order as 'Model'
+    '''
+
+    def build_data(self, horizons):
+        features = [self.horizon_features(horizon) for horizon in horizons]
+        price_data = pd.concat([self.data] + features, axis = 1).dropna()
+        full_data = pd.concat([price_data, self.macro_data.loc[price_data.index]], axis = 1)
+
+        #checks that there is enough data to train on, and uses the same range of data as 'split_sets' of 'Model'
+        full_data = Model_Builder.training_range(full_data)
+
+        predictors = Feature_Engine.feature_columns(horizons) + list(self.macro_data.columns)
+
+        return full_data, predictors
+
+
+    '''
+    Backtests a single configuration one period at a time, the same way as 'backtest' of 'Model'. After a minimum number of periods, the configuration is abandoned
+    as soon as its precision so far falls clearly below the best precision of the configurations already finished
+
+    Parameters:
+    configuration (dictionary) --> holds 'num_trees', 'num_leaves' and 'horizons'
+    best (function) --> function without parameters returning the best precision finished so far, or None if no configuration has finished yet
+    min_periods (int) --> the number of periods always backtested before a configuration can be abandoned
+    abandon_margin (float) --> how far below the best precision a configuration's precision must fall to be abandoned
+    start (int) --> the first row backtested, the same as in 'backtest'
+    step (int) --> the number of rows in each backtesting period, the same as in 'backtest'
+
+    Return type: dictionary holding the configuration along with its 'Precision', the number of 'Periods' backtested, whether it was 'Abandoned' and the 'Seconds' it took
+    '''
+
+    def evaluate(self, configuration, best = lambda: None, min_periods = 3, abandon_margin = 0.05, start = 2500, step = 250):
+        started = time.perf_counter()
+        data, predictors = self.build_data(configuration['horizons'])
+
+        #the same classifier as 'Model', so the precision found here is the precision 'Model' would reach with this configuration
+        model = Model_Builder.make_estimator('random_forest', configuration['num_trees'], configuration['num_leaves'])
+
+        splits = list(range(start, data.shape[0], step))
+        all_predictions = []
+        abandoned = False
+
+        for split in splits:
+            all_predictions.append(Model_Builder.fit_and_predict(data.iloc[0 : split], data.iloc[split : (split + step)], predictors, model))
+            combined = pd.concat(all_predictions)
+            precision = precision_score(combined['Target'], combined['Predictions'], zero_division = 0)
+
+            best_precision = best()
+            if len(all_predictions) >= min_periods and len(all_predictions) < len(splits) and best_precision is not None and precision < best_precision - abandon_margin:
+                abandoned = True
+                break
+
+        return {
+            'num_trees': configuration['num_trees'],
+            'num_leaves': configuration['num_leaves'],
+            'horizons': tuple(configuration['horizons']),
+            'Precision': precision,
+            'Periods': len(all_predictions),
+            'Abandoned': abandoned,
+            'Seconds': time.perf_counter() - started
+        }
+
+
+    '''
+    Backtests all the input configurations, several at a time, and ranks them by precision
+
+    Parameters:
+    configurations (list of dictionaries) --> the configurations to search, each holding 'num_trees', 'num_leaves' and 'horizons', for example as created by 'grid'
+    n_jobs (int) --> the number of configurations backtested at the same time. Default set to 1
+    min_periods (int) --> the number of periods always backtested before a configuration can be abandoned. Default set to 3
+    abandon_margin (float) --> how far below the best finished precision a configuration's precision must fall to be abandoned. Default set to 0.05;
+    None never abandons any configuration
+
+    Return type: Pandas DataFrame with a row for each configuration, holding its hyperparameters, time horizons, precision, number of backtested periods, whether it was abandoned
+    and the seconds it took. The finished configurations are ranked first by precision, followed by the abandoned ones
+    '''
+
+    def run(self, configurations, n_jobs = 1, min_periods = 3, abandon_margin = 0.05):
+        finished = []
+
+        def best():
+            with self._lock:
+                return max(finished) if finished else None
+
+        def evaluate(configuration):
+            if abandon_margin is None:
+                result = self.evaluate(configuration)
+            else:
+                result = self.evaluate(configuration, best, min_periods, abandon_margin)
+
+            if not result['Abandoned']:
+                with self._lock:
+                    finished.append(result['Precision'])
+
+            return result
+
+        #the features of every time horizon are derived up front, so the configurations only share them instead of deriving them at the same time
+        for configuration in configurations:
+            for horizon in configuration['horizons']:
+                self.horizon_features(horizon)
+
+        #threads are used since fitting the trees releases the GIL, which lets the configurations share the loaded data without copying it to other processes
+        with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+            results = list(executor.map(evaluate, configurations))
+
+        ranked = pd.DataFrame(results).sort_values(['Abandoned', 'Precision'], ascending = [True, False])
+
+        return ranked.reset_index(drop = True)
@@ -1,96 +1,124 @@
-import yfinance as yf
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import Macro_Data as md
+import Price_Store
+import Feature_Engine
+import Feature_State
+import Instrumentation
 import Serialization as all_models
 
 '''
-Downloads the latest data of the input ticker and preprocesses it so that the model associated with the ticker can create the latest prediction.
+Loads the latest data of the input ticker from the price store in 'Price_Store' and preprocesses it so that the model associated with the ticker can create the latest prediction.
 The preprocessing step involves deriving the price features, as well as concatenating the latest macroeconomic data with the returned Pandas DataFrame.
 The data is also cleaned to remove unnecessary rows and columns.
 
 Parameters:
 ticker (string) --> should be a ticker saved from the 'Usable_Stocks' module for which a new prediction is desired
+refresh (bool) --> whether the newest bars should be downloaded into the price store first. Default set to True; set to False to predict offline from the stored data
+horizons (list of ints) --> the time horizons for which the features should be derived; these should match what was fed to the model when it was initially created.
+Default set to 2, 5, 60, 250 and 1000, the defaults of the 'Model' class
 
 Return type: Pandas DataFrame containing a singular row representing the stock's most recent full trading day.
 All derived features and macroeconomic data are included with this singular row so that they can be fed into the model
 '''
 
-def preprocess_latest_data(ticker):
-    #downloads the last 1000 trading days worth of data for the ticker so that features can be derived for it
-    latest = yf.Ticker(ticker)
-    latest = latest.history(period = '1000d')
-
-    #deletes unnecessary columns from downloaded data
-    if 'Dividends' in latest:
-        del latest['Dividends']
-        
-    if 'Stock Splits' in latest:
-        del latest['Stock Splits']
-
-    #creates a temporary copy of the data so that the derived features can be created
-    temp = latest.copy()
-
-    #derives the DTD price increase of the stock, similar to the 'Target' column of the instance variables 'data' for the models.
-    #this is needed in order to derive trend features
-    temp['Yesterday'] = temp['Close'].shift(1)
-    temp['DTD_Increase'] = (temp['Close'] > temp['Yesterday']).astype(int)
-
-    #adds this newly derived column to the actual dataset
-    latest['DTD_Increase'] = temp['DTD_Increase']
-
-    #sets the time horizons for which the features should be derived for; these should match what was fed to the model when it was initially created
-    time_horizons = [2, 5, 60, 250, 1000]
-
-    #loops through the time horizons and creates the moving averages and trend features for the ticker
-    for horizon in time_horizons:
-        
-        #rolling window calculation for the moving average ratios, similar to 'derive_features' in the 'Model_Builder' module
-        #adds this new column to the DataFrame
-        rolling_averages = latest.rolling(horizon).mean()
-        ratio_column = 'Close_Ratio_' + str(horizon)
-        latest[ratio_column] = latest['Close'] / rolling_averages['Close']
-
-        #rolling window calculation for the trends, similar to 'derive_features' in the 'Model_Builder' module except 'DTD_Increase' is used instead of 'Target' (same output)
-        #adds this new column to the DataFrame
-        trends = latest.rolling(horizon).sum()['DTD_Increase']
-        trend_column = 'Last_' + str(horizon) + '_Trend'
-        latest[trend_column] = trends
-
-    #adjusts the timezone format of the index so it can be merged with the macroeconomic data from the 'Macro_Data' module; merges these two DataFrames into one
-    latest.index = latest.index.tz_localize(None)
-    latest = pd.merge(latest, md.macro_data, left_index = True, right_index = True, how = 'left')
-    
-    #forward fills any missing values for the macroeconomic data due to it being reported monthly, not daily, and drops the unnecessary rows
-    latest.ffill(inplace = True)
-    latest = latest.dropna()
+def preprocess_latest_data(ticker, refresh = True, horizons = (2, 5, 60, 250, 1000)):
+    #takes just enough of the latest trading days for the longest time horizon's trend to be derived for the most recent day; only new bars are downloaded when refreshing
+    latest = Price_Store.get_history(ticker, refresh = refresh).iloc[-(max(horizons) + 1):]
+
+    #derives the moving average and trend features with 'Feature_Engine', the same way as 'derive_features' in the 'Model_Builder' module
+    latest = Feature_Engine.derive_price_features(latest, list(horizons))
 
-    #deletes the unnecessary rows
-    del latest['Close']
-    del latest['Open']
-    del latest['High']
-    del latest['Low']
-    del latest['Volume']
-    del latest['DTD_Increase']
+    #joins each trading day of the price data, whose index has no timezone in the price store, to the latest macroeconomic data reported on or before it by the 'Macro_Data' module;
+    #this is the same as merging with the daily macroeconomic data and forward filling, as the macroeconomic data is reported monthly, not daily
+    latest = pd.concat([latest, md.asof_join(latest.index)], axis = 1)
+
+    #drops the unnecessary rows
+    latest = latest.dropna()
 
     return latest
 
 
+'''
+Brings the saved feature state of the input ticker up to date by appending only the bars stored since the state was last updated, so that the features of the most recent day
+are available without deriving them over the ticker's history again. The feature state is rebuilt from the stored data if none was saved yet, if it was saved for different
+time horizons, or if the stored data no longer matches it (for example after yahoo finance adjusted past prices for a dividend)
+
+Parameters:
+ticker (string) --> should be a ticker saved from the 'Usable_Stocks' module for which a new prediction is desired
+refresh (bool) --> whether the newest bars should be downloaded into the price store first. Default set to True
+horizons (list of ints) --> the time horizons for which the features should be derived. Default set to 2, 5, 60, 250 and 1000, the defaults of the 'Model' class
+directory (string) --> where the feature states are saved. Default set to 'Feature_States'
+
+Return type: FeatureState from 'Feature_State' holding the features of the ticker's most recent trading day
+'''
+
+def update_feature_state(ticker, refresh = True, horizons = (2, 5, 60, 250, 1000), directory = Feature_State.DEFAULT_DIRECTORY):
+    history = Price_Store.get_history(ticker, refresh = refresh)
+    state = Feature_State.load_state(ticker, directory)
+
+    #checks whether the saved feature state can be continued from the stored data
+    usable = state is not None and state.horizons == list(horizons) and state.last_date in history.index
+    if usable:
+        stored_close = history.loc[state.last_date, 'Close']
+        usable = abs(stored_close - state.last_close()) <= 1e-6 * abs(stored_close)
+
+    if usable:
+        new_bars = history[history.index > state.last_date]
+        for date, close in zip(new_bars.index, new_bars['Close'].to_numpy()):
+            state.update(date, close)
+    else:
+        state = Feature_State.FeatureState.from_history(history, list(horizons))
+
+    Feature_State.save_state(ticker, state, directory)
+
+    return state
+
+
+'''
+Creates the single row of data the model of the input ticker needs to predict the next trading day, using the ticker's feature state instead of deriving the features over its history.
+The row holds the same columns as the row returned by 'preprocess_latest_data'
+
+Parameters:
+ticker (string) --> should be a ticker saved from the 'Usable_Stocks' module for which a new prediction is desired
+refresh (bool) --> whether the newest bars should be downloaded into the price store first. Default set to True
+horizons (list of ints) --> the time horizons for which the features should be derived. Default set to 2, 5, 60, 250 and 1000, the defaults of the 'Model' class
+
+Return type: Pandas DataFrame containing a singular row representing the stock's most recent full trading day
+'''
+
+def preprocess_latest_bar(ticker, refresh = True, horizons = (2, 5, 60, 250, 1000)):
+    latest = update_feature_state(ticker, refresh, horizons).latest_features()
+
+    #takes the most recent macroeconomic data reported on or before the trading day, which is the same value forward filling the merged data would give
+    return pd.concat([latest, md.asof_join(latest.index)], axis = 1)
+
+
 '''
 Feeds the ticker and its data into the model previously saved in 'Serialization' so that a predicition for tomorrow's price can be generated
 
 Parameters:
 ticker (string) --> the ticker for which a new price prediction is desired
 model (model class from 'Model_Builder') --> the model previously saved in 'Serialization' and corresponding to the input ticker
+use_feature_state (bool) --> whether the features should come from the ticker's feature state, see 'preprocess_latest_bar'. Default set to True;
+when set to False, the features are derived over the ticker's latest data with 'preprocess_latest_data'
 
 Return type: a list containing a single percentage representing the likelihood of the stock's price increasing during the next trading day
 '''
 
-def generate_predictions(ticker, model):
-    #preprocesses the data for the input ticker by sending it to the preprocess_latest_data function
-    latest_data = preprocess_latest_data(ticker)
+def generate_predictions(ticker, model, use_feature_state = True):
+    #preprocesses the data for the input ticker; models saved before the time horizons were recorded used the defaults
+    horizons = tuple(getattr(model, 'horizons', (2, 5, 60, 250, 1000)))
+    with Instrumentation.stage('preprocess', ticker = ticker):
+        if use_feature_state:
+            latest_data = preprocess_latest_bar(ticker, horizons = horizons)
+        else:
+            latest_data = preprocess_latest_data(ticker, horizons = horizons)
 
     #sends the latest data to the input model's instance method 'future_predictions' to generate the latest prediction
-    prediction = model.future_predictions(latest_data)
+    with Instrumentation.stage('future_predictions', ticker = ticker):
+        prediction = model.future_predictions(latest_data)
 
     return prediction
 
@@ -103,7 +131,8 @@ Return type: dictionary which uses the tickers as keys and their price increase
 
 def generate_all_predictions():
     #calls 'Serialization' to load all the models into a dictionary that includes the ticker as its key and the associated model as its value
-    models = all_models.load_all_models()
+    with Instrumentation.stage('load_models'):
+        models = all_models.load_all_models()
     
     #initializes a dictionary variable to hold the tickers as keys and their price increase predictions for the next day
     predictions = dict()
@@ -111,12 +140,75 @@ def generate_all_predictions():
     #loops through all the tickers and models to generate a prediction for each;
     #formats these predictions as a neat string with the values rounded to two decimal places
     for ticker, model in models.items():
-        prediction = generate_predictions(ticker, model)
+        with Instrumentation.stage('predict_ticker', ticker = ticker):
+            prediction = generate_predictions(ticker, model)
         prediction_percentage = round(prediction[0] * 100, 2)
         predictions[ticker] = str(prediction_percentage) + '%'
 
     return predictions
 
+'''
+Generates predictions for all the models saved in 'Serialization' as one batch. The latest bars of every ticker are fetched at the same time, the macroeconomic data is
+joined once for all tickers, and the latest rows of all tickers are stacked into one DataFrame. Tickers sharing the same model are then predicted together in batches,
+so the time taken is bounded by the slowest download instead of the sum of all of them
+
+Parameters:
+max_workers (int) --> the maximum number of tickers fetched at the same time. Default set to 8
+batch_size (int) --> the maximum number of rows passed to a model in a single prediction. Default set to 256
+refresh (bool) --> whether the newest bars should be downloaded into the price store first. Default set to True
+
+Return type: tuple of two dictionaries. The first uses the tickers as keys and their price increase predictions for the next trading day as values, the same as 'generate_all_predictions'.
+The second holds the number of seconds each stage took, with the keys 'Load Models', 'Fetch', 'Features', 'Predict' and 'Total'
+'''
+
+def generate_all_predictions_batch(max_workers = 8, batch_size = 256, refresh = True):
+    timings = dict()
+    start = time.perf_counter()
+
+    #calls 'Serialization' to load all the models into a dictionary that includes the ticker as its key and the associated model as its value
+    models = all_models.load_all_models()
+    tickers = list(models.keys())
+    timings['Load Models'] = time.perf_counter() - start
+
+    #fetches the new bars of every ticker and updates their feature states at the same time, as most of the time is spent waiting on the network;
+    #models saved before the time horizons were recorded used the defaults
+    stage = time.perf_counter()
+    horizons = [tuple(getattr(models[ticker], 'horizons', (2, 5, 60, 250, 1000))) for ticker in tickers]
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        states = list(executor.map(lambda ticker, ticker_horizons: update_feature_state(ticker, refresh, ticker_horizons), tickers, horizons))
+    timings['Fetch'] = time.perf_counter() - stage
+
+    #stacks the latest row of every ticker into one DataFrame indexed by ticker, and joins the macroeconomic data for all of their dates at once,
+    #the same as in 'preprocess_latest_bar'
+    stage = time.perf_counter()
+    latest = pd.concat([state.latest_features() for state in states])
+    latest = pd.concat([latest, md.asof_join(latest.index)], axis = 1).set_axis(pd.Index(tickers, name = 'Ticker'))
+    timings['Features'] = time.perf_counter() - stage
+
+    #groups the tickers by model, so that a model shared by several tickers predicts all of their rows together
+    stage = time.perf_counter()
+    groups = dict()
+    for ticker in tickers:
+        groups.setdefault(id(models[ticker]), []).append(ticker)
+
+    probabilities = dict()
+    for group in groups.values():
+        model = models[group[0]]
+        for batch_start in range(0, len(group), batch_size):
+            batch = group[batch_start : (batch_start + batch_size)]
+            for ticker, probability in zip(batch, model.future_predictions(latest.loc[batch])):
+                probabilities[ticker] = probability
+    timings['Predict'] = time.perf_counter() - stage
+
+    #formats the predictions as a neat string with the values rounded to two decimal places, in the same order as the models were loaded
+    predictions = dict()
+    for ticker in tickers:
+        predictions[ticker] = str(round(probabilities[ticker] * 100, 2)) + '%'
+
+    timings['Total'] = time.perf_counter() - start
+
+    return predictions, timings
+
 #uncomment the below line and run the file to see the list of predictions in the terminal
 #important note: the Fred API key in 'Macro_Data' and the paths in 'Serialization' all need to be adjusted in order to run the file on your own
 
@@ -0,0 +1,246 @@
+import os
+import time
+import pickle
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import precision_score
+import Macro_Data as md
+import Feature_Engine
+import Instrumentation
+import Model_Builder
+from Forest_Predictor import ArrayForest
+
+#the column identifying the ticker of each row of the panel, added to the predictors of every ticker
+TICKER_COLUMN = 'Ticker_Id'
+
+
+'''
+Class used to create one pooled model for many tickers instead of one model per ticker. The data of every ticker is built the same way as in 'Model', stacked into a single
+float32 matrix ordered by date, and given a column identifying its ticker. The pooled model is then backtested the same way as 'backtest' of 'Model', except that the periods are
+split by trading day instead of by row, so every period is trained only on the days before it across all tickers and never sees the future of another ticker.
+
+The precision of each ticker is computed from the days its own 'Model' would have backtested, starting from its 2500th row, so it can be compared with the scores in Precision_Scores.pkl
+
+Parameters:
+tickers (list of strings) --> the tickers pooled into the model. Tickers without enough data to train on are skipped, the same as they would fail in 'Model'
+num_trees (int) --> the number of trees of the Random Forest Classifier. Default set to 300
+num_leaves (int) --> the minimum number of leaves a decision tree node can have. Default set to 50
+horizons (list of ints) --> the time horizons of the price features. Default set to 2, 5, 60, 250 and 1000, the defaults of 'Model'
+n_jobs (int) --> the number of cores the backtest may use, shared between backtesting periods and trees the same way as in 'Model'. Default set to 1, -1 uses all cores
+refresh_data (bool) --> whether the newest price data should be downloaded into the price store first. Default set to True
+threshold (float) --> the probability above which a price increase is predicted, the same as in 'Model'. Default set to 0.6
+'''
+
+class PanelModel():
+
+    '''
+    Instance variables:
+    tickers (list of strings) --> holds the tickers pooled into the model, in the order of their identifiers
+    skipped (dictionary) --> holds the tickers that could not be pooled as keys, with the reason as values
+    threshold (float) --> holds the probability above which a price increase is predicted
+    horizons (list of ints) --> holds the time horizons of the price features
+    predictors (list of strings) --> holds the price features, the macroeconomic features and TICKER_COLUMN, in the order the model was trained on
+    features (NumPy array) --> holds the float32 matrix of the predictors of every ticker, ordered by date
+    target (NumPy array) --> holds the 'Target' of every row of features
+    dates (Pandas DatetimeIndex) --> holds the date of every row of features
+    row_tickers (NumPy array) --> holds the ticker of every row of features
+    first_test_dates (dictionary) --> holds the first day each ticker's own 'Model' would have backtested, with the tickers as keys
+    model (RandomForestClassifier) --> holds the pooled model, trained on all but the last period of data the same as 'Model'
+    predictions (Pandas DataFrame) --> holds the backtested predictions of every ticker, with a 'Ticker' column
+    precision_score (float) --> holds the precision of all the backtested predictions together
+    training_seconds (float) --> holds the number of seconds the backtest took
+    forest (ArrayForest) --> holds the pooled model flattened by 'Forest_Predictor'
+    '''
+
+    def __init__(self, tickers, num_trees = 300, num_leaves = 50, horizons = (2, 5, 60, 250, 1000), n_jobs = 1, refresh_data = True, threshold = 0.6):
+        self.horizons = list(horizons)
+        self.threshold = threshold
+        self.skipped = dict()
+
+        #builds each ticker's data, keeping only the tickers 'Model' could train on
+        frames = dict()
+        for ticker in tickers:
+            try:
+                with Instrumentation.stage('panel_prepare', ticker = ticker):
+                    frames[ticker] = self.ticker_data(ticker, refresh_data)
+            except ValueError as error:
+                self.skipped[ticker] = str(error)
+
+        if not frames:
+            raise ValueError('None of the tickers have enough data to train a model')
+
+        self.tickers = list(frames.keys())
+        self.predictors = Feature_Engine.feature_columns(self.horizons) + list(Model_Builder.Model.macro_predictors) + [TICKER_COLUMN]
+
+        #the first day each ticker's own model would have backtested, which is its 2500th row, the default start of 'backtest'
+        self.first_test_dates = {ticker: frame.index[2500] for ticker, frame in frames.items() if frame.shape[0] > 2500}
+
+        #stacks the tickers into one matrix ordered by date, so that the days before any date are a prefix of the rows and every period uses slices without copying
+        with Instrumentation.stage('panel_stack'):
+            panel = pd.concat([frame.assign(**{TICKER_COLUMN: identifier}) for identifier, frame in enumerate(frames.values())])
+            order = np.argsort(panel.index.to_numpy(), kind = 'stable')
+            panel = panel.iloc[order]
+
+            self.features = np.ascontiguousarray(panel[self.predictors].to_numpy(dtype = np.float32))
+            self.target = panel['Target'].to_numpy()
+            self.dates = panel.index
+            self.row_tickers = np.array(self.tickers, dtype = object)[panel[TICKER_COLUMN].to_numpy()]
+            del panel, frames
+
+        self.model = RandomForestClassifier(n_estimators = num_trees, min_samples_split = num_leaves, random_state = 1)
+
+        started = time.perf_counter()
+        with Instrumentation.stage('panel_backtest'):
+            self.predictions = self.backtest(self.model, n_jobs = n_jobs)
+        self.training_seconds = time.perf_counter() - started
+
+        self.precision_score = precision_score(self.predictions['Target'], self.predictions['Predictions'], zero_division = 0)
+        self.forest = ArrayForest.from_sklearn(self.model)
+
+
+    '''
+    Builds the data of a single ticker the same way as 'Model': its price features, the macroeconomic data on its trading days, and the same range of dates
+
+    Parameters:
+    ticker (string) --> the ticker whose data is built
+    refresh (bool) --> whether the newest price data should be downloaded into the price store first
+
+    Return type: Pandas DataFrame holding the predictors, except TICKER_COLUMN, along with 'Target'
+    '''
+
+    def ticker_data(self, ticker, refresh):
+        #the data is loaded the same way as 'Model', which raises a ValueError if the ticker cannot be retrieved
+        data = Model_Builder.prepare_data(ticker, refresh)
+        data = pd.concat([data, Feature_Engine.derive_price_features(data, self.horizons)], axis = 1).dropna()
+        full_data = pd.concat([data, md.asof_join(data.index)], axis = 1)
+
+        #checks that there is enough data to train on, and uses the same range of data as 'split_sets' of 'Model'
+        return Model_Builder.training_range(full_data)
+
+
+    '''
+    Backtests the pooled model by trading day. The periods start on the 2500th trading day of the panel and each covers the next 250 trading days, the same as 'backtest' of 'Model'
+    for a ticker with data since 1990. Each period is trained on every row before its first day and predicts every row within it
+
+    Parameters:
+    model (RandomForestClassifier) --> the instance variable model
+    start (int) --> the first trading day backtested. Default set to 2500
+    step (int) --> the number of trading days in each backtesting period. Default set to 250
+    n_jobs (int) --> the number of cores to use, see 'split_cores' in 'Model_Builder'. Default set to 1
+
+    Return type: Pandas DataFrame holding all the backtested predictions, the same as 'backtest' of 'Model' along with a 'Ticker' column
+    '''
+
+    def backtest(self, model, start = 2500, step = 250, n_jobs = 1):
+        #the first row of every period is the first row of its first trading day, found in the rows ordered by date
+        days = self.dates.unique()
+        bounds = np.searchsorted(self.dates, days[list(range(start, len(days), step))]).tolist() + [self.features.shape[0]]
+        fold_jobs, tree_jobs = Model_Builder.split_cores(n_jobs, len(bounds) - 1)
+
+        model.set_params(n_jobs = tree_jobs)
+
+        #every period except the last fits its own clone of the input model, made within the period so it is freed once the period is predicted, the same as 'backtest' of 'Model'.
+        #periods running at the same time are recorded as threaded stages, so their CPU time and memory are not those of every period running
+        fold_stage = Instrumentation.thread_stage if fold_jobs > 1 else Instrumentation.stage
+
+        def predict_fold(fold, split, end):
+            fold_model = model if fold == len(bounds) - 2 else clone(model)
+
+            with fold_stage('panel_backtest_fold', fold = fold):
+                fold_model.fit(self.features[:split], self.target[:split])
+                percentages = fold_model.predict_proba(self.features[split:end])[:, 1]
+
+            #the same columns as 'fit_and_predict' in 'Model_Builder'
+            return pd.DataFrame({
+                'Ticker': self.row_tickers[split:end],
+                'Target': self.target[split:end],
+                'Prediction_Percentages': percentages,
+                'Predictions': (percentages > self.threshold).astype(int)
+            }, index = self.dates[split:end])
+
+        all_predictions = Parallel(n_jobs = fold_jobs, prefer = 'threads')(
+            delayed(predict_fold)(fold, bounds[fold], bounds[fold + 1]) for fold in range(len(bounds) - 1)
+        )
+
+        return pd.concat(all_predictions)
+
+
+    '''
+    Computes the precision of each ticker over the days its own 'Model' would have backtested, in the same format as Precision_Scores.pkl
+
+    Return type: dictionary with the tickers as keys and their precision scores as values. Tickers with fewer than 2500 rows, which 'Model' could not backtest, are left out
+    '''
+
+    def ticker_precision_scores(self):
+        scores = dict()
+
+        for ticker, predictions in self.predictions.groupby('Ticker', sort = False):
+            if ticker not in self.first_test_dates:
+                continue
+
+            predictions = predictions.loc[predictions.index >= self.first_test_dates[ticker]]
+            scores[ticker] = precision_score(predictions['Target'], predictions['Predictions'], zero_division = 0)
+
+        return {ticker: scores[ticker] for ticker in self.tickers if ticker in scores}
+
+
+    '''
+    Generates predictions for the latest rows of several tickers, such as the rows stacked by 'generate_all_predictions_batch' in 'New_Predictions'
+
+    Parameters:
+    latest_data (Pandas DataFrame) --> indexed by ticker, holding the latest macroeconomic and derived price features of each ticker. Every ticker must be one the model was trained on
+
+    Return type: NumPy array of percentages representing the model's predictions of price increases, in the order of the rows
+    '''
+
+    def future_predictions(self, latest_data):
+        identifiers = {ticker: identifier for identifier, ticker in enumerate(self.tickers)}
+        unknown = [ticker for ticker in latest_data.index if ticker not in identifiers]
+        if unknown:
+            raise ValueError('The panel model was not trained on: ' + ', '.join(map(str, unknown)))
+
+        rows = latest_data.assign(**{TICKER_COLUMN: [identifiers[ticker] for ticker in latest_data.index]})[self.predictors]
+
+        return Model_Builder.predict_increases(self.model, self.forest, rows.astype(np.float32))
+
+
+'''
+Compares the per-ticker precision of a panel model with the precision of each ticker's own model, along with the size of what is loaded to serve each of them
+
+Parameters:
+panel (PanelModel) --> the trained panel model
+filename (string) --> the file of the per-ticker precision scores saved by 'save_all_precision_scores' in 'Serialization'. Default set to 'Precision_Scores.pkl'
+directory (string) --> where the precision scores and the inference artifacts of the per-ticker models were saved. Default set to ''
+
+Return type: Pandas DataFrame indexed by ticker holding the 'Panel_Precision', the 'Ticker_Precision' from the saved scores, the 'Difference' between them,
+and the 'Artifact_Bytes' of each ticker's saved inference artifact. Scores or artifacts that were not saved are left as NaN
+'''
+
+def compare_to_ticker_models(panel, filename = 'Precision_Scores.pkl', directory = ''):
+    try:
+        with open(os.path.join(directory, filename), 'rb') as file:
+            ticker_scores = pickle.load(file)
+    except FileNotFoundError:
+        ticker_scores = dict()
+
+    rows = []
+    for ticker, panel_score in panel.ticker_precision_scores().items():
+        artifact_bytes = np.nan
+        for suffix in ('_Artifact.pkl', '_Artifact.pkl.buffers'):
+            filepath = os.path.join(directory, str(ticker) + suffix)
+            if os.path.exists(filepath):
+                artifact_bytes = np.nansum([artifact_bytes, os.path.getsize(filepath)])
+
+        ticker_score = ticker_scores.get(ticker, np.nan)
+        rows.append({
+            'Ticker': ticker,
+            'Panel_Precision': panel_score,
+            'Ticker_Precision': ticker_score,
+            'Difference': panel_score - ticker_score,
+            'Artifact_Bytes': artifact_bytes
+        })
+
+    return pd.DataFrame(rows).set_index('Ticker')
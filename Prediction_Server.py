@@ -0,0 +1,477 @@
+import json
+import time
+import asyncio
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import Macro_Data as md
+import Instrumentation
+import New_Predictions
+import Model_Index
+from Model_Registry import ModelRegistry
+
+#a long-running local service answering prediction requests over HTTP or a Unix socket. The models, the macroeconomic features and the latest row of features of every ticker
+#are kept in memory between requests, so a request does not pay for starting Python, importing the project and loading every model the way 'generate_all_predictions' does
+
+#the reasons given with each HTTP status code the server answers with
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+'''
+Class used to serve predictions from the saved inference artifacts. Requests are queued and merged into micro-batches: the queue is read for up to 'max_wait' seconds after the
+first request arrives, and every request read in that time is answered together. The tickers of a batch are looked up once however many requests asked for them, the tickers
+whose features are stale are fetched together with one as-of join of the macroeconomic data, and each model scores the rows of its tickers in one call to its forest.
+The batches are run one at a time on a background thread, so the event loop keeps accepting requests while a batch is scored.
+
+The latest row of features of a ticker is kept for 'feature_ttl' seconds. When it expires, the ticker's feature state is updated with any new bars, the same as
+'update_feature_state' in 'New_Predictions'
+
+Parameters:
+manifest_path (string) --> the path of the manifest written by 'save_manifest' in 'Serialization'. Default set to 'Model_Manifest.json'
+max_models (int) --> the maximum number of models kept in memory, see 'ModelRegistry'. Default set to None, meaning no limit
+max_bytes (int) --> the maximum total size of the models kept in memory, see 'ModelRegistry'. Default set to None, meaning no limit
+refresh (bool) --> whether the newest bars should be downloaded when the features of a ticker are updated. Default set to True
+feature_ttl (float) --> the number of seconds the latest features of a ticker are reused before they are updated. Default set to 300
+max_batch_size (int) --> the largest number of requests merged into one batch. Default set to 256
+max_wait (float) --> the number of seconds a batch waits for more requests after its first one. Default set to 0.002
+max_workers (int) --> the largest number of tickers whose features are updated at the same time. Default set to 8
+latency_window (int) --> the number of latest requests of each path the latency percentiles are computed from. Default set to 10000
+'''
+
+class PredictionServer():
+
+    '''
+    Instance variables:
+    registry (ModelRegistry) --> holds the models, loaded the first time each ticker is requested
+    thresholds (dictionary) --> holds the thresholds chosen with 'Threshold_Sweep' and recorded in the index of 'Model_Index' next to the manifest, read once when the server starts
+    refresh (bool) --> holds whether the newest bars are downloaded when features are updated
+    feature_ttl (float) --> holds the number of seconds the latest features of a ticker are reused
+    max_batch_size (int) --> holds the largest number of requests merged into one batch
+    max_wait (float) --> holds the number of seconds a batch waits for more requests
+    features (dictionary) --> holds the time the features of each ticker were updated, the date of its latest bar and its row of predictors, with the tickers as keys
+    feature_hits (int) --> holds the number of times the features of a ticker were still fresh when requested
+    feature_misses (int) --> holds the number of times the features of a ticker had to be updated
+    batches (int) --> holds the number of batches scored
+    batched_requests (int) --> holds the number of requests answered by those batches
+    batched_tickers (int) --> holds the number of distinct tickers scored by those batches
+    latencies (dictionary) --> holds the seconds taken by the latest requests of each path, with the paths as keys
+    started_at (float) --> holds the time the server was created
+    '''
+
+    def __init__(self, manifest_path = 'Model_Manifest.json', max_models = None, max_bytes = None, refresh = True, feature_ttl = 300, max_batch_size = 256, max_wait = 0.002,
+                 max_workers = 8, latency_window = 10000):
+        self.registry = ModelRegistry(manifest_path, max_models, max_bytes)
+        self.thresholds = {ticker: threshold for ticker, (threshold, _) in Model_Index.load_chosen_thresholds(self.registry.directory).items()}
+        self.refresh = refresh
+        self.feature_ttl = feature_ttl
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.latency_window = latency_window
+
+        self.features = dict()
+        self.feature_hits = 0
+        self.feature_misses = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.batched_tickers = 0
+        self.latencies = dict()
+        self.started_at = time.monotonic()
+
+        #batches are scored one at a time on their own thread, and the features of stale tickers are updated on a pool of threads as most of that time is spent on the network
+        self._batch_executor = ThreadPoolExecutor(max_workers = 1)
+        self._fetch_executor = ThreadPoolExecutor(max_workers = max_workers)
+        self._queue = None
+        self._batcher = None
+        self._servers = []
+
+
+    '''
+    Loads every model in the manifest, the macroeconomic features and the latest features of every ticker, so that the first requests do not have to wait for them
+
+    Parameters:
+    tickers (list of strings) --> the tickers to load. Default set to None, which loads every ticker in the manifest
+
+    Return type: dictionary with the tickers whose features could not be loaded as keys, and the reason as values
+    '''
+
+    def warm(self, tickers = None):
+        tickers = self.registry.tickers() if tickers is None else list(tickers)
+
+        self.registry.prefetch(tickers).result()
+        md.get_macro_matrix()
+
+        return {ticker: str(error) for ticker, error in self.update_features(tickers).items()}
+
+
+    '''
+    Updates the latest features of the input tickers whose features are missing or older than 'feature_ttl'. The feature states of the stale tickers are updated at the same time,
+    and the macroeconomic data is joined onto all of their rows at once, the same as 'generate_all_predictions_batch' in 'New_Predictions'
+
+    Parameters:
+    tickers (list of strings) --> the tickers whose features are needed
+
+    Return type: dictionary with the tickers whose features could not be updated as keys, and the exception raised as values
+    '''
+
+    def update_features(self, tickers):
+        now = time.monotonic()
+        stale = [ticker for ticker in tickers if ticker not in self.features or now - self.features[ticker][0] > self.feature_ttl]
+        self.feature_hits += len(tickers) - len(stale)
+        self.feature_misses += len(stale)
+
+        if not stale:
+            return dict()
+
+        with Instrumentation.stage('server_features', tickers = len(stale)):
+            results = list(self._fetch_executor.map(self._load_state, stale))
+
+            errors = {ticker: result for ticker, result in zip(stale, results) if isinstance(result, Exception)}
+            loaded = [(ticker, result) for ticker, result in zip(stale, results) if not isinstance(result, Exception)]
+            if not loaded:
+                return errors
+
+            latest = pd.concat([state.latest_features() for _, state in loaded])
+            dates = latest.index
+            latest = pd.concat([latest, md.asof_join(dates)], axis = 1).set_axis(pd.Index([ticker for ticker, _ in loaded], name = 'Ticker'))
+
+        for position, (ticker, _) in enumerate(loaded):
+            self.features[ticker] = (now, dates[position], latest.iloc[[position]])
+
+        return errors
+
+
+    '''
+    Predicts the input tickers from their latest features. This is the work of a single batch, and may also be called directly without running the server
+
+    Parameters:
+    tickers (list of strings) --> the tickers to predict
+
+    Return type: dictionary with the tickers as keys, and as values either a dictionary holding the 'probability' of a price increase, the 'threshold' of the ticker (the one
+    chosen with 'Threshold_Sweep', or else the one its model was trained with), whether the probability is above it as 'signal' and the date of the latest bar as 'as_of',
+    or the exception raised for that ticker
+    '''
+
+    def predict_batch(self, tickers):
+        results = dict()
+
+        #unknown tickers are answered without fetching anything for them
+        known = []
+        for ticker in tickers:
+            if ticker in self.registry:
+                known.append(ticker)
+            else:
+                results[ticker] = KeyError('No model in the manifest for ' + str(ticker))
+
+        results.update(self.update_features(known))
+
+        with Instrumentation.stage('server_predict', tickers = len(known)):
+            for ticker in known:
+                if ticker in results:
+                    continue
+
+                try:
+                    model = self.registry.get(ticker)
+                    _, as_of, row = self.features[ticker]
+                    probability = float(model.future_predictions(row)[0])
+                except Exception as error:
+                    results[ticker] = error
+                    continue
+
+                threshold = self.thresholds.get(ticker, model.metadata.get('threshold', 0.6))
+                results[ticker] = {
+                    'probability': probability,
+                    'threshold': threshold,
+                    'signal': probability > threshold,
+                    'as_of': as_of.strftime('%Y-%m-%d')
+                }
+
+        return results
+
+
+    '''
+    Predicts the input tickers through the micro-batching queue, so that requests arriving at about the same time share one batch. Must be called while the server is running
+
+    Parameters:
+    tickers (list of strings) --> the tickers to predict
+
+    Return type: dictionary in the same format as 'predict_batch'
+    '''
+
+    async def predict(self, tickers):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(tickers), future))
+
+        return await future
+
+
+    '''
+    Returns how the server has performed so far
+
+    Return type: dictionary holding the 'uptime_seconds', the 'latency' percentiles in milliseconds of each path, the 'batching' counts, the hit rate of the 'features'
+    and the hit rate of the 'models' kept by the registry
+    '''
+
+    def stats(self):
+        latency = dict()
+        for path, seconds in self.latencies.items():
+            milliseconds = np.array(seconds) * 1000
+            p50, p90, p99 = np.percentile(milliseconds, [50, 90, 99])
+            latency[path] = {'count': len(milliseconds), 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': milliseconds.max()}
+
+        feature_accesses = self.feature_hits + self.feature_misses
+
+        return {
+            'uptime_seconds': time.monotonic() - self.started_at,
+            'latency': latency,
+            'batching': {
+                'batches': self.batches,
+                'requests': self.batched_requests,
+                'requests_per_batch': self.batched_requests / self.batches if self.batches else 0.0,
+                'tickers_per_batch': self.batched_tickers / self.batches if self.batches else 0.0
+            },
+            'features': {
+                'hits': self.feature_hits,
+                'misses': self.feature_misses,
+                'hit_rate': self.feature_hits / feature_accesses if feature_accesses else 0.0,
+                'cached': len(self.features)
+            },
+            'models': self.registry.stats()
+        }
+
+
+    '''
+    Answers a single request. The server understands:
+    GET /predict?tickers=A,B (or POST /predict with a JSON body such as {"tickers": ["A", "B"]}) --> the predictions of the tickers, along with the 'errors' of the ones that failed
+    GET /stats --> the output of 'stats'
+    GET /health --> whether the server is up, and the number of models in the manifest
+    POST /refresh --> forgets the latest features of every ticker, so they are updated on their next request
+
+    Parameters:
+    method (string) --> the HTTP method of the request
+    target (string) --> the path and query string of the request
+    body (bytes) --> the body of the request
+
+    Return type: tuple of the HTTP status code and the dictionary answered as JSON
+    '''
+
+    async def handle(self, method, target, body):
+        url = urlsplit(target)
+
+        if url.path == '/predict':
+            if method == 'GET':
+                tickers = [ticker for value in parse_qs(url.query).get('tickers', []) + parse_qs(url.query).get('ticker', []) for ticker in value.split(',') if ticker]
+            elif method == 'POST':
+                try:
+                    tickers = json.loads(body or b'{}').get('tickers', [])
+                except (ValueError, AttributeError):
+                    return 400, {'error': 'The body should be a JSON object such as {"tickers": ["A", "B"]}'}
+            else:
+                return 405, {'error': 'Use GET or POST for /predict'}
+
+            if not tickers or not isinstance(tickers, list):
+                return 400, {'error': 'No tickers were requested'}
+
+            results = await self.predict([str(ticker) for ticker in tickers])
+            return 200, {
+                'predictions': {ticker: result for ticker, result in results.items() if not isinstance(result, Exception)},
+                'errors': {ticker: str(result.args[0] if result.args else result) for ticker, result in results.items() if isinstance(result, Exception)}
+            }
+
+        if url.path == '/stats':
+            return 200, self.stats()
+
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'models': len(self.registry)}
+
+        if url.path == '/refresh':
+            if method != 'POST':
+                return 405, {'error': 'Use POST for /refresh'}
+
+            #the features are only read and written on the batch thread, so they are cleared there as well
+            cleared = await asyncio.get_running_loop().run_in_executor(self._batch_executor, self._clear_features)
+            return 200, {'cleared': cleared}
+
+        return 404, {'error': 'Unknown path ' + url.path}
+
+
+    '''
+    Starts accepting requests over TCP, or over a Unix socket if a path is given, along with the task merging requests into batches
+
+    Parameters:
+    host (string) --> the address to listen on. Default set to '127.0.0.1', which only accepts requests from this machine
+    port (int) --> the port to listen on. Default set to 8765
+    path (string) --> the path of a Unix socket to listen on instead of TCP. Default set to None
+
+    Return type: asyncio Server
+    '''
+
+    async def start(self, host = '127.0.0.1', port = 8765, path = None):
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._batch_loop())
+
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle_connection, path = path)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+
+        self._servers.append(server)
+
+        return server
+
+
+    '''
+    Warms the server, then answers requests until it is stopped
+
+    Parameters:
+    host (string) --> the address to listen on. Default set to '127.0.0.1'
+    port (int) --> the port to listen on. Default set to 8765
+    path (string) --> the path of a Unix socket to listen on instead of TCP. Default set to None
+    warm (bool) --> whether every model and the features of every ticker should be loaded before accepting requests. Default set to True
+    '''
+
+    async def serve_forever(self, host = '127.0.0.1', port = 8765, path = None, warm = True):
+        if warm:
+            failed = await asyncio.get_running_loop().run_in_executor(self._batch_executor, self.warm)
+            for ticker, reason in failed.items():
+                print('Could not load the features of ' + str(ticker) + ': ' + reason)
+
+        server = await self.start(host, port, path)
+        print('Serving ' + str(len(self.registry)) + ' models on ' + (path if path is not None else 'http://' + host + ':' + str(port)))
+
+        try:
+            await server.serve_forever()
+        finally:
+            await self.close()
+
+
+    '''
+    Stops accepting requests, stops the batching task and stops the background threads
+    '''
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+
+        self._batch_executor.shutdown(wait = True)
+        self._fetch_executor.shutdown(wait = True)
+        self.registry.close()
+
+
+    def _load_state(self, ticker):
+        try:
+            return New_Predictions.update_feature_state(ticker, self.refresh, tuple(self.registry.horizons(ticker)))
+        except Exception as error:
+            return error
+
+
+    def _clear_features(self):
+        cleared = len(self.features)
+        self.features.clear()
+        return cleared
+
+
+    #reads the first request waiting in the queue, then every request arriving within 'max_wait' seconds, and scores the distinct tickers of all of them as one batch
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            requests = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(requests) < self.max_batch_size:
+                if not self._queue.empty():
+                    requests.append(self._queue.get_nowait())
+                    continue
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+
+                try:
+                    requests.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            tickers = list(dict.fromkeys(ticker for request_tickers, _ in requests for ticker in request_tickers))
+
+            try:
+                results = await loop.run_in_executor(self._batch_executor, self.predict_batch, tickers)
+            except Exception as error:
+                results = {ticker: error for ticker in tickers}
+
+            self.batches += 1
+            self.batched_requests += len(requests)
+            self.batched_tickers += len(tickers)
+
+            for request_tickers, future in requests:
+                if not future.done():
+                    future.set_result({ticker: results[ticker] for ticker in request_tickers})
+
+
+    #reads requests from a connection until it is closed, keeping it open between requests unless the client asks otherwise
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                started = time.perf_counter()
+                parts = request_line.decode('latin-1').split()
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                if len(parts) != 3:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+
+                method, target, version = parts
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+
+                try:
+                    status, payload = await self.handle(method, target, body)
+                except Exception as error:
+                    status, payload = 500, {'error': str(error)}
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                await self._respond(writer, status, payload, keep_alive)
+
+                #the latency of each known path is kept, from reading the request line to writing the response
+                path = urlsplit(target).path
+                if path in ('/predict', '/stats', '/health', '/refresh'):
+                    self.latencies.setdefault(path, deque(maxlen = self.latency_window)).append(time.perf_counter() - started)
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default = float).encode('utf-8')
+        head = ('HTTP/1.1 ' + str(status) + ' ' + REASONS.get(status, '') + '\r\n' + 'Content-Type: application/json\r\n' + 'Content-Length: ' + str(len(body)) + '\r\n' +
+                'Connection: ' + ('keep-alive' if keep_alive else 'close') + '\r\n\r\n')
+
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
@@ -0,0 +1,154 @@
+import os
+import pandas as pd
+import yfinance as yf
+from Atomic_Files import atomic_write
+
+#the price data of each ticker is saved as its own Parquet file in this directory, so that models and predictions can be built without downloading the full history every time.
+#the directory can be seeded ahead of time (for example by copying it from another computer) to build models and generate predictions fully offline
+DEFAULT_DIRECTORY = 'Price_Data'
+
+#columns kept from the data downloaded from yahoo finance; 'Dividends' and 'Stock Splits' are not used by any of the models
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+'''
+Creates the path of the file holding the price data of the input ticker
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+directory (string) --> the directory of the price store
+
+Return type: string representing the path of the ticker's file
+'''
+
+def ticker_filepath(ticker, directory = DEFAULT_DIRECTORY):
+    return os.path.join(directory, str(ticker) + '.parquet')
+
+
+'''
+Downloads price data from yahoo finance and formats it the way it is stored: only the columns in 'COLUMNS' are kept and the timezone is removed from the index
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+start (Pandas Timestamp) --> the first date to download. Default set to None, which downloads the full history of the ticker
+
+Return type: Pandas DataFrame holding the downloaded price data, which is empty if yahoo finance returned nothing
+'''
+
+def download_history(ticker, start = None):
+    if start is None:
+        data = yf.Ticker(ticker).history(period = 'max')
+    else:
+        data = yf.Ticker(ticker).history(start = start.strftime('%Y-%m-%d'))
+
+    data = data[[column for column in COLUMNS if column in data]]
+    data.index = data.index.tz_localize(None)
+    data.index.name = 'Date'
+
+    return data
+
+
+'''
+Loads the price data of a ticker from the price store without accessing the network
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+directory (string) --> the directory of the price store
+columns (list of strings) --> the columns to load. Default set to None, which loads all the stored columns
+
+Return type: Pandas DataFrame holding the stored price data of the ticker, indexed by date. Raises a ValueError if the ticker has not been stored
+'''
+
+def load_history(ticker, directory = DEFAULT_DIRECTORY, columns = None):
+    filepath = ticker_filepath(ticker, directory)
+
+    if not os.path.exists(filepath):
+        raise ValueError('No stored price data for ' + str(ticker))
+
+    return pd.read_parquet(filepath, columns = columns)
+
+
+'''
+Saves the price data of a ticker to the price store with 'atomic_write' in 'Atomic_Files'
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+data (Pandas DataFrame) --> the price data to save, formatted as returned by 'download_history'
+directory (string) --> the directory of the price store
+'''
+
+def save_history(ticker, data, directory = DEFAULT_DIRECTORY):
+    #ensures that the path specified by the directory exists; if not, the directory is made
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    atomic_write(ticker_filepath(ticker, directory), data.to_parquet)
+
+
+'''
+Brings the stored price data of a ticker up to date. Only the bars from the last stored date onwards are downloaded and appended; the last stored bar is downloaded again
+since it may have been saved before the end of that trading day. If the ticker has not been stored yet, its full history is downloaded.
+
+Yahoo finance adjusts past prices for dividends and splits, so if the downloaded copy of the last stored bar does not match the stored one, the stored history is out of date
+and the full history is downloaded again instead
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+directory (string) --> the directory of the price store
+
+Return type: Pandas DataFrame holding the ticker's full, updated price data
+'''
+
+def refresh_history(ticker, directory = DEFAULT_DIRECTORY):
+    if not os.path.exists(ticker_filepath(ticker, directory)):
+        data = download_history(ticker)
+    else:
+        stored = load_history(ticker, directory)
+        last_date = stored.index[-1]
+        new_data = download_history(ticker, start = last_date)
+
+        if new_data.empty:
+            return stored
+
+        #compares the overlapping bar to check whether yahoo finance adjusted the past prices since the last refresh
+        if last_date in new_data.index:
+            stored_close = stored.loc[last_date, 'Close']
+            new_close = new_data.loc[last_date, 'Close']
+            adjusted = abs(new_close - stored_close) > 1e-6 * abs(stored_close)
+        else:
+            adjusted = False
+
+        if adjusted:
+            data = download_history(ticker)
+        else:
+            data = pd.concat([stored[stored.index < new_data.index[0]], new_data])
+
+    if data.empty:
+        raise ValueError('No data for the given ticker')
+
+    save_history(ticker, data, directory)
+
+    return data
+
+
+'''
+Returns the price data of a ticker, refreshing the price store first if requested
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+directory (string) --> the directory of the price store
+refresh (bool) --> whether the newest bars should be downloaded before returning the data. Default set to True.
+If the download fails, the stored data is returned instead so that the store can still be used without a network connection
+
+Return type: Pandas DataFrame holding the ticker's price data. Raises a ValueError if no data is available for the ticker
+'''
+
+def get_history(ticker, directory = DEFAULT_DIRECTORY, refresh = True):
+    if refresh:
+        try:
+            return refresh_history(ticker, directory)
+        except Exception:
+            #falls back on the stored data, which raises a ValueError itself if the ticker was never stored
+            pass
+
+    return load_history(ticker, directory)
@@ -1,25 +1,38 @@
 import pickle
 import os
+import time
+import queue
+import multiprocessing
+import json
+import gzip
+import mmap as mmap_module
+import Macro_Data as md
 import Model_Builder
+import Instrumentation
+import Model_Index
+from Atomic_Files import atomic_write
 import Usable_Stocks
 
 #IMPORTANT note: when calling any of these functions, the directory parameters must be adjusted to the desired paths of the user
 #it is recommended to create a specific directory for all the pickle files of the models and the precision scores
-#the lines where the directory parameters need to be adjusted are 20, 44, 63, 87, 147, and 178
+#the lines where the directory parameters need to be adjusted are 30, 57, 76, 100, 131, 193, 228, 256, 279, 303, 418, 588, 644, and 685
 
 '''
 Saves all the tickers deemed eligible from the 'Usable' module into a file so that webscraping does not need to happen each time a model should be made
 
 Parameters:
-tickers (list of strings) --> represents the list of usable tickers. Default is set to the variable 'usable' from the module 'Usable_Stocks'
+tickers (list of strings) --> represents the list of usable tickers. Default is set to None, which uses the variable 'usable' from the module 'Usable_Stocks'; the tickers are only scraped at that point
 filename (string) --> the filename of the file where the tickers will be saved. Default is set to 'Tickers_List.pkl' as a pickle file
 directory (string) --> where the file will be saved on the individual's computer
 '''
 
 #important note: change the default value of directory to the actual path where you want this file to be saved
-def save_tickers(tickers = Usable_Stocks.usable, filename = 'Tickers_List.pkl', directory = ''):
+def save_tickers(tickers = None, filename = 'Tickers_List.pkl', directory = ''):
+    if tickers is None:
+        tickers = Usable_Stocks.usable
+
     #ensures that the path specified by the directory exists; if not, the directory is made
-    if not os.path.exists(directory):
+    if directory and not os.path.exists(directory):
         os.makedirs(directory)
 
     #creates the full path from the input filename and the directory
@@ -62,7 +75,7 @@ directory (string) --> the name of the path where the model should be saved. Rec
 #important note: change the default value of directory to the actual path where you want this file to be saved
 def save_model(model, filename, directory = ''):
     #ensures that the path specified by the directory exists; if not, the directory is made
-    if not os.path.exists(directory):
+    if directory and not os.path.exists(directory):
         os.makedirs(directory)
     
     #creates the full path from the input filename and the directory
@@ -94,47 +107,531 @@ def load_model(filename, directory = ''):
 
 
 '''
-Saves all the models based on the tickers previously saved from 'save_tickers'
+Saves the inference artifact of a model, which only holds what is needed to make new predictions (see 'InferenceModel' in 'Model_Builder') instead of the full model
+with all of its training data. Artifacts are therefore much smaller and faster to load than the files written by 'save_model'.
+
+Uncompressed artifacts are written as two files: the pickled model, and a second file with the same name followed by '.buffers' holding the raw NumPy arrays of the trees.
+Pickle protocol 5 stores the arrays outside of the pickle itself, so 'load_artifact' can memory-map them from the second file instead of reading and copying them.
+The artifact of a random forest only holds its flattened 'ArrayForest', whose arrays are used straight from the mapped file; the artifacts of other backends hold the
+scikit-learn estimator, which copies its arrays into memory when it is loaded.
+
+Every artifact file starts with a small pickled header holding the artifact's metadata, its time horizons and the number of bytes it takes once loaded, followed by the
+artifact itself. 'load_artifact_header' reads only the header, so the manifest and the model index are written without loading any model
+
+Parameters:
+model (Model class from 'Model_Builder' module) --> the model whose artifact should be saved
+filename (string) --> the name of the artifact file. Recommended to end this argument with '_Artifact.pkl'
+directory (string) --> the name of the path where the artifact should be saved. Recommended to save these in the same directory as where all the models are saved
+compress (int) --> the level of gzip compression from 0 to 9. Default set to 0, meaning no compression. Compressed artifacts are a single file and cannot be memory-mapped
+
+Return type: InferenceModel class of module 'Model_Builder' that was saved
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def save_artifact(model, filename, directory = '', compress = 0):
+    #ensures that the path specified by the directory exists; if not, the directory is made
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    filepath = os.path.join(directory, filename)
+    artifact = model.to_inference_model()
+
+    if compress:
+        payload = pickle.dumps(artifact, protocol = 5)
+        with gzip.open(filepath, 'wb', compresslevel = compress) as file:
+            pickle.dump(_artifact_header(artifact, len(payload)), file, protocol = 5)
+            file.write(payload)
+        return artifact
+
+    #collects the arrays separately from the rest of the pickle, and writes each of them to the buffers file aligned to 64 bytes so they can be mapped as NumPy arrays
+    buffers = []
+    payload = pickle.dumps(artifact, protocol = 5, buffer_callback = buffers.append)
+    locations = []
+
+    with open(filepath + '.buffers', 'wb') as file:
+        for buffer in buffers:
+            raw = buffer.raw()
+            file.write(bytes(-file.tell() % 64))
+            locations.append((file.tell(), raw.nbytes))
+            file.write(raw)
+
+    with open(filepath, 'wb') as file:
+        pickle.dump(_artifact_header(artifact, len(payload) + sum(size for _, size in locations)), file, protocol = 5)
+        pickle.dump({'payload': payload, 'buffers': locations}, file, protocol = 5)
+
+    return artifact
+
+
+#the header written at the start of every artifact file by 'save_artifact'
+def _artifact_header(artifact, uncompressed_bytes):
+    return {'metadata': artifact.metadata, 'horizons': list(artifact.horizons), 'uncompressed_bytes': int(uncompressed_bytes)}
+
+
+#reads the header at the start of an open artifact file, along with the object after it. Artifacts saved before headers were written start with the object itself,
+#in which case the header is None
+def _read_artifact(file):
+    first = pickle.load(file)
+    if isinstance(first, dict) and 'metadata' in first:
+        return first, pickle.load(file)
+
+    return None, first
+
+
+'''
+Loads an inference artifact previously saved via the 'save_artifact' function
+
+Parameters:
+filename (string) --> the name of the artifact file. Should be the same as the string previously passed to 'save_artifact'
+directory (string) --> where the artifact should be loaded from. Should be the same as what was passed to 'save_artifact'
+mmap (bool) --> whether the arrays of an uncompressed artifact should be memory-mapped read-only instead of read into memory. Default set to True. Only the arrays of an
+'ArrayForest' stay in the mapped file; a scikit-learn estimator, as saved by backends other than a random forest, copies them into memory
+
+Return type: InferenceModel class of module 'Model_Builder'
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def load_artifact(filename, directory = '', mmap = True):
+    filepath = os.path.join(directory, filename)
+
+    with open(filepath, 'rb') as file:
+        #compressed artifacts are recognized by the two bytes every gzip file starts with
+        if file.read(2) == b'\x1f\x8b':
+            with gzip.open(filepath, 'rb') as compressed_file:
+                return _read_artifact(compressed_file)[1]
+
+        file.seek(0)
+        artifact = _read_artifact(file)[1]
+
+    with open(filepath + '.buffers', 'rb') as file:
+        if mmap and os.fstat(file.fileno()).st_size > 0:
+            data = memoryview(mmap_module.mmap(file.fileno(), 0, access = mmap_module.ACCESS_READ))
+        else:
+            data = memoryview(file.read())
+
+    buffers = [data[offset : (offset + size)] for offset, size in artifact['buffers']]
+
+    return pickle.loads(artifact['payload'], buffers = buffers)
+
+
+'''
+Reads the header of an inference artifact without loading the model it holds. Artifacts saved before headers were written are loaded in full to build it
+
+Parameters:
+filename (string) --> the name of the artifact file. Should be the same as the string previously passed to 'save_artifact'
+directory (string) --> where the artifact should be loaded from. Should be the same as what was passed to 'save_artifact'
+
+Return type: dictionary holding the artifact's 'metadata', its time 'horizons', and the 'uncompressed_bytes' the artifact takes once loaded, which is larger than
+its size on disk for a compressed artifact
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def load_artifact_header(filename, directory = ''):
+    filepath = os.path.join(directory, filename)
+
+    with open(filepath, 'rb') as file:
+        compressed = file.read(2) == b'\x1f\x8b'
+
+    #only the first pickle of the file is read, which for a compressed artifact also only decompresses the start of the file
+    with (gzip.open(filepath, 'rb') if compressed else open(filepath, 'rb')) as file:
+        header = pickle.load(file)
+
+    if isinstance(header, dict) and 'metadata' in header:
+        return header
+
+    artifact = load_artifact(filename, directory)
+    return _artifact_header(artifact, len(pickle.dumps(artifact, protocol = 5)))
+
+
+'''
+Saves the training diagnostics of a model, which are kept out of its inference artifact: the backtested predictions, including the probabilities of every backtested day,
+along with the precision score and the threshold it was computed with. 'Threshold_Sweep' evaluates other thresholds and metrics from these without building the model again
+
+Parameters:
+model (Model class from 'Model_Builder' module) --> the model whose diagnostics should be saved
+filename (string) --> the name of the pickle file where the diagnostics should be saved
+directory (string) --> the name of the path where the diagnostics should be saved
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def save_diagnostics(model, filename, directory = ''):
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    diagnostics = {'predictions': model.predictions, 'precision_score': model.precision_score, 'threshold': getattr(model, 'threshold', 0.6)}
+
+    filepath = os.path.join(directory, filename)
+    with open(filepath, 'wb') as file:
+        pickle.dump(diagnostics, file)
+
+
+'''
+Loads the training diagnostics previously saved via the 'save_diagnostics' function
+
+Parameters:
+filename (string) --> the name of the pickle file. Should be the same as the string previously passed to 'save_diagnostics'
+directory (string) --> where the diagnostics should be loaded from. Should be the same as what was passed to 'save_diagnostics'
+
+Return type: dictionary holding the backtested 'predictions' as a Pandas DataFrame, the 'precision_score' and the 'threshold'; diagnostics saved before the threshold
+was recorded used 0.6
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def load_diagnostics(filename, directory = ''):
+    filepath = os.path.join(directory, filename)
+
+    with open(filepath, 'rb') as file:
+        diagnostics = pickle.load(file)
+
+    diagnostics.setdefault('threshold', 0.6)
+
+    return diagnostics
+
+
+'''
+Builds and saves the model of a single ticker, and records it in the index of 'Model_Index'. Used by 'save_all_models' both when training in the main process and inside the worker processes of the training pool
+
+Parameters:
+ticker (string) --> the ticker for which a model should be built and saved
+directory (string) --> where the model should be saved. Should be the same as what is passed to 'load_model'
+full_model (bool) --> whether the full model should be saved with 'save_model' along with its inference artifact and diagnostics. Default set to True
+backend (string) --> the estimator the model is built with, one of the keys of BACKENDS in 'Model_Builder'. Default set to 'random_forest'
+
+Return type: float representing the wall time in seconds that it took to build and save the model
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def train_and_save_model(ticker, directory = '', full_model = True, backend = 'random_forest'):
+    start = time.perf_counter()
+
+    #creates a model variable using the 'Model_Builder' to be saved, and passes it along with the ticker's filenames to the saving functions
+    with Instrumentation.stage('build_model', ticker = ticker):
+        current_model = Model_Builder.Model(ticker, backend = backend)
+    training_seconds = time.perf_counter() - start
+
+    with Instrumentation.stage('save_artifact', ticker = ticker):
+        artifact = save_artifact(current_model, str(ticker) + '_Artifact.pkl', directory)
+
+    #records the model in the index so its score and information can be looked up without loading it
+    with Instrumentation.stage('index_model', ticker = ticker):
+        Model_Index.record_artifact(artifact.metadata, artifact.horizons, str(ticker) + '_Artifact.pkl', directory, training_seconds)
+
+    with Instrumentation.stage('save_diagnostics', ticker = ticker):
+        save_diagnostics(current_model, str(ticker) + '_Diagnostics.pkl', directory)
+
+    if full_model:
+        with Instrumentation.stage('save_model', ticker = ticker):
+            save_model(current_model, str(ticker) + '.pkl', directory)
+
+    return time.perf_counter() - start
+
+
+'''
+Target function of the worker processes started by 'save_all_models'. Trains a single ticker and reports the outcome back to the main process through the input queue
+
+Parameters:
+ticker (string) --> the ticker for which a model should be built and saved
+directory (string) --> where the model should be saved
+results (multiprocessing Queue) --> queue on which a tuple of (ticker, status, seconds, error, records) is put once the ticker has finished, where records are the stages
+recorded by 'Instrumentation'
+instrument (bool) --> whether the stages of the ticker should be recorded by 'Instrumentation', so they can be aggregated with the rest of the run. Default set to False
+track_memory (bool) --> whether the peak memory of those stages should be traced as well, the same as in the main process. Default set to False
+macro_handle (dictionary) --> the handle of the macroeconomic features shared by the main process with 'share_macro_matrix' in 'Macro_Data'. Default set to None,
+meaning the worker loads the features itself
+backend (string) --> the estimator the model is built with, see 'train_and_save_model'. Default set to 'random_forest'
+'''
+
+def _training_worker(ticker, directory, results, instrument = False, track_memory = False, macro_handle = None, backend = 'random_forest'):
+    start = time.perf_counter()
+
+    #attaches to the macroeconomic features in shared memory, so the worker neither loads nor copies them
+    if macro_handle is not None:
+        md.attach_macro_matrix(macro_handle)
+
+    #records inherited from the main process when the worker was forked are cleared, so only the stages of this ticker are reported back
+    if instrument:
+        Instrumentation.reset()
+        Instrumentation.enable(track_memory = track_memory)
+
+    #exceptions are caught so that the main process is always told about the outcome, instead of only seeing the worker process exit
+    try:
+        seconds = train_and_save_model(ticker, directory, backend = backend)
+        results.put((ticker, 'finished', seconds, None, Instrumentation.records()))
+    except Exception as error:
+        results.put((ticker, 'failed', time.perf_counter() - start, repr(error), Instrumentation.records()))
+
+
+'''
+Loads the checkpoint written by 'save_all_models', which records the outcome and wall time of every ticker that was trained during previous runs
+
+Parameters:
+filename (string) --> the name of the checkpoint file. Default set to 'Training_Checkpoint.pkl'
+directory (string) --> where the checkpoint is saved. Should be the same as what was passed to 'save_all_models'
+
+Return type: dictionary, where the keys are tickers and the values are dictionaries holding the 'status', 'seconds' and 'error' of the ticker's last training attempt.
+An empty dictionary is returned if no checkpoint exists yet
+'''
+
+def load_checkpoint(filename = 'Training_Checkpoint.pkl', directory = ''):
+    filepath = os.path.join(directory, filename)
+
+    if not os.path.exists(filepath):
+        return dict()
+
+    with open(filepath, 'rb') as file:
+        return pickle.load(file)
+
+
+'''
+Saves the training checkpoint with 'atomic_write' in 'Atomic_Files', so that a run interrupted in the middle of writing still resumes from the previous checkpoint
+
+Parameters:
+checkpoint (dictionary) --> the checkpoint to save, in the format returned by 'load_checkpoint'
+filename (string) --> the name of the checkpoint file. Default set to 'Training_Checkpoint.pkl'
+directory (string) --> where the checkpoint should be saved
+'''
+
+def save_checkpoint(checkpoint, filename = 'Training_Checkpoint.pkl', directory = ''):
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    atomic_write(os.path.join(directory, filename), lambda file: pickle.dump(checkpoint, file))
+
+
+'''
+Saves all the models based on the tickers previously saved from 'save_tickers'. A checkpoint is written each time a ticker finishes,
+so that a crashed or interrupted run can resume from where it stopped instead of rebuilding every model
+
+Parameters:
+workers (int) --> the number of worker processes that build models at the same time. Default set to 1, which trains the tickers one after another in the current process
+timeout (int or float) --> the maximum number of seconds a single ticker may take to train before its worker process is stopped. Default set to None, meaning no timeout.
+Setting a timeout always trains in worker processes, as a model cannot be stopped part of the way through otherwise
+resume (bool) --> whether tickers that finished during a previous run should be skipped. Default set to True
+directory (string) --> where the models and the checkpoint should be saved
+checkpoint_filename (string) --> the name of the checkpoint file. Default set to 'Training_Checkpoint.pkl'
+backend (string) --> the estimator every model is built with, one of the keys of BACKENDS in 'Model_Builder'. Default set to 'random_forest'. Tickers skipped when resuming
+keep the backend they were trained with
+
+Return type: dictionary in the format returned by 'load_checkpoint', holding the outcome and wall time of every ticker
 '''
 
-def save_all_models():
+#important note: change the default value of directory to the actual path where you want these files to be saved
+def save_all_models(workers = 1, timeout = None, resume = True, directory = '', checkpoint_filename = 'Training_Checkpoint.pkl', backend = 'random_forest'):
+    if not isinstance(workers, int) or workers <= 0:
+        raise ValueError('Number of workers must be a positive integer')
+
+    #an unknown backend is reported before any ticker starts, instead of failing every ticker one by one
+    if backend not in Model_Builder.BACKENDS:
+        raise ValueError('Unknown backend ' + repr(backend) + '; the backends are ' + ', '.join(Model_Builder.BACKENDS))
+
     #determines which tickers should models be saved for based on what was previously passed to 'save_tickers'
     tickers = load_tickers()
-    
-    #loops through all the tickers
-    for ticker in tickers:
-        print('Starting saving file for ' + str(ticker))
-        
-        #creates a model variable using the 'Model_Builder' to be saved
-        current_model = Model_Builder.Model(ticker)
-        
-        #creates the filename for the individual model
-        filename = str(ticker) + '.pkl'
 
-        #passes the model and the filename to the 'save_model' function
-        save_model(current_model, filename)
-        print('Finished saving file for ' + str(ticker))
+    #tickers that already finished during a previous run are skipped when resuming
+    checkpoint = load_checkpoint(checkpoint_filename, directory) if resume else dict()
+    pending = [ticker for ticker in tickers if checkpoint.get(ticker, {}).get('status') != 'finished']
+
+    if workers == 1 and timeout is None:
+        for ticker in pending:
+            print('Starting saving file for ' + str(ticker))
+            start = time.perf_counter()
+
+            try:
+                seconds = train_and_save_model(ticker, directory, backend = backend)
+                checkpoint[ticker] = {'status': 'finished', 'seconds': seconds, 'error': None}
+            except Exception as error:
+                checkpoint[ticker] = {'status': 'failed', 'seconds': time.perf_counter() - start, 'error': repr(error)}
+
+            save_checkpoint(checkpoint, checkpoint_filename, directory)
+            print(checkpoint[ticker]['status'].capitalize() + ' saving file for ' + str(ticker))
+    else:
+        checkpoint = _train_in_pool(pending, checkpoint, workers, timeout, directory, checkpoint_filename, backend)
+
+    #lists the newly saved artifacts in the manifest read by 'Model_Registry'
+    save_manifest(directory = directory)
+
+    #reports the wall time of each ticker, slowest first
+    print('Training wall time per ticker:')
+    for ticker, outcome in sorted(checkpoint.items(), key = lambda item: item[1]['seconds'], reverse = True):
+        print(str(ticker) + ': ' + str(round(outcome['seconds'], 2)) + 's (' + outcome['status'] + ')')
+
+    return checkpoint
 
 
 '''
-Loads all the models that were previously saved using 'save_all_models' into a dictionary with their tickers as the keys
+Trains the input tickers in a pool of worker processes for 'save_all_models'. Each ticker gets its own process so that a ticker exceeding the timeout can be stopped
+without affecting the others, and the checkpoint is updated as soon as any ticker finishes
+
+Parameters:
+tickers (list of strings) --> the tickers that still need a model
+checkpoint (dictionary) --> the checkpoint loaded by 'save_all_models', which is updated in place
+workers (int) --> the maximum number of worker processes running at the same time
+timeout (int or float) --> the maximum number of seconds a single ticker may take, or None for no timeout
+directory (string) --> where the models and the checkpoint should be saved
+checkpoint_filename (string) --> the name of the checkpoint file
+backend (string) --> the estimator every model is built with. Default set to 'random_forest'
+
+Return type: dictionary holding the updated checkpoint
+'''
+
+def _train_in_pool(tickers, checkpoint, workers, timeout, directory, checkpoint_filename, backend = 'random_forest'):
+    results = multiprocessing.Queue()
+    waiting = list(tickers)
+    running = dict()
+
+    #the macroeconomic features are loaded once here and placed in shared memory, where every worker attaches to the same read-only copy
+    macro_handle = md.share_macro_matrix() if tickers else None
+    try:
+        _run_pool(waiting, running, results, checkpoint, workers, timeout, directory, checkpoint_filename, macro_handle, backend)
+    finally:
+        md.release_macro_matrix()
+
+    return checkpoint
+
+
+#starts the worker processes of '_train_in_pool' and collects their outcomes into the checkpoint until every ticker has finished
+def _run_pool(waiting, running, results, checkpoint, workers, timeout, directory, checkpoint_filename, macro_handle, backend):
+    while waiting or running:
+        #starts new worker processes until the pool is full
+        while waiting and len(running) < workers:
+            ticker = waiting.pop(0)
+            print('Starting saving file for ' + str(ticker))
+            process = multiprocessing.Process(target = _training_worker, args = (ticker, directory, results, Instrumentation.is_enabled(), Instrumentation.is_tracking_memory(), macro_handle, backend))
+            process.start()
+            running[ticker] = (process, time.perf_counter())
+
+        finished = []
+
+        #waits up to one second for a worker to report back, then reads every other outcome already queued, so that no worker whose outcome is waiting in the queue
+        #is stopped by the timeout below; outcomes of workers no longer running, which were already stopped, are dropped
+        try:
+            outcome = results.get(timeout = 1)
+            while True:
+                ticker, status, seconds, error, records = outcome
+                if ticker in running:
+                    finished.append((ticker, {'status': status, 'seconds': seconds, 'error': error}))
+
+                    #the stages recorded in the worker process are added to those of this process, so the whole run is aggregated together
+                    Instrumentation.add_records(records)
+
+                outcome = results.get_nowait()
+        except queue.Empty:
+            pass
+
+        now = time.perf_counter()
+        reported = [ticker for ticker, outcome in finished]
+
+        for ticker, (process, started) in running.items():
+            if ticker in reported:
+                continue
+
+            #stops workers that went over the timeout, and records workers that exited without reporting back (for example when killed by the system)
+            if timeout is not None and now - started > timeout:
+                process.terminate()
+                finished.append((ticker, {'status': 'timed out', 'seconds': now - started, 'error': None}))
+            elif not process.is_alive() and process.exitcode != 0:
+                finished.append((ticker, {'status': 'failed', 'seconds': now - started, 'error': 'Worker exited with code ' + str(process.exitcode)}))
+
+        for ticker, outcome in finished:
+            process = running.pop(ticker)[0]
+            process.join()
+            checkpoint[ticker] = outcome
+            save_checkpoint(checkpoint, checkpoint_filename, directory)
+            print(outcome['status'].capitalize() + ' saving file for ' + str(ticker))
+
 
-Return type: list of models
 '''
+Loads all the models that were previously saved using 'save_all_models' into a dictionary with their tickers as the keys.
+The inference artifact of each ticker is loaded when one was saved, and the full model is loaded otherwise
 
-def load_all_models():
+Parameters:
+prefer_artifacts (bool) --> whether inference artifacts should be loaded instead of full models when available. Default set to True
+
+Return type: dictionary, where the keys are tickers and the values are InferenceModel or Model classes of module 'Model_Builder'
+'''
+
+def load_all_models(prefer_artifacts = True):
     #collects the necessary tickers for which models should be loaded for, and initializes a dictionary to hold the models
     tickers = load_tickers()
     models = dict()
 
     #loops through all the tickers to load each individual model and save it to the dictionary
     for ticker in tickers:
-        current_model = load_model(str(ticker) + '.pkl')
+        current_model = None
+
+        if prefer_artifacts:
+            try:
+                current_model = load_artifact(str(ticker) + '_Artifact.pkl')
+            except FileNotFoundError:
+                pass
+
+        if current_model is None:
+            current_model = load_model(str(ticker) + '.pkl')
+
         models[ticker] = current_model
     
     return models
 
 
+'''
+Writes the manifest of all the saved inference artifacts, which is read by 'ModelRegistry' in 'Model_Registry' to know which models exist without loading any of them.
+Each entry lists the ticker, the path of its artifact relative to the manifest, the artifact's size on disk and once loaded, its time horizons, its training date and
+its precision score. Only the header of each artifact is read, see 'load_artifact_header'
+
+Parameters:
+filename (string) --> the name of the manifest file. Default set to 'Model_Manifest.json'
+directory (string) --> where the artifacts are saved; the manifest is saved in the same directory
+
+Return type: list of dictionaries holding the entries of the manifest
+'''
+
+#important note: change the default value of directory to the actual path where you want this file to be saved
+def save_manifest(filename = 'Model_Manifest.json', directory = ''):
+    entries = []
+
+    for ticker in load_tickers():
+        artifact_filename = str(ticker) + '_Artifact.pkl'
+        artifact_path = os.path.join(directory, artifact_filename)
+
+        #tickers that have not been trained yet or failed to train are left out
+        if not os.path.exists(artifact_path):
+            continue
+
+        header = load_artifact_header(artifact_filename, directory)
+        metadata = header['metadata']
+        size = os.path.getsize(artifact_path)
+        if os.path.exists(artifact_path + '.buffers'):
+            size += os.path.getsize(artifact_path + '.buffers')
+
+        entries.append({
+            'ticker': ticker,
+            'artifact': artifact_filename,
+            'size': size,
+            'uncompressed_size': header['uncompressed_bytes'],
+            'horizons': header['horizons'],
+            'trained_at': metadata['trained_at'].isoformat(),
+            'precision_score': float(metadata['precision_score'])
+        })
+
+    with open(os.path.join(directory, filename), 'w') as file:
+        json.dump(entries, file, indent = 4)
+
+    return entries
+
+
+'''
+Saves the inference artifact and diagnostics of every full model previously saved, so that models trained before artifacts existed do not need to be rebuilt
+'''
+
+def save_all_artifacts():
+    tickers = load_tickers()
+
+    for ticker in tickers:
+        print('Saving artifact of ' + str(ticker))
+        current_model = load_model(str(ticker) + '.pkl')
+        save_artifact(current_model, str(ticker) + '_Artifact.pkl')
+        save_diagnostics(current_model, str(ticker) + '_Diagnostics.pkl')
+
+
 '''
 Saves all the precision scores of the individual models into a dictionary so they can be accessed as part of the results shared
 
@@ -149,8 +646,18 @@ def save_all_precision_scores(filename = 'Precision_Scores.pkl', directory = '')
     model_scores = dict()
     tickers = load_tickers()
 
+    #the scores of the models in the model index are read from it, so only models trained before the index existed need to be loaded
+    try:
+        indexed_scores = Model_Index.query(directory, tickers = tickers)['precision_score'].to_dict()
+    except FileNotFoundError:
+        indexed_scores = dict()
+
     #loops through the tickers and calls 'load_model' to load each individual model; then accesses the precision_score of these models to add them to the dictionary 
     for ticker in tickers:
+        if str(ticker) in indexed_scores:
+            model_scores[ticker] = indexed_scores[str(ticker)]
+            continue
+
         print('Loading model of ' + str(ticker))
         current_model = load_model(str(ticker) + '.pkl')
         model_scores[ticker] = current_model.precision_score
@@ -0,0 +1,392 @@
+import os
+import sys
+import argparse
+import subprocess
+
+#single command-line entry point for the project. Each subcommand only imports the modules it needs when it runs, so starting this file is fast
+#and never touches the network on its own. Run 'python Stock_Trader.py --help' to list the subcommands
+
+#the modules checked by the 'check' subcommand; this file is checked against the time budget, and every module is checked for network access while being imported
+STARTUP_MODULES = ['Stock_Trader', 'Atomic_Files', 'Price_Store', 'Feature_Engine', 'Feature_State', 'Forest_Predictor', 'Macro_Data', 'Backtest_Cache', 'Usable_Stocks',
+                   'Instrumentation', 'Model_Builder', 'Model_Search', 'Serialization', 'Model_Registry', 'New_Predictions', 'Synthetic_Data', 'Emailer',
+                   'Daily_Pipeline', 'Panel_Model', 'Threshold_Sweep', 'Model_Index',
+                   'Prediction_Server']
+
+#imports a single module in a fresh interpreter with every way of opening a network connection replaced by one that records the attempt and fails,
+#then prints the number of seconds the import took. The process exits with code 2 if a connection was attempted, even if the module caught the error
+_IMPORT_CHECK = '''
+import sys, time, socket, importlib
+
+attempts = []
+
+def blocked(*args, **kwargs):
+    attempts.append(args)
+    raise OSError('network access while importing')
+
+socket.socket.connect = blocked
+socket.socket.connect_ex = blocked
+socket.create_connection = blocked
+socket.getaddrinfo = blocked
+
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(time.perf_counter() - start)
+
+sys.exit(2 if attempts else 0)
+'''
+
+
+'''
+Screens the current top 100 tickers for the ones with enough data to build models, and prints the tickers added and removed since the last screening
+'''
+
+def run_screen(arguments):
+    import Usable_Stocks
+
+    usable, added, removed = Usable_Stocks.screen_universe(max_workers = arguments.max_workers)
+    print('Usable tickers (' + str(len(usable)) + '): ' + ', '.join(usable))
+    print('Added: ' + (', '.join(added) or 'none'))
+    print('Removed: ' + (', '.join(removed) or 'none'))
+
+    if arguments.save:
+        import Serialization
+        Serialization.save_tickers(usable)
+
+
+'''
+Trains and saves the models of all the saved tickers with 'save_all_models' in 'Serialization'
+'''
+
+def run_train(arguments):
+    import Serialization
+
+    start_metrics(arguments)
+    Serialization.save_all_models(workers = arguments.workers, timeout = arguments.timeout, resume = not arguments.restart, backend = arguments.backend)
+    export_metrics(arguments)
+
+
+'''
+Prints each saved ticker's price increase prediction for the next trading day
+'''
+
+def run_predict(arguments):
+    import New_Predictions
+
+    start_metrics(arguments)
+    if arguments.batch:
+        predictions, timings = New_Predictions.generate_all_predictions_batch(max_workers = arguments.max_workers, refresh = not arguments.offline)
+    else:
+        predictions = New_Predictions.generate_all_predictions()
+
+    for ticker, prediction in predictions.items():
+        print(ticker + ': ' + prediction)
+
+    if arguments.batch:
+        print(', '.join(stage + ' ' + str(round(seconds, 3)) + 's' for stage, seconds in timings.items()))
+
+    export_metrics(arguments)
+
+
+'''
+Starts recording the stages of the run with 'Instrumentation' if a metrics path was given
+'''
+
+def start_metrics(arguments):
+    if arguments.metrics:
+        import Instrumentation
+        Instrumentation.enable()
+
+
+'''
+Saves the stages recorded during the run as '<metrics>.json' and '<metrics>.prom' if a metrics path was given
+'''
+
+def export_metrics(arguments):
+    if arguments.metrics:
+        import Instrumentation
+        Instrumentation.export_json(arguments.metrics + '.json')
+        Instrumentation.export_prometheus(arguments.metrics + '.prom')
+        print('Saved the stage metrics to ' + arguments.metrics + '.json and ' + arguments.metrics + '.prom')
+
+
+'''
+Prints the daily report of predictions and precision scores, and emails it with 'Emailer' if asked to
+'''
+
+def run_report(arguments):
+    import Emailer
+
+    complete_message = Emailer.build_message()
+    print(complete_message)
+
+    if arguments.email:
+        Emailer.send_email(complete_message, to = arguments.to)
+
+
+'''
+Runs the daily pipeline of 'Daily_Pipeline', skipping the stages whose inputs have not changed since the last run, and prints what each stage did
+'''
+
+def run_daily(arguments):
+    import Daily_Pipeline
+
+    if arguments.sink == 'smtp':
+        sink = Daily_Pipeline.SMTPSink(arguments.smtp_host, arguments.smtp_port, to = arguments.to)
+    elif arguments.sink == 'gmail':
+        sink = Daily_Pipeline.GmailSink(to = arguments.to)
+    else:
+        sink = Daily_Pipeline.FileSink(arguments.reports)
+
+    start_metrics(arguments)
+    pipeline = Daily_Pipeline.DailyPipeline(sink, arguments.cache, refresh = not arguments.offline, retries = arguments.retries, retry_delay = arguments.retry_delay)
+    try:
+        print(pipeline.run(force = arguments.force))
+    finally:
+        print(', '.join(stage + ' ' + status for stage, status in pipeline.statuses.items()))
+        export_metrics(arguments)
+
+
+'''
+Trains one pooled model for the saved tickers with 'Panel_Model', and prints how its per-ticker precision and size compare with the per-ticker models
+'''
+
+def run_panel(arguments):
+    import pickle
+    import Serialization
+    import Panel_Model
+
+    tickers = arguments.tickers if arguments.tickers else Serialization.load_tickers()
+
+    start_metrics(arguments)
+    panel = Panel_Model.PanelModel(tickers, num_trees = arguments.num_trees, n_jobs = arguments.n_jobs, refresh_data = not arguments.offline)
+    comparison = Panel_Model.compare_to_ticker_models(panel, directory = arguments.directory)
+    print(comparison.to_string())
+
+    for ticker, reason in panel.skipped.items():
+        print('Skipped ' + ticker + ': ' + reason)
+
+    print('Pooled precision: ' + str(round(panel.precision_score * 100, 2)) + '%, mean difference from the per-ticker models: '
+          + str(round(comparison['Difference'].mean() * 100, 2)) + ' points')
+    print('Pooled training took ' + str(round(panel.training_seconds, 1)) + 's; the pooled model takes ' + str(len(pickle.dumps(panel.model, protocol = 5)))
+          + ' bytes against ' + str(int(comparison['Artifact_Bytes'].sum())) + ' bytes of per-ticker artifacts')
+    export_metrics(arguments)
+
+
+'''
+Evaluates the saved backtests of all the saved tickers at many thresholds with 'Threshold_Sweep', prints the best threshold of each ticker chosen on the earlier backtested days
+along with its metrics on the latest days, and records the thresholds in the index of 'Model_Index' unless asked not to
+'''
+
+def run_thresholds(arguments):
+    import Threshold_Sweep
+
+    backtests = Threshold_Sweep.load_backtests(directory = arguments.directory)
+    curves = Threshold_Sweep.sweep(backtests)
+    best = Threshold_Sweep.select_thresholds(backtests, arguments.metric, arguments.min_signals, arguments.min_coverage, arguments.holdout)
+    print(best.to_string())
+
+    if not arguments.no_save:
+        import Model_Index
+        print('Recorded the thresholds of ' + str(Model_Index.record_thresholds(best, arguments.directory)) + ' models in the model index')
+
+    if arguments.output:
+        curves.to_csv(arguments.output, index = False)
+        print('Saved the metrics of every ticker and threshold to ' + arguments.output)
+
+
+'''
+Prints the saved models from the index of 'Model_Index', filtered and sorted without loading any of them, after rebuilding the index from the saved artifacts if asked to
+'''
+
+def run_models(arguments):
+    import Model_Index
+
+    if arguments.rebuild:
+        print('Indexed ' + str(Model_Index.rebuild_index(arguments.directory)) + ' models')
+
+    models = Model_Index.query(arguments.directory, arguments.tickers, arguments.min_precision, arguments.order_by, not arguments.ascending, arguments.limit)
+    print(models[['precision_score', 'threshold', 'chosen_threshold', 'holdout_precision', 'backend', 'trained_at', 'training_seconds', 'data_start', 'data_end', 'artifact_bytes']].to_string())
+
+
+'''
+Runs the local prediction service of 'Prediction_Server' until it is interrupted, writing the manifest of the saved artifacts first if it does not exist yet
+'''
+
+def run_serve(arguments):
+    import asyncio
+    import Prediction_Server
+
+    if not os.path.exists(arguments.manifest):
+        import Serialization
+        Serialization.save_manifest(os.path.basename(arguments.manifest), os.path.dirname(arguments.manifest))
+
+    server = Prediction_Server.PredictionServer(arguments.manifest, max_models = arguments.max_models, refresh = not arguments.offline, feature_ttl = arguments.feature_ttl,
+                                                max_batch_size = arguments.max_batch_size, max_wait = arguments.max_wait_ms / 1000)
+
+    try:
+        asyncio.run(server.serve_forever(arguments.host, arguments.port, arguments.socket, warm = not arguments.no_warm))
+    except KeyboardInterrupt:
+        pass
+
+
+'''
+Checks that importing the modules of the project does not access the network, and that importing this file takes less than the time budget.
+Each module is imported in its own interpreter so that modules already imported by an earlier check do not hide the cost of a later one
+
+Parameters:
+modules (list of strings) --> the modules to check. Default set to STARTUP_MODULES
+budget (float) --> the maximum number of seconds importing this file may take. Default set to 0.5
+
+Return type: list of strings describing every failed check, which is empty if all the checks passed
+'''
+
+def check_startup(modules = STARTUP_MODULES, budget = 0.5):
+    failures = []
+
+    for module in modules:
+        #the modules are imported from the directory of this file, so the check works from any working directory
+        result = subprocess.run([sys.executable, '-c', _IMPORT_CHECK, module], capture_output = True, text = True, cwd = os.path.dirname(os.path.abspath(__file__)))
+
+        if result.returncode == 2:
+            failures.append(module + ' accessed the network while being imported')
+        elif result.returncode != 0:
+            failures.append(module + ' could not be imported: ' + (result.stderr.strip().splitlines() or ['unknown error'])[-1])
+            continue
+
+        seconds = float(result.stdout.strip().splitlines()[-1])
+        print(module + ': ' + str(round(seconds, 3)) + 's')
+
+        if module == 'Stock_Trader' and seconds > budget:
+            failures.append(module + ' took ' + str(round(seconds, 3)) + 's to import, over the budget of ' + str(budget) + 's')
+
+    return failures
+
+
+'''
+Runs 'check_startup' and exits with code 1 if any of the checks failed
+'''
+
+def run_check(arguments):
+    failures = check_startup(budget = arguments.budget)
+
+    for failure in failures:
+        print('FAILED: ' + failure)
+
+    if failures:
+        sys.exit(1)
+
+    print('All startup checks passed')
+
+
+'''
+Builds the parser of the command-line arguments, with a subparser for each subcommand
+
+Return type: ArgumentParser from 'argparse'
+'''
+
+def build_parser():
+    parser = argparse.ArgumentParser(description = 'Builds stock prediction models and makes predictions for the next trading day')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    screen = subparsers.add_parser('screen', help = 'screen the top 100 tickers for the ones with enough data')
+    screen.add_argument('--max-workers', type = int, default = 8, help = 'the largest number of new tickers checked at the same time')
+    screen.add_argument('--save', action = 'store_true', help = 'save the usable tickers with save_tickers')
+    screen.set_defaults(function = run_screen)
+
+    train = subparsers.add_parser('train', help = 'train and save the models of all the saved tickers')
+    train.add_argument('--workers', type = int, default = 1, help = 'the number of worker processes training models at the same time')
+    train.add_argument('--timeout', type = float, default = None, help = 'the maximum number of seconds a single ticker may train for')
+    train.add_argument('--restart', action = 'store_true', help = 'train every ticker again instead of resuming from the checkpoint')
+    train.add_argument('--backend', default = 'random_forest', help = 'the estimator the models are built with: random_forest, hist_gradient_boosting, or any backend registered in Model_Builder.py')
+    train.add_argument('--metrics', default = None, help = 'record the time and memory of each stage and save them to this path as JSON and Prometheus text')
+    train.set_defaults(function = run_train)
+
+    predict = subparsers.add_parser('predict', help = 'print the predictions of all the saved models for the next trading day')
+    predict.add_argument('--batch', action = 'store_true', help = 'fetch and predict all the tickers as one batch, and print the time of each stage')
+    predict.add_argument('--max-workers', type = int, default = 8, help = 'the largest number of tickers fetched at the same time in batch mode')
+    predict.add_argument('--offline', action = 'store_true', help = 'use the stored price data without downloading new bars in batch mode')
+    predict.add_argument('--metrics', default = None, help = 'record the time and memory of each stage and save them to this path as JSON and Prometheus text')
+    predict.set_defaults(function = run_predict)
+
+    report = subparsers.add_parser('report', help = 'print the daily report of predictions and precision scores')
+    report.add_argument('--email', action = 'store_true', help = 'also email the report through the Gmail API')
+    report.add_argument('--to', default = None, help = 'the email address of the recipient, instead of the one set in Emailer.py')
+    report.set_defaults(function = run_report)
+
+    daily = subparsers.add_parser('daily', help = 'run the daily pipeline, skipping the stages whose inputs have not changed since the last run')
+    daily.add_argument('--sink', choices = ['file', 'smtp', 'gmail'], default = 'file', help = 'where the report is delivered')
+    daily.add_argument('--reports', default = 'Reports', help = 'the directory the file sink saves the reports to')
+    daily.add_argument('--smtp-host', default = 'localhost', help = 'the host of the SMTP server of the smtp sink')
+    daily.add_argument('--smtp-port', type = int, default = 1025, help = 'the port of the SMTP server of the smtp sink')
+    daily.add_argument('--to', default = None, help = 'the email address of the recipient, instead of the one set in Emailer.py')
+    daily.add_argument('--cache', default = 'Pipeline_Cache', help = 'the directory the output of each stage is saved to')
+    daily.add_argument('--offline', action = 'store_true', help = 'use the stored price data without downloading new bars')
+    daily.add_argument('--retries', type = int, default = 2, help = 'the number of times a failed stage is tried again')
+    daily.add_argument('--retry-delay', type = float, default = 5, help = 'the number of seconds waited before the first retry, doubled before every further retry')
+    daily.add_argument('--force', nargs = '*', default = [], help = 'the stages to run again even if their inputs have not changed')
+    daily.add_argument('--metrics', default = None, help = 'record the time and memory of each stage and save them to this path as JSON and Prometheus text')
+    daily.set_defaults(function = run_daily)
+
+    panel = subparsers.add_parser('panel', help = 'train one pooled model for the saved tickers and compare it with the per-ticker models')
+    panel.add_argument('--tickers', nargs = '*', default = None, help = 'the tickers to pool, instead of the saved tickers')
+    panel.add_argument('--num-trees', type = int, default = 300, help = 'the number of trees of the pooled model')
+    panel.add_argument('--n-jobs', type = int, default = 1, help = 'the number of cores the backtest may use, -1 uses all cores')
+    panel.add_argument('--offline', action = 'store_true', help = 'use the stored price data without downloading new bars')
+    panel.add_argument('--directory', default = '', help = 'where Precision_Scores.pkl and the per-ticker artifacts were saved')
+    panel.add_argument('--metrics', default = None, help = 'record the time and memory of each stage and save them to this path as JSON and Prometheus text')
+    panel.set_defaults(function = run_panel)
+
+    thresholds = subparsers.add_parser('thresholds', help = 'find the best threshold of each saved ticker from its saved backtest, without training again')
+    thresholds.add_argument('--metric', default = 'Precision', choices = ['Precision', 'Recall', 'Coverage', 'Hit_Rate'], help = 'the metric to maximize')
+    thresholds.add_argument('--min-signals', type = int, default = 20, help = 'the minimum number of predicted increases a threshold must give over the earlier backtested days, and over the latest days for its precision on them to be reported')
+    thresholds.add_argument('--min-coverage', type = float, default = 0.02, help = 'the minimum share of the earlier backtested days a threshold must predict an increase on')
+    thresholds.add_argument('--holdout', type = float, default = 0.25, help = 'the share of each ticker\'s latest backtested days the chosen threshold is reported on instead of chosen on')
+    thresholds.add_argument('--no-save', action = 'store_true', help = 'only print the thresholds, without recording them in the model index')
+    thresholds.add_argument('--directory', default = '', help = 'where the models and their diagnostics were saved')
+    thresholds.add_argument('--output', default = None, help = 'save the metrics of every ticker and threshold to this CSV file')
+    thresholds.set_defaults(function = run_thresholds)
+
+    models = subparsers.add_parser('models', help = 'list the saved models from the model index, filtered and sorted without loading them')
+    models.add_argument('--tickers', nargs = '*', default = None, help = 'the tickers to list, instead of every indexed ticker')
+    models.add_argument('--min-precision', type = float, default = None, help = 'the minimum precision score of the models listed')
+    models.add_argument('--order-by', default = 'precision_score', help = 'the column of the index to sort by')
+    models.add_argument('--ascending', action = 'store_true', help = 'sort from the lowest value to the highest')
+    models.add_argument('--limit', type = int, default = None, help = 'the maximum number of models listed')
+    models.add_argument('--rebuild', action = 'store_true', help = 'index the saved artifacts first, for models trained before the index existed')
+    models.add_argument('--directory', default = '', help = 'where the models and the index were saved')
+    models.set_defaults(function = run_models)
+
+    serve = subparsers.add_parser('serve', help = 'keep the models warm and answer prediction requests over HTTP until interrupted')
+    serve.add_argument('--host', default = '127.0.0.1', help = 'the address to listen on')
+    serve.add_argument('--port', type = int, default = 8765, help = 'the port to listen on')
+    serve.add_argument('--socket', default = None, help = 'listen on this Unix socket path instead of TCP')
+    serve.add_argument('--manifest', default = 'Model_Manifest.json', help = 'the manifest of the saved artifacts, written first if it does not exist')
+    serve.add_argument('--max-models', type = int, default = None, help = 'the largest number of models kept in memory')
+    serve.add_argument('--feature-ttl', type = float, default = 300, help = 'the number of seconds the latest features of a ticker are reused before new bars are fetched')
+    serve.add_argument('--max-batch-size', type = int, default = 256, help = 'the largest number of requests merged into one batch')
+    serve.add_argument('--max-wait-ms', type = float, default = 2, help = 'the number of milliseconds a batch waits for more requests')
+    serve.add_argument('--offline', action = 'store_true', help = 'use the stored price data without downloading new bars')
+    serve.add_argument('--no-warm', action = 'store_true', help = 'load each model and its features on its first request instead of at startup')
+    serve.set_defaults(function = run_serve)
+
+    check = subparsers.add_parser('check', help = 'check that importing the project is fast and does not access the network')
+    check.add_argument('--budget', type = float, default = 0.5, help = 'the maximum number of seconds importing this file may take')
+    check.set_defaults(function = run_check)
+
+    return parser
+
+
+'''
+Parses the command-line arguments and runs the chosen subcommand
+
+Parameters:
+argv (list of strings) --> the command-line arguments. Default set to None, which uses the arguments this file was run with
+'''
+
+def main(argv = None):
+    arguments = build_parser().parse_args(argv)
+    arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    main()
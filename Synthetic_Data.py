@@ -0,0 +1,159 @@
+import os
+import zlib
+import shutil
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+import yfinance as yf
+import Macro_Data as md
+
+#deterministic stand-ins for yahoo finance and the Fred api, so that models can be built and predictions made without a network connection or an api key.
+#every ticker and series gets its own data, which is the same on every run and on every machine
+
+#the synthetic price data starts on this date, and the synthetic macroeconomic series start on 'macro_start' and end on 'macro_end'
+price_start = '1985-01-02'
+macro_start = '1950-01-01'
+macro_end = '2024-06-01'
+
+
+'''
+Creates the seed of the random number generator for a ticker or series. Python's own 'hash' changes between processes, so a checksum of the name is used instead
+
+Parameters:
+name (string) --> the ticker or series id
+
+Return type: int
+'''
+
+def name_seed(name):
+    return zlib.crc32(str(name).encode())
+
+
+'''
+Creates synthetic daily price data in the same format as 'history' of yfinance's Ticker: a random walk of closing prices with matching open, high, low and volume columns,
+indexed by trading days in New York time
+
+Parameters:
+ticker (string) --> the ticker the data is created for, which sets the seed of the random walk
+num_days (int) --> the number of trading days of data. Default set to 9000, about 35 years starting in 1985
+
+Return type: Pandas DataFrame with the columns 'Open', 'High', 'Low', 'Close', 'Volume', 'Dividends' and 'Stock Splits'
+'''
+
+def synthetic_history(ticker, num_days = 9000):
+    generator = np.random.default_rng(name_seed(ticker))
+    index = pd.bdate_range(price_start, periods = num_days, tz = 'America/New_York', name = 'Date')
+
+    close = 50 * np.exp(np.cumsum(generator.normal(0.0003, 0.015, num_days)))
+    open_price = close * (1 + generator.normal(0, 0.003, num_days))
+    high = np.maximum(open_price, close) * (1 + np.abs(generator.normal(0, 0.005, num_days)))
+    low = np.minimum(open_price, close) * (1 - np.abs(generator.normal(0, 0.005, num_days)))
+    volume = generator.integers(100000, 10000000, num_days).astype(np.float64)
+
+    return pd.DataFrame({'Open': open_price, 'High': high, 'Low': low, 'Close': close, 'Volume': volume, 'Dividends': 0.0, 'Stock Splits': 0.0}, index = index)
+
+
+'''
+Class that stands in for yfinance's Ticker, returning synthetic data from 'synthetic_history'
+
+Parameters:
+ticker (string) --> the ticker whose data is requested
+num_days (int) --> the number of trading days of data the ticker has. Default set to 9000
+'''
+
+class SyntheticTicker():
+
+    def __init__(self, ticker, num_days = 9000):
+        self.ticker = ticker
+        self.num_days = num_days
+
+
+    '''
+    Returns the synthetic data in the same way as 'history' of yfinance's Ticker. Only the parameters used by this project are supported
+
+    Parameters:
+    period (string) --> ignored, as all the data is always available. Default set to 'max'
+    start (string) --> the first date to return. Default set to None, which returns all the data
+    interval (string) --> '1d' for daily bars, or '1mo' or '3mo' for the first day of each month or quarter. Default set to '1d'
+
+    Return type: Pandas DataFrame in the format returned by 'synthetic_history'
+    '''
+
+    def history(self, period = 'max', start = None, interval = '1d', **kwargs):
+        data = synthetic_history(self.ticker, self.num_days)
+
+        if start is not None:
+            data = data.loc[data.index >= pd.Timestamp(start).tz_localize(data.index.tz)]
+
+        if interval in ('1mo', '3mo'):
+            periods = data.index.tz_localize(None).to_period('M' if interval == '1mo' else 'Q')
+            data = data.groupby(periods).head(1)
+
+        return data
+
+
+'''
+Class that stands in for fredapi's Fred, returning a synthetic monthly series for every series id
+
+Parameters:
+end (string) --> the date of the last monthly observation. Default set to 'macro_end'
+'''
+
+class SyntheticFred():
+
+    def __init__(self, end = None):
+        self.end = end if end is not None else macro_end
+
+
+    '''
+    Returns a synthetic monthly series in the same way as 'get_series' of fredapi's Fred
+
+    Parameters:
+    series_id (string) --> the id of the series, which sets the seed of its random walk
+    observation_start (string) --> the first date to return. Default set to None, which returns the whole series
+
+    Return type: Pandas Series indexed by the first day of each month
+    '''
+
+    def get_series(self, series_id, observation_start = None, **kwargs):
+        generator = np.random.default_rng(name_seed(series_id))
+        index = pd.date_range(macro_start, self.end, freq = 'MS')
+        series = pd.Series(100 + np.cumsum(generator.normal(0, 1, len(index))), index = index)
+
+        if observation_start is not None:
+            series = series.loc[series.index >= pd.Timestamp(observation_start)]
+
+        return series
+
+
+'''
+Context manager that replaces yahoo finance and the Fred api with the synthetic stand-ins while it is active. It also switches to a temporary working directory,
+so that the price store, the macroeconomic cache, the feature states and any saved models are created from scratch and never mix with real data
+
+Parameters:
+num_days (int) --> the number of trading days of data every ticker has. Default set to 9000
+directory (string) --> the working directory to use. Default set to None, which creates a temporary directory that is removed afterwards
+
+Return type: string of the working directory, given to the 'as' target of the 'with' statement
+'''
+
+@contextlib.contextmanager
+def use_synthetic_sources(num_days = 9000, directory = None):
+    previous_ticker = yf.Ticker
+    previous_directory = os.getcwd()
+    working_directory = directory if directory is not None else tempfile.mkdtemp(prefix = 'synthetic_')
+
+    yf.Ticker = lambda ticker: SyntheticTicker(ticker, num_days)
+    md.set_client(SyntheticFred())
+    os.chdir(working_directory)
+
+    try:
+        yield working_directory
+    finally:
+        os.chdir(previous_directory)
+        yf.Ticker = previous_ticker
+        md.set_client(None)
+
+        if directory is None:
+            shutil.rmtree(working_directory, ignore_errors = True)
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+import Serialization
+
+#evaluates the saved backtests of the models at many thresholds at once. The backtests hold the probability of a price increase on every backtested day, so the precision,
+#recall, coverage and hit rate of any threshold can be computed from them directly instead of building the models again
+
+#the thresholds evaluated by default, from 50% to 80% in steps of one percentage point
+DEFAULT_THRESHOLDS = np.round(np.arange(0.5, 0.805, 0.01), 2)
+
+
+'''
+Loads the backtested predictions of the input tickers from the diagnostics saved by 'train_and_save_model' in 'Serialization'. Tickers saved before diagnostics were written
+are loaded from their full model instead
+
+Parameters:
+tickers (list of strings) --> the tickers to load. Default set to None, which loads every ticker saved with 'save_tickers'
+directory (string) --> where the models and diagnostics were saved. Default set to ''
+
+Return type: Pandas DataFrame indexed by date, holding the 'Ticker', 'Target' and 'Prediction_Percentages' of every backtested day of every ticker
+'''
+
+def load_backtests(tickers = None, directory = ''):
+    if tickers is None:
+        tickers = Serialization.load_tickers()
+
+    frames = []
+    for ticker in tickers:
+        try:
+            predictions = Serialization.load_diagnostics(str(ticker) + '_Diagnostics.pkl', directory)['predictions']
+        except FileNotFoundError:
+            predictions = Serialization.load_model(str(ticker) + '.pkl', directory).predictions
+
+        frames.append(predictions[['Target', 'Prediction_Percentages']].assign(Ticker = ticker))
+
+    return pd.concat(frames)[['Ticker', 'Target', 'Prediction_Percentages']]
+
+
+'''
+Computes the precision, recall, coverage and hit rate of every group of backtested predictions at every threshold in one pass. Each probability is placed once among the sorted
+thresholds by binary search, and the number of days and of price increases above each threshold are then counted for every group at once, so the cost barely grows with the
+number of thresholds. A day counts as a predicted increase when its probability is greater than the threshold, the same as in 'Model_Builder'
+
+Parameters:
+predictions (Pandas DataFrame) --> indexed by date, holding the 'Target' and 'Prediction_Percentages' along with the columns grouped by, as returned by 'load_backtests'
+thresholds (list of floats) --> the thresholds to evaluate. Default set to DEFAULT_THRESHOLDS
+by (list of strings) --> the columns to group by, where 'Year' groups by the year of the date. Default set to 'Ticker'; ('Ticker', 'Year') gives the metrics of every ticker
+in every year, and no columns evaluates all the predictions together
+
+Return type: Pandas DataFrame with a row for each group and threshold, holding the grouped columns, the 'Threshold', the number of 'Days', the number of predicted increases
+as 'Signals', the 'True_Positives', and the 'Precision' (NaN without any signal), 'Recall', 'Coverage' (the share of days with a signal) and 'Hit_Rate' (the share of days
+whose prediction, increase or not, was right)
+'''
+
+def sweep(predictions, thresholds = DEFAULT_THRESHOLDS, by = ('Ticker',)):
+    thresholds = np.sort(np.asarray(thresholds, dtype = np.float64))
+    num_thresholds = len(thresholds)
+    by = list(by)
+
+    #numbers every group, in the sorted order of its columns
+    if by:
+        columns = pd.DataFrame({column: (predictions.index.year if column == 'Year' else predictions[column].to_numpy()) for column in by})
+        grouped = columns.groupby(by, sort = True)
+        codes = grouped.ngroup().to_numpy()
+        groups = grouped.size().index.to_frame(index = False)
+    else:
+        codes = np.zeros(predictions.shape[0], dtype = np.int64)
+        groups = pd.DataFrame(index = [0])
+    num_groups = len(groups)
+
+    probabilities = predictions['Prediction_Percentages'].to_numpy(dtype = np.float64)
+    target = predictions['Target'].to_numpy(dtype = np.float64)
+
+    #the number of thresholds each probability is greater than, and a histogram of these counts for every group, counting days and price increases
+    above = np.searchsorted(thresholds, probabilities, side = 'left')
+    bins = codes * (num_thresholds + 1) + above
+    days = np.bincount(bins, minlength = num_groups * (num_thresholds + 1)).reshape(num_groups, num_thresholds + 1)
+    increases = np.bincount(bins, weights = target, minlength = num_groups * (num_thresholds + 1)).reshape(num_groups, num_thresholds + 1)
+
+    #a day is a signal at a threshold when its probability is greater than that threshold, so the signals at each threshold are the days above it and every higher one
+    signals = np.cumsum(days[:, ::-1], axis = 1)[:, ::-1][:, 1:]
+    true_positives = np.cumsum(increases[:, ::-1], axis = 1)[:, ::-1][:, 1:]
+    total_days = days.sum(axis = 1)[:, None]
+    total_increases = increases.sum(axis = 1)[:, None]
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        precision = np.where(signals > 0, true_positives / signals, np.nan)
+        recall = np.where(total_increases > 0, true_positives / total_increases, np.nan)
+        coverage = signals / total_days
+        hit_rate = (true_positives + (total_days - total_increases) - (signals - true_positives)) / total_days
+
+    curves = groups.loc[groups.index.repeat(num_thresholds)].reset_index(drop = True) if by else pd.DataFrame(index = range(num_thresholds))
+    curves['Threshold'] = np.tile(thresholds, num_groups)
+    curves['Days'] = np.repeat(total_days[:, 0], num_thresholds)
+    curves['Signals'] = signals.ravel()
+    curves['True_Positives'] = true_positives.ravel().astype(np.int64)
+    curves['Precision'] = precision.ravel()
+    curves['Recall'] = recall.ravel()
+    curves['Coverage'] = coverage.ravel()
+    curves['Hit_Rate'] = hit_rate.ravel()
+
+    return curves
+
+
+'''
+Picks the threshold of every ticker that maximizes a metric of its backtest, among the thresholds giving enough signals to be trusted
+
+Parameters:
+curves (Pandas DataFrame) --> the curves returned by 'sweep' grouped by 'Ticker'
+metric (string) --> the column of the curves to maximize. Default set to 'Precision'
+min_signals (int) --> the minimum number of signals a threshold must give over the backtest. Default set to 20
+min_coverage (float) --> the minimum share of backtested days a threshold must give a signal on. Default set to 0.02
+
+Return type: Pandas DataFrame indexed by ticker with the row of the curves of its best threshold. Of thresholds with the same value of the metric, the one with the most signals
+is kept. Tickers without any threshold meeting the minimums are left out. The metrics are those of the days the threshold was chosen on, so they are in-sample and overstate
+what the threshold gives on new days; 'select_thresholds' reports them on later days instead
+'''
+
+def optimal_thresholds(curves, metric = 'Precision', min_signals = 20, min_coverage = 0.02):
+    eligible = curves[(curves['Signals'] >= min_signals) & (curves['Coverage'] >= min_coverage) & curves[metric].notna()]
+    ranked = eligible.sort_values(['Ticker', metric, 'Signals'], ascending = [True, False, False])
+
+    return ranked.groupby('Ticker', sort = False).head(1).set_index('Ticker')
+
+
+'''
+Splits the backtested predictions of every ticker by date, into its earlier days and its latest days
+
+Parameters:
+predictions (Pandas DataFrame) --> the backtested predictions returned by 'load_backtests'
+holdout (float) --> the share of each ticker's backtested days, the latest ones, placed in the second part. Default set to 0.25
+
+Return type: tuple of two Pandas DataFrames in the same format as the input, holding the earlier and the latest days of every ticker
+'''
+
+def split_backtests(predictions, holdout = 0.25):
+    tickers = predictions['Ticker'].to_numpy()
+
+    #the position of every day among the backtested days of its ticker, in order of date, starting from 1
+    positions = pd.Series(predictions.index.to_numpy()).groupby(tickers).rank(method = 'first').to_numpy()
+    days = pd.Series(tickers).groupby(tickers).transform('size').to_numpy()
+    latest = positions > np.floor(days * (1 - holdout))
+
+    return predictions[~latest], predictions[latest]
+
+
+'''
+Chooses the threshold of every ticker on the earlier days of its backtest with 'optimal_thresholds', and reports the metrics that threshold gave on the latest days, which the
+choice never saw. The backtest is walk-forward, so the latest days were predicted by models trained after the earlier days, the same way a chosen threshold is used going forward
+
+Parameters:
+predictions (Pandas DataFrame) --> the backtested predictions returned by 'load_backtests'
+metric (string) --> the column of the curves to maximize, see 'optimal_thresholds'. Default set to 'Precision'
+min_signals (int) --> the minimum number of signals a threshold must give over the earlier days. Default set to 20
+min_coverage (float) --> the minimum share of the earlier days a threshold must give a signal on. Default set to 0.02
+holdout (float) --> the share of each ticker's latest backtested days the threshold is reported on, see 'split_backtests'. Default set to 0.25
+thresholds (list of floats) --> the thresholds to choose from. Default set to DEFAULT_THRESHOLDS
+
+Return type: Pandas DataFrame in the format of 'optimal_thresholds' for the earlier days, along with the same metrics on the latest days as columns starting with 'Holdout_'.
+The 'Holdout_Precision' is NaN when the threshold gave fewer than 'min_signals' signals on the latest days, as too few signals do not measure it
+'''
+
+def select_thresholds(predictions, metric = 'Precision', min_signals = 20, min_coverage = 0.02, holdout = 0.25, thresholds = DEFAULT_THRESHOLDS):
+    earlier, latest = split_backtests(predictions, holdout)
+    chosen = optimal_thresholds(sweep(earlier, thresholds), metric, min_signals, min_coverage)
+
+    held_out = sweep(latest, thresholds).set_index(['Ticker', 'Threshold']).reindex(pd.MultiIndex.from_arrays([chosen.index, chosen['Threshold']]))
+    held_out.index = chosen.index
+    held_out.loc[held_out['Signals'] < min_signals, 'Precision'] = np.nan
+
+    return chosen.join(held_out.add_prefix('Holdout_'))
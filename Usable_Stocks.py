@@ -1,6 +1,21 @@
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from bs4 import BeautifulSoup
 import yfinance as yf
+import Price_Store
+from Atomic_Files import atomic_write
+
+#the first trading date of every ticker checked so far, along with the last screened universe, is cached in this file so that screening again only checks new tickers
+cache_filename = 'Eligibility_Cache.pkl'
+cache_directory = ''
+
+#tickers whose first trading date is before this year have enough data for the derived features to be calculated from 1995 onwards
+cutoff_year = 1990
+
+#the ticker '^GSPC', which represents the S&P500 index, is not scraped from yahoo finance's page but is always included so a model can be built for it anyway
+always_usable = ['^GSPC']
 
 '''
 Webscraping function using BeautifulSoup to return the tickers of the current top 100 largest market cap stocks, as listed on yahoo finance
@@ -26,25 +41,131 @@ def get_top_100_tickers():
     
     return tickers
 
-#calls the webscraping function so that the top 100 tickers on yahoo finance can be stored
-top_100_tickers = get_top_100_tickers()
 
-#initializes a list to hold the tickers that will be usable in the sense that models can be built for them;
-#for a model to be able to be built, sufficient data is needed. The current threshold is stocks that have data that can be trained from 1995 onwards.
-#note that the threshold in the for loop is set to 1990. This is to ensure that the derived features of lagging moving averages and trends can be calculated
-#for the 1995 data and onwards, as these features require several years of past price data to be derived
-#the ticker '^GSPC', which represents the S&P500 index, is not scraped from yahoo finance's page but is included in the list so a model can be built for it anyway
-usable = ['^GSPC']
+'''
+Finds the first trading date of a ticker while downloading as little data as possible. Tickers already in the price store in 'Price_Store' are read from it;
+otherwise only quarterly bars are requested from yahoo finance, since the year of the first bar is all that is needed
+
+Parameters:
+ticker (string) --> the yahoo finance ticker of the stock
+directory (string) --> the directory of the price store. Default set to 'Price_Data'
+
+Return type: Pandas Timestamp of the first trading date, or None if yahoo finance returned no data for the ticker
+'''
+
+def probe_first_trade_date(ticker, directory = Price_Store.DEFAULT_DIRECTORY):
+    if os.path.exists(Price_Store.ticker_filepath(ticker, directory)):
+        return Price_Store.load_history(ticker, directory, columns = ['Close']).index[0]
+
+    data = yf.Ticker(ticker).history(period = 'max', interval = '3mo')
+    if data.empty:
+        return None
+
+    return data.index[0].tz_localize(None)
+
+
+'''
+Loads the cache written by 'screen_universe'
+
+Return type: dictionary holding the first trading date of each checked ticker under 'first_dates' and the last screened universe under 'universe'
+'''
+
+def load_cache():
+    filepath = os.path.join(cache_directory, cache_filename)
+
+    if not os.path.exists(filepath):
+        return {'first_dates': dict(), 'universe': []}
+
+    with open(filepath, 'rb') as file:
+        return pickle.load(file)
+
+
+'''
+Saves the cache used by 'screen_universe' with 'atomic_write' in 'Atomic_Files'
+
+Parameters:
+cache (dictionary) --> the cache to save, in the format returned by 'load_cache'
+'''
+
+def save_cache(cache):
+    if cache_directory and not os.path.exists(cache_directory):
+        os.makedirs(cache_directory)
+
+    atomic_write(os.path.join(cache_directory, cache_filename), lambda file: pickle.dump(cache, file))
+
+
+'''
+Screens a list of tickers for the ones with enough data for a model to be built. The first trading date of a ticker never changes, so it is cached and only the
+tickers that were never checked before are probed, several at a time. Tickers that could not be probed are left out this time and probed again on the next screening
+
+Parameters:
+tickers (list of strings) --> the tickers to screen. Default set to None, which scrapes the current top 100 tickers from yahoo finance
+max_workers (int) --> the largest number of tickers probed at the same time. Default set to 8
+
+Return type: tuple of three lists of strings: the usable tickers, the tickers added since the last screening and the tickers removed since the last screening
+'''
+
+def screen_universe(tickers = None, max_workers = 8):
+    if tickers is None:
+        tickers = get_top_100_tickers()
+
+    cache = load_cache()
+    first_dates = cache['first_dates']
+
+    #only tickers missing from the cache are probed; a failed probe is treated the same as a ticker without data
+    unchecked = [ticker for ticker in dict.fromkeys(tickers) if ticker not in first_dates]
+
+    def probe(ticker):
+        try:
+            return probe_first_trade_date(ticker)
+        except Exception:
+            return None
+
+    if unchecked:
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            for ticker, first in zip(unchecked, executor.map(probe, unchecked)):
+                if first is not None:
+                    first_dates[ticker] = first
+
+    #the threshold is set to 1990 to ensure that the derived features of lagging moving averages and trends can be calculated for the 1995 data and onwards,
+    #as these features require several years of past price data to be derived
+    usable = list(always_usable)
+    for ticker in tickers:
+        if ticker not in usable and ticker in first_dates and first_dates[ticker].year < cutoff_year:
+            usable.append(ticker)
+
+    previous = cache['universe']
+    added = [ticker for ticker in usable if ticker not in previous]
+    removed = [ticker for ticker in previous if ticker not in usable]
+
+    save_cache({'first_dates': first_dates, 'universe': usable})
+
+    return usable, added, removed
+
+
+#holds the usable tickers once they have been screened, so that the screening happens at most once per process
+_usable = None
+
+
+'''
+Allows 'usable' to still be accessed as a module variable (for example 'Usable_Stocks.usable'), while only scraping and screening the tickers the first time it is accessed
+instead of when this module is imported
+
+Parameters:
+name (string) --> the name of the module variable being accessed
+
+Return type: list of strings returned by 'screen_universe' when 'usable' is accessed
+'''
 
-#loops through all of the top 100 tickers and checks if the ticker meets the necessary data quantity requirements.
-#if the ticker does, it is appended to 'usable'
-for ticker in top_100_tickers:
-    data = yf.Ticker(ticker).history(period = 'max')
+def __getattr__(name):
+    global _usable
 
-    first = data.index[0]
-    year = first.year
+    if name == 'usable':
+        if _usable is None:
+            _usable = screen_universe()[0]
+        return _usable
 
-    if year < 1990:
-        usable.append(ticker)
+    raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name))
 
-#the variable 'usable' contains the list of tickers that will be serialized in the 'Serialization' module
\ No newline at end of file
+#usable holds the tickers that will be usable in the sense that models can be built for them; for a model to be able to be built, sufficient data is needed.
+#the current threshold is stocks that have data that can be trained from 1995 onwards. The variable 'usable' contains the list of tickers that will be serialized in the 'Serialization' module
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#the modules of the project sit in the directory above the tests, so they can be imported by name from any working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+import os
+import pandas as pd
+import Synthetic_Data
+import Price_Store
+import Backtest_Cache
+import Model_Builder
+
+#the backtests are run on a few small forests over about 20 years of synthetic data, which gives six backtesting periods
+NUM_DAYS = 5300
+NUM_TREES = 5
+
+
+#builds a model from the stored price data, so every build uses exactly the rows in the price store
+def build(cache_directory = None):
+    return Model_Builder.Model('SYN', num_trees = NUM_TREES, cache_directory = cache_directory, refresh_data = False)
+
+
+#the fingerprints of the backtesting periods of a model, the same as 'backtest' computes them
+def keys_of(model, step = 250):
+    splits = list(range(2500, model.full_data.shape[0], step))
+    return Backtest_Cache.fold_keys(model.full_data, model.model, model.predictors, splits, step)
+
+
+#a rebuild that loads every period but the last from the cache gives the same predictions as building without a cache
+def test_cached_rebuild_matches_uncached_build():
+    with Synthetic_Data.use_synthetic_sources(num_days = NUM_DAYS):
+        Price_Store.refresh_history('SYN')
+
+        uncached = build()
+        first = build('Cache')
+        cached_files = sorted(os.listdir('Cache'))
+        second = build('Cache')
+
+        assert len(cached_files) == len(keys_of(uncached))
+        assert sorted(os.listdir('Cache')) == cached_files
+        pd.testing.assert_frame_equal(first.predictions, uncached.predictions)
+        pd.testing.assert_frame_equal(second.predictions, uncached.predictions)
+        assert second.precision_score == uncached.precision_score
+
+
+#appending new bars only changes the fingerprint of the last period, so a rebuild only computes that period again and still matches an uncached build
+def test_appended_rows_only_invalidate_last_fold():
+    with Synthetic_Data.use_synthetic_sources(num_days = NUM_DAYS):
+        history = Price_Store.refresh_history('SYN')
+
+        Price_Store.save_history('SYN', history.iloc[:-5])
+        before = build('Cache')
+        files_before = set(os.listdir('Cache'))
+
+        Price_Store.save_history('SYN', history)
+        after = build('Cache')
+        uncached = build()
+
+        keys_before, keys_after = keys_of(before), keys_of(after)
+        assert len(keys_before) == len(keys_after)
+        assert keys_before[:-1] == keys_after[:-1]
+        assert keys_before[-1] != keys_after[-1]
+
+        assert set(os.listdir('Cache')) - files_before == {keys_after[-1] + '.pkl'}
+        pd.testing.assert_frame_equal(after.predictions, uncached.predictions)
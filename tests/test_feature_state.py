@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import Synthetic_Data
+import Feature_Engine
+import Feature_State
+
+#short time horizons, so that the ring buffer of the longest one wraps around and is summed again several times over the synthetic history
+HORIZONS = [2, 5, 20, 60]
+
+
+#the synthetic closing prices of a ticker, without a timezone like the price store
+def history(num_days = 400):
+    data = Synthetic_Data.synthetic_history('SYN', num_days)[['Close']]
+    data.index = data.index.tz_localize(None)
+    return data
+
+
+#appending the bars one at a time gives the features of 'derive_price_features' on every day, including the days before a horizon is full and the days after each 'resum'
+def test_updates_match_batch_features():
+    data = history()
+    batch = Feature_Engine.derive_price_features(data, HORIZONS)
+    state = Feature_State.FeatureState(HORIZONS)
+    size = state.closes.shape[0]
+
+    for position, (date, close) in enumerate(zip(data.index, data['Close'].to_numpy())):
+        state.update(date, close)
+        pd.testing.assert_frame_equal(state.latest_features(), batch.iloc[[position]], check_freq = False, check_names = False, rtol = 1e-12)
+
+    assert state.count // size >= 5
+
+
+#a state created from the end of the history gives the same features as one that was updated with all of it
+def test_from_history_matches_batch_features():
+    data = history()
+    batch = Feature_Engine.derive_price_features(data, HORIZONS)
+    state = Feature_State.FeatureState.from_history(data, HORIZONS)
+
+    pd.testing.assert_frame_equal(state.latest_features(), batch.iloc[[-1]], check_freq = False, check_names = False, rtol = 1e-12)
+    assert state.last_close() == data['Close'].iloc[-1]
+
+
+#the running sums are summed again from the ring buffer after every full turn of it, and stay close to the exact sums over a long history
+def test_resum_keeps_running_sums_exact():
+    data = history(5000)
+    state = Feature_State.FeatureState(HORIZONS)
+    for date, close in zip(data.index, data['Close'].to_numpy()):
+        state.update(date, close)
+
+    closes = data['Close'].to_numpy()
+    expected = np.array([closes[-horizon:].sum() for horizon in HORIZONS])
+    np.testing.assert_allclose(state.close_sums, expected, rtol = 1e-12)
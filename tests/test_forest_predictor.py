@@ -0,0 +1,58 @@
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from Forest_Predictor import ArrayForest
+
+NUM_FEATURES = 6
+
+
+#synthetic rows with a target depending on the first two features, where a share of the values of every feature is missing
+def synthetic_rows(generator, num_rows, missing = 0.1):
+    rows = generator.normal(size = (num_rows, NUM_FEATURES))
+    target = (np.nan_to_num(rows[:, 0]) + 0.5 * np.nan_to_num(rows[:, 1]) + generator.normal(size = num_rows) > 0).astype(int)
+    rows[generator.random(rows.shape) < missing] = np.nan
+
+    return rows, target
+
+
+#a forest fit on rows with missing values, so that its nodes send missing values to either side
+def fit_forest(rows, target):
+    forest = RandomForestClassifier(n_estimators = 20, min_samples_split = 20, random_state = 1)
+    return forest.fit(rows, target)
+
+
+#rows with and without missing values reach the same leaves as in scikit-learn
+def test_matches_sklearn_with_missing_values():
+    generator = np.random.default_rng(0)
+    forest = fit_forest(*synthetic_rows(generator, 2000))
+    rows, _ = synthetic_rows(generator, 3000, missing = 0.2)
+
+    missing_left = np.concatenate([estimator.tree_.missing_go_to_left for estimator in forest.estimators_]).astype(bool)
+    assert missing_left.any() and not missing_left.all()
+
+    np.testing.assert_allclose(ArrayForest.from_sklearn(forest).predict_proba(rows), forest.predict_proba(rows), rtol = 0, atol = 1e-12)
+
+
+#float64 values next to a split threshold are rounded to float32 before they are compared, the same as in scikit-learn, so they go the same way
+def test_matches_sklearn_at_split_thresholds():
+    generator = np.random.default_rng(1)
+    forest = fit_forest(*synthetic_rows(generator, 2000, missing = 0))
+
+    #every row sets all its features to the threshold of one split, moved by less than the gap between float32 values
+    splits = [(tree.feature[node], tree.threshold[node]) for tree in (estimator.tree_ for estimator in forest.estimators_) for node in np.flatnonzero(tree.children_left != -1)]
+    rows = []
+    for feature, threshold in splits[:500]:
+        for offset in (-1e-9, 0.0, 1e-9):
+            rows.append(np.full(NUM_FEATURES, threshold + offset))
+    rows = np.array(rows)
+
+    np.testing.assert_allclose(ArrayForest.from_sklearn(forest).predict_proba(rows), forest.predict_proba(rows), rtol = 0, atol = 1e-12)
+
+
+#inputs larger than a chunk give the same probabilities as scoring them in one chunk
+def test_chunks_match_single_chunk():
+    generator = np.random.default_rng(2)
+    forest = fit_forest(*synthetic_rows(generator, 1000))
+    rows, _ = synthetic_rows(generator, 1000)
+    array_forest = ArrayForest.from_sklearn(forest)
+
+    np.testing.assert_array_equal(array_forest.predict_proba(rows, chunk_size = 64), array_forest.predict_proba(rows, chunk_size = 4096))